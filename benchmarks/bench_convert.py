@@ -0,0 +1,43 @@
+"""串行与进程池并行格式转换的耗时对比
+
+用法: python benchmarks/bench_convert.py --devices 200 --commands 40 --echo-lines 200 --jobs 8
+"""
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from convnetlog_core import convert_devices, read_cmd_info
+from gen_collection import make_collection
+
+
+def timed_convert(devices, save_path, jobs):
+    os.makedirs(save_path)
+    start = time.perf_counter()
+    succeeded, failed, no_result, unchanged = convert_devices(devices, save_path, jobs, force=True)
+    return time.perf_counter() - start, succeeded, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=40)
+    parser.add_argument("--echo-lines", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        devices = read_cmd_info(make_collection(tmp, args.devices, args.commands, args.echo_lines, failed_ratio=0))
+        serial, ok, failed = timed_convert(devices, os.path.join(tmp, "serial"), 1)
+        print(f"serial:   {serial:8.2f}s  ({ok} ok, {failed} failed)")
+        parallel, ok, failed = timed_convert(devices, os.path.join(tmp, "parallel"), args.jobs)
+        print(f"parallel: {parallel:8.2f}s  ({ok} ok, {failed} failed, {args.jobs} jobs)")
+        print(f"speedup:  {serial / parallel:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""各处理阶段的无界面基准测试：耗时、峰值内存（RSS）与吞吐量（MB/s），结果输出为可对比的JSON
+
+阶段与界面中的操作对应：
+  parse_path                       遍历采集目录、读取cmd_info（不使用索引）
+  parse_path_indexed               同上，同时建立设备索引（索引文件事先删除）
+  get_device_commands              解析全部结果文件得到命令列表（ResultCache）
+  get_device_commands_indexed      扫描全部结果文件建立命令索引（echo位置与摘要）
+  get_device_commands_warm_index   从已建立的索引读取命令列表
+  display_command_result           按索引分块读取每台设备前若干条命令的输出（OutputStore）
+  convert                          ConvertWorker.run 的转换过程，单进程
+  convert_parallel                 同上，进程池并行
+
+每个阶段在单独的子进程中运行，峰值RSS互不影响；convert_parallel 的工作进程峰值单独记录。
+
+用法:
+  python benchmarks/bench_stages.py --devices 2000 --commands 40 --echo-lines 200 --output base.json
+  python benchmarks/bench_stages.py --devices 2000 --commands 40 --echo-lines 200 --compare base.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from convnetlog_core import (
+    INDEX_FILE_NAME, CollectionIndex, OutputStore, ResultCache, ResultResolver, convert_devices, discover_devices,
+    stream_echo_at
+)
+from gen_collection import add_arguments, make_collection
+
+# 结果JSON的格式版本，字段变化时递增
+REPORT_FORMAT = 1
+
+STAGES = ("parse_path", "parse_path_indexed", "get_device_commands", "get_device_commands_indexed",
+          "get_device_commands_warm_index", "display_command_result", "convert", "convert_parallel")
+
+MB = 1024 * 1024
+
+
+def peak_rss(children=False):
+    """当前进程（或已结束的子进程中）的峰值RSS字节数，无法获取时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None if children else _windows_peak_rss()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux上单位为KB，macOS上为字节
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _windows_peak_rss():
+    try:
+        import ctypes
+        from ctypes import wintypes
+    except ImportError:
+        return None
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+    try:
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        return None
+
+
+def _result_files(devices, resolver):
+    for device in devices:
+        yield from resolver.files_for(device)
+
+
+def _file_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def _cmd_info_bytes(devices):
+    return _file_bytes({device.path for device in devices})
+
+
+# 各阶段函数：返回 {"bytes": 处理的字节数, 其余为计数}
+
+def stage_parse_path(root, args):
+    devices = discover_devices(root, workers=args.scan_workers)
+    return {"bytes": _cmd_info_bytes(devices), "devices": len(devices)}
+
+
+def stage_parse_path_indexed(root, args):
+    index = CollectionIndex(root)
+    try:
+        devices = discover_devices(root, index, workers=args.scan_workers)
+    finally:
+        index.close()
+    return {"bytes": _cmd_info_bytes(devices), "devices": len(devices)}
+
+
+def stage_get_device_commands(root, args):
+    devices = discover_devices(root, workers=args.scan_workers)
+    resolver = ResultResolver()
+    cache = ResultCache()
+    files = commands = 0
+    nbytes = 0
+    for p in _result_files(devices, resolver):
+        commands += len(cache.get(p).by_command)
+        files += 1
+        nbytes += os.path.getsize(p)
+    return {"bytes": nbytes, "files": files, "commands": commands, "shared_echo_bodies": len(cache.echoes)}
+
+
+def _indexed_commands(root, args):
+    index = CollectionIndex(root)
+    try:
+        devices = discover_devices(root, index, workers=args.scan_workers)
+        resolver = ResultResolver()
+        files = commands = 0
+        nbytes = 0
+        for p in _result_files(devices, resolver):
+            commands += len(index.commands(p)[1])
+            files += 1
+            nbytes += os.path.getsize(p)
+    finally:
+        index.close()
+    return {"bytes": nbytes, "files": files, "commands": commands}
+
+
+def stage_get_device_commands_indexed(root, args):
+    return _indexed_commands(root, args)
+
+
+def stage_get_device_commands_warm_index(root, args):
+    return _indexed_commands(root, args)
+
+
+def stage_display_command_result(root, args):
+    index = CollectionIndex(root)
+    try:
+        devices = discover_devices(root, index, workers=args.scan_workers)
+        resolver = ResultResolver()
+        shown = 0
+        nbytes = 0
+        for p in _result_files(devices, resolver):
+            encoding, entries = index.commands(p)
+            for command, offset, length in entries[:args.display_commands]:
+                store = OutputStore()
+                store.write(f"命令: {command}\n执行结果:\n")
+                if offset is not None:
+                    stream_echo_at(p, offset, length, encoding, store.write, strip=True)
+                store.write("\n" + "-" * 50 + "\n")
+                store.finish()
+                store.read_chunk(0)   # 查看器首屏
+                nbytes += store.size
+                store.close()
+                shown += 1
+    finally:
+        index.close()
+    return {"bytes": nbytes, "outputs": shown}
+
+
+def _convert(root, args, jobs):
+    devices = list(discover_devices(root, workers=args.scan_workers))
+    save_path = tempfile.mkdtemp(prefix="convnetlog_bench_")
+    try:
+        ok, failed, no_result, unchanged = convert_devices(devices, save_path, jobs, force=True)
+        output_bytes = _file_bytes(p for p in pathlib.Path(save_path).iterdir() if p.suffix == ".log")
+    finally:
+        shutil.rmtree(save_path, ignore_errors=True)
+    nbytes = _file_bytes(_result_files(devices, ResultResolver()))
+    return {"bytes": nbytes, "output_bytes": output_bytes, "ok": ok, "failed": failed, "no_result": no_result,
+            "jobs": jobs}
+
+
+def stage_convert(root, args):
+    return _convert(root, args, 1)
+
+
+def stage_convert_parallel(root, args):
+    return _convert(root, args, args.jobs)
+
+
+def run_stage(name, root, args):
+    """在子进程中执行：返回阶段结果及耗时、峰值RSS"""
+    baseline = peak_rss()
+    start = time.perf_counter()
+    result = globals()[f"stage_{name}"](root, args)
+    result["seconds"] = time.perf_counter() - start
+    result["peak_rss"] = peak_rss()
+    result["baseline_rss"] = baseline
+    result["children_peak_rss"] = peak_rss(children=True)
+    return result
+
+
+def measure(name, root, args):
+    """重复执行阶段 repeat 次，取耗时最短的一次"""
+    best = None
+    context = multiprocessing.get_context("spawn")
+    for _ in range(args.repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_stage, name, root, args).result()
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    seconds = best["seconds"]
+    best["mb_per_s"] = round(best["bytes"] / MB / seconds, 2) if seconds > 0 else None
+    best["seconds"] = round(seconds, 4)
+    for key in ("peak_rss", "baseline_rss", "children_peak_rss"):
+        value = best.pop(key)
+        best[key + "_mb"] = round(value / MB, 1) if value else None
+    return best
+
+
+def compare(report, base):
+    """打印与基准结果的对比：耗时比（<1 为变快）与吞吐量比"""
+    if base.get("params") != report["params"]:
+        print("注意: 两次测试的参数不同", file=sys.stderr)
+    print(f"{'stage':32} {'base s':>9} {'new s':>9} {'time':>7} {'MB/s':>8} {'RSS MB':>8}")
+    for name, stage in report["stages"].items():
+        old = base.get("stages", {}).get(name)
+        if old is None:
+            continue
+        ratio = stage["seconds"] / old["seconds"] if old["seconds"] else float("nan")
+        throughput = (stage["mb_per_s"] / old["mb_per_s"]) if stage["mb_per_s"] and old["mb_per_s"] else float("nan")
+        rss = stage["peak_rss_mb"] if stage["peak_rss_mb"] is not None else float("nan")
+        print(f"{name:32} {old['seconds']:9.3f} {stage['seconds']:9.3f} {ratio:6.2f}x {throughput:7.2f}x {rss:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--root", help="使用已有的采集目录（不生成）")
+    parser.add_argument("--stages", default=",".join(STAGES), help="要执行的阶段，以逗号分隔")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="convert_parallel 的进程数")
+    parser.add_argument("--scan-workers", type=int, default=1, help="遍历目录的线程数")
+    parser.add_argument("--display-commands", type=int, default=5, help="每台设备显示的命令数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个阶段的重复次数，取最短耗时")
+    parser.add_argument("--output", help="结果JSON文件（默认输出到标准输出）")
+    parser.add_argument("--compare", metavar="BASE", help="与之前保存的结果JSON对比")
+    args = parser.parse_args()
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"未知的阶段: {', '.join(unknown)}")
+
+    tmp = None
+    if args.root:
+        root = os.path.abspath(args.root)
+        params = {"root": root}
+    else:
+        tmp = tempfile.mkdtemp(prefix="convnetlog_collection_")
+        root = tmp
+        start = time.perf_counter()
+        make_collection(root, args.devices, args.commands, args.echo_lines, args.snapshots, args.failed_ratio,
+                        args.seed)
+        print(f"生成采集目录: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        params = {"devices": args.devices, "commands": args.commands, "echo_lines": args.echo_lines,
+                  "snapshots": args.snapshots, "failed_ratio": args.failed_ratio, "seed": args.seed}
+    params.update(jobs=args.jobs, scan_workers=args.scan_workers, display_commands=args.display_commands)
+
+    try:
+        # 索引阶段从头建立
+        pathlib.Path(root, INDEX_FILE_NAME).unlink(missing_ok=True)
+        results = {}
+        for name in stages:
+            results[name] = measure(name, root, args)
+            stage = results[name]
+            print(f"{name:32} {stage['seconds']:9.3f}s {stage['mb_per_s'] or 0:9.2f} MB/s "
+                  f"{stage['peak_rss_mb'] or 0:8.1f} MB", file=sys.stderr)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "format": REPORT_FORMAT,
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "implementation": platform.python_implementation(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count()},
+        "params": params,
+        "stages": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""生成模拟的H3C采集目录，用于基准测试
+
+目录结构与真实采集结果相同：BrainCollect/result_<18位>/cmd_info_<14位>.xml 和
+cmdsResult/network/ssh_<ip>_<设备名>.xml。命令输出按常见的 display 命令格式生成，
+同型号设备的 display version 等输出完全相同；状态为失败的设备没有结果文件。
+
+用法: python benchmarks/gen_collection.py <目录> --devices 2000 --commands 40 --echo-lines 200 --snapshots 3
+"""
+import argparse
+import os
+import pathlib
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+MODELS = ("S5560X-54C-EI", "S6520X-30QC-EI", "S5130S-52S-PWR-EI")
+VERSIONS = ("7.1.070, Release 6616P01", "7.1.070, Release 6635", "7.1.070, Release 6715")
+
+# 模拟命令：(命令, 生成函数)，生成函数返回不含首尾提示符行的输出行
+def _version(rng, device, lines):
+    model = device["model"]
+    version = VERSIONS[MODELS.index(model)]
+    head = [f"H3C Comware Software, Version {version}",
+            "Copyright (c) 2004-2024 New H3C Technologies Co., Ltd. All rights reserved.",
+            f"H3C {model} uptime is 0 weeks, 0 days, 0 hours, 0 minutes"]
+    # 同型号设备输出相同，与行数参数无关
+    return head + [f"Slot {k + 1}: {model} with 2 Processors, BOARD TYPE: {model}, DRAM: 2048M bytes"
+                   for k in range(8)]
+
+
+def _clock(rng, device, lines):
+    return [device["clock"], "Time Zone : BJ add 08:00:00"]
+
+
+def _interface_brief(rng, device, lines):
+    rows = ["Brief information on interfaces in route mode:",
+            "Link: ADM - administratively down; Stby - standby",
+            "Interface            Link Protocol Primary IP      Description"]
+    for k in range(lines):
+        state = "UP" if rng.random() > 0.2 else "DOWN"
+        rows.append(f"GE1/0/{k + 1:<15}{state:<5}{state:<9}--              "
+                    f"to-{device['name']}-port{k}")
+    return rows
+
+
+def _arp(rng, device, lines):
+    rows = ["  Type: S-Static   D-Dynamic   O-Openflow   R-Rule   M-Multiport  I-Invalid",
+            "IP address      MAC address    VLAN/VSI name Interface                Aging Type"]
+    for k in range(lines):
+        rows.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255):<5}"
+                    f"{rng.randrange(1 << 48):012x}   {rng.randrange(1, 4094):<13} GE1/0/{rng.randrange(1, 48):<18}"
+                    f"{rng.randrange(1, 1200):<5} D")
+    return rows
+
+
+def _counters(rng, device, lines):
+    rows = ["Interface         Total(pkts)   Broadcast(pkts)   Multicast(pkts)  Err(pkts)"]
+    for k in range(lines):
+        errors = rng.randrange(100) if rng.random() < 0.05 else 0
+        rows.append(f"GE1/0/{k + 1:<11} {rng.randrange(10 ** 9):<13} {rng.randrange(10 ** 6):<17} "
+                    f"{rng.randrange(10 ** 6):<16} {errors}")
+    return rows
+
+
+def _generic(command):
+    def generate(rng, device, lines):
+        return [f"{command} line {k} on {device['name']} value {rng.randrange(10 ** 6)}" for k in range(lines)]
+    return generate
+
+
+BASE_COMMANDS = (
+    ("display version", _version),
+    ("display clock", _clock),
+    ("display interface brief", _interface_brief),
+    ("display arp", _arp),
+    ("display counters inbound interface", _counters),
+)
+
+
+def command_set(count):
+    """前几条为常见命令，其余为通用命令"""
+    commands = list(BASE_COMMANDS[:count])
+    for k in range(len(commands), count):
+        name = f"display diagnostic-information part {k}"
+        commands.append((name, _generic(name)))
+    return commands
+
+
+def write_result_file(path, device, commands, echo_lines, rng):
+    with open(path, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<result>\n')
+        prompt = f"<{device['name']}>"
+        for command, generate in commands:
+            lines = max(1, int(echo_lines * rng.uniform(0.5, 1.5)))
+            body = "\n".join(generate(rng, device, lines))
+            f.write(f"<cmd><command>{escape(command)}</command>"
+                    f"<echo>{escape(prompt + command)}\n{escape(body)}\n{escape(prompt)}</echo></cmd>\n")
+        f.write("</result>\n")
+
+
+def make_collection(root, devices=200, commands=40, echo_lines=200, snapshots=1, failed_ratio=0.05, seed=1):
+    """生成采集目录，返回最新一次采集的cmd_info文件路径"""
+    rng = random.Random(seed)
+    commands = command_set(commands)
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    cmd_info = None
+    for s in range(snapshots):
+        when = start + timedelta(days=s)
+        stamp = when.strftime("%Y%m%d%H%M%S")
+        result_dir = pathlib.Path(root).joinpath("BrainCollect", f"result_{stamp}{s:04d}")
+        network_dir = result_dir.joinpath("cmdsResult", "network")
+        network_dir.mkdir(parents=True, exist_ok=True)
+        cmd_info = result_dir.joinpath(f"cmd_info_{stamp}.xml")
+        records = []
+        for i in range(devices):
+            device = {
+                "name": f"SW{i}",
+                "ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+                "sn": f"SN{i:08d}",
+                "model": MODELS[i % len(MODELS)],
+                "clock": when.strftime("%H:%M:%S.000 BJ %a %m/%d/%Y"),
+                "state": "失败" if rng.random() < failed_ratio else "成功",
+            }
+            records.append(device)
+            if device["state"] == "成功":
+                write_result_file(network_dir.joinpath(f"ssh_{device['ip']}_{device['name']}.xml"),
+                                  device, commands, echo_lines, rng)
+        with open(cmd_info, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<root>\n')
+            for d in records:
+                f.write(f"<device><name>{d['name']}</name><ip>{d['ip']}</ip><sn>{d['sn']}</sn>"
+                        f"<state>{d['state']}</state></device>\n")
+            f.write("</root>\n")
+    return cmd_info
+
+
+def add_arguments(parser):
+    parser.add_argument("--devices", type=int, default=200, help="设备数")
+    parser.add_argument("--commands", type=int, default=40, help="每台设备的命令数")
+    parser.add_argument("--echo-lines", type=int, default=200, help="每条命令输出的平均行数")
+    parser.add_argument("--snapshots", type=int, default=1, help="采集次数（result_目录数）")
+    parser.add_argument("--failed-ratio", type=float, default=0.05, help="采集失败的设备比例")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="输出目录")
+    add_arguments(parser)
+    args = parser.parse_args()
+    os.makedirs(args.root, exist_ok=True)
+    cmd_info = make_collection(args.root, args.devices, args.commands, args.echo_lines, args.snapshots,
+                               args.failed_ratio, args.seed)
+    print(cmd_info)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,714 @@
+import os
 import sys
 import pathlib
-import re
-import xml.etree.ElementTree as et
+import sqlite3
+import threading
+import time
+import multiprocessing
 from datetime import datetime
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter,
-    QTableWidget, QTableWidgetItem, QTextEdit, QPushButton, QFileDialog, QLabel,
-    QFrame, QMessageBox, QHeaderView, QListWidget, QListWidgetItem
+    QTableView, QListView, QPlainTextEdit, QPushButton, QFileDialog, QLabel, QLineEdit,
+    QFrame, QMessageBox, QHeaderView, QCheckBox, QSpinBox, QAbstractItemView, QDockWidget, QComboBox,
+    QDialog, QTreeWidget, QTreeWidgetItem, QProgressBar
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QColor, QPalette
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QPalette
+
+from convnetlog_core import (
+    CANCEL_POLL_SECONDS, INDEX_FILE_NAME, PIVOT_DIR_NAME, CollectionIndex, ConversionCancelled, ConversionManifest,
+    DeviceRegistry, LoadCancelled, ResultCache, ResultResolver, convert_devices, estimate_remaining,
+    group_devices_by_output, iter_devices, write_device_log
+)
+from convnetlog_export import export_devices
+from convnetlog_fs import close_archives, is_archive
+from convnetlog_models import (
+    ColumnarTableModel, CommandListModel, DeviceFilterProxyModel, DeviceTableModel, SearchHitModel,
+    resize_columns_from_sample
+)
+from convnetlog_history import (
+    STATUS_CHANGED, STATUS_FIRST, STATUS_MISSING, STATUS_NO_COMMAND, STATUS_SAME, SnapshotHistory
+)
+from convnetlog_search import MODE_PHRASE, MODE_REGEX, MODE_TERM, SEARCH_FILE_NAME, SearchIndex
+from convnetlog_loader import KIND_COMMANDS, KIND_RESULT, ViewLoader
+from convnetlog_log import LOG_FILE, LogSink
+from convnetlog_parsers import Condition, TableCache, command_table, find_parser, parsers
+from convnetlog_profile import RunStats, profiled, save_report
+from convnetlog_viewer import LargeOutputView
+from convnetlog_watch import CollectionWatcher, LiveCollection
+
+# 后台遍历采集目录的线程数
+DISCOVERY_WORKERS = 8
+
+# 选中设备时预取命令列表的相邻设备数（上下各几台）、预取输出的前几条命令
+PREFETCH_NEIGHBOURS = 2
+PREFETCH_COMMANDS = 3
+
+def profile_file(name):
+    """cProfile结果文件的位置（与日志文件在同一目录）"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(os.path.dirname(LOG_FILE), f"profile_{name}_{stamp}.prof")
+
+class DiscoverWorker(QThread):
+    snapshots_found = pyqtSignal(list) # 采集目录中的全部采集（传入history时）
+    devices_found = pyqtSignal(list)   # 一批新登记的设备
+    log = pyqtSignal(str)              # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(bool)    # 遍历结束，参数为是否被中止
+
+    BATCH_SIZE = 500        # 每批最多设备数
+    BATCH_INTERVAL = 0.2    # 每批最长等待秒数
+
+    def __init__(self, dirname, registry, index=None, workers=DISCOVERY_WORKERS, stats=None, profile_path=None,
+                 snapshot=None, history=None, parent=None):
+        super().__init__(parent)
+        self.dirname = dirname
+        self.registry = registry
+        self.index = index
+        self.workers = workers
+        self.stats = stats
+        self.profile_path = profile_path  # 不为空时用cProfile统计，结果写入该文件
+        self.snapshot = snapshot          # 采集（result_目录名），None为最新的一次
+        self.history = history            # 不为空时先列出全部采集
+        self.updated_count = 0  # 被更优记录更新的已登记设备数
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        with profiled(self.profile_path):
+            self._discover()
+
+    def _discover(self):
+        batch = []
+        last_emit = time.monotonic()
+        try:
+            if self.history is not None:
+                self.snapshots_found.emit(self.history.snapshots())
+            for device, status in iter_devices(self.dirname, self.index, self.log.emit, self.workers,
+                                               lambda: self._stopped, self.registry, self.stats, self.snapshot):
+                if status == DeviceRegistry.UPDATED:
+                    self.updated_count += 1
+                    continue
+                batch.append(device)
+                now = time.monotonic()
+                if len(batch) >= self.BATCH_SIZE or now - last_emit >= self.BATCH_INTERVAL:
+                    self.devices_found.emit(batch)
+                    batch = []
+                    last_emit = now
+            if batch:
+                self.devices_found.emit(batch)
+        except Exception as e:
+            self.log.emit(f"解析路径时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(self._stopped)
 
 class ConvertWorker(QThread):
     log = pyqtSignal(str)       # 更新底部日志窗口的信息
+    # 已完成设备数, 待转换设备数, 已处理MB, 待处理MB, 预计剩余秒数（未知时为-1）
+    progress = pyqtSignal(int, int, float, float, float)
     finished_all = pyqtSignal() # 全部完成
 
-    def __init__(self, devices, save_path, parent=None):
+    def __init__(self, devices, save_path, cache=None, jobs=1, force=False, prune=False, compression=None,
+                 bundle=None, stats=None, profile_path=None, resume=False, pivot=None, parent=None):
         super().__init__(parent)
         self.devices = devices
         self.save_path = save_path
+        self.cache = cache
+        self.jobs = jobs
+        self.force = force
+        self.prune = prune
+        self.compression = compression
+        self.bundle = bundle
+        self.stats = stats
+        self.profile_path = profile_path  # 不为空时用cProfile统计（只包括本线程，不含子进程）
+        self.resume = resume
+        self.pivot = pivot                # 按命令汇总的目录（输出目录下），None为不汇总
         self._stopped = False
+        self._start = None
 
     def stop(self):
+        """请求取消，正在转换的设备在当前命令写完后中止"""
         self._stopped = True
 
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def on_progress(self, done, total, done_bytes, total_bytes):
+        remaining = estimate_remaining(time.perf_counter() - self._start, done_bytes, total_bytes)
+        self.progress.emit(done, total, done_bytes / 1048576, total_bytes / 1048576,
+                           remaining if remaining is not None else -1.0)
+
+    def on_result(self, result):
+        device, file_count, error, elapsed = result
+        if error is not None:
+            self.log.emit(f"转换文件格式时出错: {device.name}: {error}")
+        elif self.jobs > 1 and file_count:
+            self.log.emit(f"转换设备: {device.name}（{file_count} 个文件，{elapsed:.2f} 秒）")
+
+    def on_skipped(self, device):
+        if self.jobs > 1:
+            self.log.emit(f"跳过未变化的设备: {device.name}")
+
     def run(self):
+        with profiled(self.profile_path):
+            self._convert()
+
+    def _convert(self):
         try:
-            for device in self.devices:
-                if self._stopped:
-                    break
-                try:
-                    path = pathlib.Path(device["path"])
-                    cmds_result_path = path.parent.joinpath("cmdsResult", "network")
-                    if cmds_result_path.exists():
-                        for p in cmds_result_path.iterdir():
-                            if re.fullmatch(r"ssh_\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}_[-0-9a-zA-Z_]*\.xml", p.name):
-                                self.log.emit(f"转换文件: {p.name}")
-                                tree = et.parse(p)
-                                root = tree.getroot()
-                                # 构建父节点映射
-                                parent_map = {c: pa for pa in root.iter() for c in pa}
-                                file_name = pathlib.Path(self.save_path).joinpath(f"{device['name']}.log")
-                                with open(file_name, "w", encoding="utf-8") as f:
-                                    for cmd_elem in root.findall(".//command"):
-                                        if cmd_elem.text:
-                                            echo_text = ""
-                                            parent = parent_map.get(cmd_elem)
-                                            if parent is not None:
-                                                children = list(parent)
-                                                for idx, child in enumerate(children):
-                                                    if child == cmd_elem and idx + 1 < len(children):
-                                                        next_elem = children[idx + 1]
-                                                        if next_elem.tag == "echo":
-                                                            echo_text = next_elem.text.strip() if next_elem.text else ""
-                                                            echo_list = echo_text.split("\n")
-                                                            f.write(f"#\n<{device['name']}>{cmd_elem.text}\n")
-                                                            for line in echo_list[1:len(echo_list) - 1]:
-                                                                f.write(f"{line}\n")
-                except Exception as e:
-                    self.log.emit(f"转换文件格式时出错: {str(e)}")
+            start = self._start = time.perf_counter()
+            succeeded, failed, no_result, unchanged = convert_devices(
+                self.devices, self.save_path, self.jobs, self.cache, self.log.emit, self.on_result,
+                lambda: self._stopped, self.force, self.prune, self.on_skipped, self.compression, self.bundle,
+                self.stats, self.on_progress, self.resume, self.pivot, pivot_csv=self.pivot is not None)
+            if self._stopped:
+                self.log.emit(f"已取消转换，已完成 {succeeded + failed} 台设备，再次转换到同一目录时可继续")
+            self.log.emit(f"转换 {succeeded + failed} 台设备，失败 {failed} 台，未变化跳过 {unchanged} 台，"
+                          f"用时 {time.perf_counter() - start:.2f} 秒（{self.jobs} 个进程）")
+        except Exception as e:
+            self.log.emit(f"转换文件格式时出错: {str(e)}")
         finally:
             self.finished_all.emit()
 
+class ExportWorker(QThread):
+    log = pyqtSignal(str)       # 更新底部日志窗口的信息
+    finished_all = pyqtSignal() # 完成或已取消
+
+    PROGRESS_SECONDS = 2.0      # 显示进度的最小间隔
+
+    def __init__(self, devices, paths, stats=None, profile_path=None, parent=None):
+        super().__init__(parent)
+        self.devices = devices
+        self.paths = paths
+        self.stats = stats
+        self.profile_path = profile_path
+        self._stopped = False
+        self._done = 0
+        self._last_progress = 0.0
+
+    def stop(self):
+        """请求取消，当前结果文件处理完后中止，不保留未完成的输出"""
+        self._stopped = True
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def on_device(self, device, records):
+        self._done += 1
+        now = time.perf_counter()
+        if now - self._last_progress >= self.PROGRESS_SECONDS:
+            self._last_progress = now
+            self.log.emit(f"导出进度: {self._done}/{len(self.devices)} 台")
+
+    def run(self):
+        with profiled(self.profile_path):
+            self._export()
+
+    def _export(self):
+        try:
+            start = time.perf_counter()
+            records = export_devices(self.devices, self.paths, stopped=lambda: self._stopped, stats=self.stats,
+                                     on_device=self.on_device)
+            self.log.emit(f"导出 {len(self.devices)} 台设备的 {records} 条命令记录到 {', '.join(self.paths)}，"
+                          f"用时 {time.perf_counter() - start:.2f} 秒")
+        except ConversionCancelled:
+            self.log.emit("已取消导出，没有生成导出文件")
+        except Exception as e:
+            self.log.emit(f"导出时出错: {str(e)}")
+        finally:
+            self.finished_all.emit()
+
+class WatchWorker(QThread):
+    """监视仍在进行的采集：新写完的设备登记到监视线程自己的登记表，记录的副本通过信号交给界面
+
+    有输出目录时在另一个线程中增量转换有变化的设备，转换期间继续检查。
+    """
+    devices_found = pyqtSignal(list)    # 新登记的设备（副本）
+    devices_updated = pyqtSignal(list)  # 状态被更新的设备（更新后的副本）
+    results_changed = pyqtSignal(list)  # 结果文件有变化的设备（副本）
+    snapshot_changed = pyqtSignal()     # 出现了更新的一次采集（跟踪最新一次时），监视随即结束
+    log = pyqtSignal(str)               # 更新底部日志窗口的信息
+    finished_all = pyqtSignal()
+
+    def __init__(self, root, devices, snapshot=None, index=None, save_path=None, compression=None, jobs=1,
+                 busy=None, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.registry = DeviceRegistry(devices)     # devices 为界面中已显示设备的副本
+        self.snapshot = snapshot
+        self.index = index
+        self.save_path = save_path      # 不为空时把有变化的设备增量转换到该目录
+        self.compression = compression
+        self.jobs = jobs
+        self.busy = busy                # 返回是否有手动转换在进行，进行中时推迟增量转换
+        self._to_convert = {}           # 设备键 -> 尚未转换的设备（副本）
+        self._convert_lock = threading.Lock()
+        self._convert_queued = threading.Event()
+        self._rounds = 0
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+        self._convert_queued.set()
+
+    def run(self):
+        watcher = None
+        converter = None
+        try:
+            if self.save_path is not None:
+                converter = threading.Thread(target=self.convert_loop, name="watch-convert", daemon=True)
+                converter.start()
+            watcher = CollectionWatcher(self.root, self.snapshot, log=self.log.emit)
+            live = LiveCollection(self.registry, self.index, self.log.emit)
+            self.log.emit(f"开始监视采集目录（{'inotify' if watcher.uses_inotify else '轮询'}）")
+            watcher.run(lambda changes: self.on_changes(live, changes), lambda: self._stopped)
+        except Exception as e:
+            self.log.emit(f"监视采集目录时出错: {str(e)}")
+        finally:
+            if watcher is not None:
+                watcher.close()
+            if converter is not None:
+                self.stop()
+                converter.join()
+            self.finished_all.emit()
+
+    def on_changes(self, live, changes):
+        if changes.snapshot_changed:
+            # 界面的设备登记表属于原来的采集，由界面重新解析
+            self._stopped = True
+            self.snapshot_changed.emit()
+            return
+        update = live.apply(changes)
+        self._rounds += 1
+        # 登记表中的记录只在监视线程中读写，交给界面和转换线程的都是副本
+        if update.added:
+            self.devices_found.emit([device.copy() for device in update.added])
+        if update.updated:
+            self.devices_updated.emit([device.copy() for device in update.updated])
+        # 首次检查交出的是已有的全部文件，界面已经显示过
+        if update.results and self._rounds > 1:
+            self.results_changed.emit([device.copy() for device in update.results])
+        if update.added or update.results:
+            self.log.emit(f"监视: 新设备 {len(update.added)} 台，结果有变化 {len(update.results)} 台")
+        if self.save_path is None or not update.devices:
+            return
+        with self._convert_lock:
+            for device in update.devices:
+                self._to_convert[device.key] = device.copy()
+        self._convert_queued.set()
+
+    def convert_loop(self):
+        """增量转换线程：取出排队的设备批量转换；有手动转换在进行时等它结束"""
+        while not self._stopped:
+            self._convert_queued.wait(CANCEL_POLL_SECONDS)
+            self._convert_queued.clear()
+            if self._stopped or (self.busy is not None and self.busy()):
+                continue
+            with self._convert_lock:
+                devices, self._to_convert = list(self._to_convert.values()), {}
+            if not devices:
+                continue
+            try:
+                succeeded, failed, no_result, unchanged = convert_devices(
+                    devices, self.save_path, self.jobs, log=self.log.emit, stopped=lambda: self._stopped,
+                    compression=self.compression)
+            except Exception as e:
+                self.log.emit(f"监视: 增量转换时出错: {str(e)}")
+                continue
+            if succeeded or failed:
+                self.log.emit(f"监视: 增量转换 {succeeded + failed} 台设备，失败 {failed} 台")
+
+class SearchIndexWorker(QThread):
+    progress = pyqtSignal(int, int)    # 已处理设备数, 设备总数
+    log = pyqtSignal(str)              # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(int)     # 完成，参数为本次新索引的文件数
+
+    def __init__(self, search_index, devices, resolver, collection_index, parent=None):
+        super().__init__(parent)
+        self.search_index = search_index
+        self.devices = devices
+        self.resolver = resolver
+        self.collection_index = collection_index
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        indexed = 0
+        try:
+            indexed = self.search_index.update(self.devices, self.resolver, self.collection_index,
+                                               lambda: self._stopped, self.progress.emit)
+        except Exception as e:
+            self.log.emit(f"建立全文索引时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(indexed)
+
+class SearchWorker(QThread):
+    log = pyqtSignal(str)                       # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(object, float)    # 命中的行（出错或中止时为None）, 耗时秒数
+
+    def __init__(self, search_index, query, mode, parent=None):
+        super().__init__(parent)
+        self.search_index = search_index
+        self.query = query
+        self.mode = mode
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        hits = None
+        start = time.perf_counter()
+        try:
+            hits = self.search_index.search(self.query, self.mode, stopped=lambda: self._stopped)
+            if self._stopped:
+                hits = None
+        except Exception as e:
+            self.log.emit(f"搜索时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(hits, time.perf_counter() - start)
+
+class GroupWorker(QThread):
+    log = pyqtSignal(str)              # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(list)    # 分组结果（设备列表的列表）
+
+    def __init__(self, devices, resolver, command, index=None, cache=None, parent=None):
+        super().__init__(parent)
+        self.devices = devices
+        self.resolver = resolver
+        self.command = command
+        self.index = index
+        self.cache = cache
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        groups = []
+        try:
+            groups = group_devices_by_output(self.devices, self.resolver, self.command, self.index, self.cache,
+                                             lambda: self._stopped)
+        except Exception as e:
+            self.log.emit(f"按输出分组时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(groups)
+
+class OutputGroupsDialog(QDialog):
+    """某条命令在各设备上的输出分组：输出完全相同的设备为一组，双击设备查看其输出"""
+    device_activated = pyqtSignal(object, str)   # 设备记录, 命令
+
+    def __init__(self, command, groups, parent=None):
+        super().__init__(parent)
+        self.command = command
+        self.setWindowTitle(f"相同输出分组 - {command}")
+        self.resize(600, 500)
+        layout = QVBoxLayout(self)
+        total = sum(len(group) for group in groups)
+        layout.addWidget(QLabel(f"{total} 台设备执行了该命令，共 {len(groups)} 种不同的输出"))
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["设备名称", "IP地址", "SN号"])
+        self.tree.setUniformRowHeights(True)
+        for n, group in enumerate(groups, 1):
+            item = QTreeWidgetItem([f"第 {n} 组（{len(group)} 台设备）"])
+            for device in group:
+                child = QTreeWidgetItem([device.name, device.ip, device.sn])
+                child.setData(0, Qt.UserRole, device)
+                item.addChild(child)
+            self.tree.addTopLevelItem(item)
+            item.setFirstColumnSpanned(True)
+        if groups and len(groups[0]) > 1:
+            self.tree.topLevelItem(0).setExpanded(True)
+        self.tree.itemDoubleClicked.connect(self.on_item_double_clicked)
+        layout.addWidget(self.tree)
+
+    def on_item_double_clicked(self, item, column):
+        device = item.data(0, Qt.UserRole)
+        if device is None and item.childCount():
+            # 分组行：显示该组第一台设备的输出
+            device = item.child(0).data(0, Qt.UserRole)
+        if device is not None:
+            self.device_activated.emit(device, self.command)
+
+class CommandTableWorker(QThread):
+    log = pyqtSignal(str)               # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(object)   # 合并后的ColumnarTable（出错或取消时为None）
+
+    def __init__(self, devices, resolver, command, index=None, cache=None, tables=None, stats=None, parent=None):
+        super().__init__(parent)
+        self.devices = devices
+        self.resolver = resolver
+        self.command = command
+        self.index = index
+        self.cache = cache
+        self.tables = tables
+        self.stats = stats
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        table = None
+        try:
+            table = command_table(self.devices, self.command, self.resolver, self.index, self.cache, self.tables,
+                                  lambda: self._stopped, self.stats)
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self.log.emit(f"解析命令表格时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(table)
+
+class CommandTableDialog(QDialog):
+    """所有设备某条命令输出解析成的表格：可按条件筛选、点击表头排序，双击行查看该设备的输出"""
+    device_activated = pyqtSignal(str, str, str)   # 设备名, IP, 命令
+
+    def __init__(self, command, table, parent=None):
+        super().__init__(parent)
+        self.command = command
+        self.table = table
+        self.setWindowTitle(f"命令表格 - {command}")
+        self.resize(900, 600)
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("筛选:"))
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("多个条件用 ; 分隔，如 errors>0; interface~GE1/0（运算符 > >= < <= = != ~）")
+        self.filter_input.returnPressed.connect(self.apply_filter)
+        filter_layout.addWidget(self.filter_input)
+        filter_btn = QPushButton("筛选")
+        filter_btn.clicked.connect(self.apply_filter)
+        filter_layout.addWidget(filter_btn)
+        layout.addLayout(filter_layout)
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        self.model = ColumnarTableModel(self)
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.verticalHeader().setVisible(False)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        self.view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)   # 初始按设备顺序
+        self.view.setSortingEnabled(True)
+        self.view.doubleClicked.connect(self.on_row_double_clicked)
+        layout.addWidget(self.view)
+        self.model.set_table(table)
+        resize_columns_from_sample(self.view)
+        self.update_count(len(table))
+
+    def apply_filter(self):
+        """按条件重新筛选全部行，保留当前的排序列"""
+        try:
+            conditions = [Condition.parse(text, self.table)
+                          for text in self.filter_input.text().split(";") if text.strip()]
+        except ValueError as e:
+            self.count_label.setText(str(e))
+            return
+        rows = self.table.select(conditions)
+        self.model.set_table(self.table, rows)
+        header = self.view.horizontalHeader()
+        self.model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+        self.update_count(len(rows))
+
+    def update_count(self, shown):
+        devices = len(self.table.column("device").values) - 1
+        self.count_label.setText(f"显示 {shown} / {len(self.table)} 行（共 {devices} 台设备）")
+
+    def on_row_double_clicked(self, index):
+        name, ip = self.model.row_values(index.row())[:2]
+        self.device_activated.emit(name, ip, self.command)
+
+class HistoryWorker(QThread):
+    log = pyqtSignal(str)                    # 更新底部日志窗口的信息
+    finished_all = pyqtSignal(object, object) # 各次采集的情况（未计算时为None）, 两次采集的差异
+
+    def __init__(self, history, device, command, old, new, with_timeline=False, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.device = device
+        self.command = command
+        self.old = old
+        self.new = new
+        self.with_timeline = with_timeline
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        timeline = None
+        diff = None
+        try:
+            if self.with_timeline:
+                timeline = self.history.timeline(self.device, self.command, lambda: self._stopped)
+            if not self._stopped and self.old and self.new:
+                diff = self.history.diff(self.device, self.command, self.old, self.new)
+        except Exception as e:
+            self.log.emit(f"比较历史输出时出错: {str(e)}")
+        finally:
+            self.finished_all.emit(timeline, diff)
+
+# 各次采集中命令输出情况的显示文字
+HISTORY_STATUS_TEXT = {
+    STATUS_MISSING: "无此设备",
+    STATUS_NO_COMMAND: "未执行",
+    STATUS_SAME: "未变化",
+    STATUS_CHANGED: "有变化",
+    STATUS_FIRST: "首次执行",
+}
+
+class SnapshotDiffDialog(QDialog):
+    """某台设备的一条命令在各次采集中的输出变化，及任意两次采集间的逐行差异"""
+    log = pyqtSignal(str)
+
+    def __init__(self, history, device, command, current=None, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.device = device
+        self.command = command
+        self._thread = None
+        self.setWindowTitle(f"历史对比 - {device.name} - {command}")
+        self.resize(800, 650)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"设备: {device.name}（{device.ip}，{device.sn}）    命令: {command}"))
+
+        self.timeline_tree = QTreeWidget()
+        self.timeline_tree.setHeaderLabels(["采集时间", "采集目录", "输出"])
+        self.timeline_tree.setRootIsDecorated(False)
+        self.timeline_tree.setUniformRowHeights(True)
+        self.timeline_tree.setToolTip("双击某次采集，与它的前一次采集比较")
+        self.timeline_tree.itemDoubleClicked.connect(self.on_timeline_double_clicked)
+        layout.addWidget(self.timeline_tree, 1)
+
+        compare_layout = QHBoxLayout()
+        self.old_combo = QComboBox()
+        self.new_combo = QComboBox()
+        snapshots = history.snapshots()
+        for snapshot in snapshots:
+            self.old_combo.addItem(f"{snapshot.label}（{snapshot.name}）", snapshot.name)
+            self.new_combo.addItem(f"{snapshot.label}（{snapshot.name}）", snapshot.name)
+        new_row = max(self.new_combo.findData(current), 0) if current else 0
+        self.new_combo.setCurrentIndex(new_row)
+        self.old_combo.setCurrentIndex(min(new_row + 1, len(snapshots) - 1))
+        self.compare_btn = QPushButton("比较")
+        self.compare_btn.clicked.connect(self.compare)
+        compare_layout.addWidget(QLabel("较早:"))
+        compare_layout.addWidget(self.old_combo, 1)
+        compare_layout.addWidget(QLabel("较新:"))
+        compare_layout.addWidget(self.new_combo, 1)
+        compare_layout.addWidget(self.compare_btn)
+        layout.addLayout(compare_layout)
+
+        self.diff_status_label = QLabel()
+        layout.addWidget(self.diff_status_label)
+        self.diff_text = QPlainTextEdit()
+        self.diff_text.setReadOnly(True)
+        self.diff_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.diff_text.setFont(QFont("Consolas", 10))
+        layout.addWidget(self.diff_text, 2)
+
+        self.start(with_timeline=True)
+
+    def start(self, with_timeline=False):
+        self.stop()
+        self.compare_btn.setEnabled(False)
+        self.diff_status_label.setText("正在比较...")
+        self._thread = HistoryWorker(self.history, self.device, self.command, self.old_combo.currentData(),
+                                     self.new_combo.currentData(), with_timeline)
+        self._thread.log.connect(self.log)
+        self._thread.finished_all.connect(self.on_finished)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._thread = None
+
+    def compare(self):
+        self.start()
+
+    def on_finished(self, timeline, diff):
+        if self.sender() is not self._thread:
+            return
+        self._thread = None
+        self.compare_btn.setEnabled(True)
+        if timeline is not None:
+            self.timeline_tree.clear()
+            for entry in timeline:
+                item = QTreeWidgetItem([entry.snapshot.label, entry.snapshot.name, HISTORY_STATUS_TEXT[entry.status]])
+                item.setData(0, Qt.UserRole, entry.snapshot.name)
+                self.timeline_tree.addTopLevelItem(item)
+            for column in range(3):
+                self.timeline_tree.resizeColumnToContents(column)
+        if diff is None:
+            self.diff_status_label.clear()
+            self.diff_text.clear()
+        elif not diff.changed:
+            self.diff_status_label.setText(f"{diff.old} 与 {diff.new} 的输出相同")
+            self.diff_text.clear()
+        else:
+            self.diff_status_label.setText(f"{diff.old} → {diff.new}：增加 {diff.added} 行，删除 {diff.removed} 行")
+            self.diff_text.setPlainText("\n".join(diff.lines))
+
+    def on_timeline_double_clicked(self, item, column):
+        row = self.new_combo.findData(item.data(0, Qt.UserRole))
+        if row < 0:
+            return
+        self.new_combo.setCurrentIndex(row)
+        self.old_combo.setCurrentIndex(min(row + 1, self.old_combo.count() - 1))
+        self.compare()
+
+    def done(self, result):
+        self.stop()
+        super().done(result)
+
 class NetLogHiveGUI(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.device_list = []
+        self.device_list = DeviceRegistry()
         self.current_device = None
         self.current_device_commands = {}
         self.save_log_path = ""
+        self.resolver = ResultResolver()
+        self.result_cache = ResultCache()
+        self.table_cache = TableCache()   # 命令表格的解析结果，按输出内容的摘要缓存
+        self.collection_index = None
+        self.search_index = None
+        self.history = None
+        self.current_snapshot = None   # 正在查看的采集（result_目录名），None为最新的一次
+        self._reselect = None          # 切换采集后重新选中的 (设备键, 命令)
+        # 最近一次目录解析、查看、转换的性能统计
+        self.discover_stats = None
+        self.view_stats = RunStats("view")
+        self.convert_stats = None
+        self.export_stats = None
+        # 命令列表和命令输出在后台加载，界面线程只接收结果
+        self.loader = ViewLoader(self.resolver, None, self.result_cache, self.view_stats, self)
+        self.loader.commands_loaded.connect(self.on_commands_loaded)
+        self.loader.result_loaded.connect(self.on_result_loaded)
+        self.loader.failed.connect(self.on_load_failed)
+        self._pending_command = None   # 命令列表加载后要选中的 (命令, 查找的文字)
+        self._pending_find = None      # 命令输出加载后要查找的文字
+        self._selecting = False        # 程序设置选中项时不触发加载
+        self._throughput_marks = {}
         self.init_ui()
         self._centered = False
         self._convert_thread = None
+        self._export_thread = None
+        self._watch_thread = None
+        self._discover_thread = None
+        self._search_index_thread = None
+        self._search_thread = None
+        self._group_thread = None
+        self._table_thread = None
         
     def init_ui(self):
         self.setWindowTitle("H3C标杆神器网络日志查看转换工具")
@@ -103,6 +740,12 @@ class NetLogHiveGUI(QMainWindow):
         # 底部日志窗口
         self.create_log_window(main_layout)
         
+        # 全文搜索停靠窗口
+        self.create_search_dock()
+        
+        # 底部状态栏：实时吞吐量与性能报告
+        self.create_status_bar()
+        
         # 设置分割器的初始大小比例
         self.content_splitter.setSizes([400, 300, 700])
         
@@ -146,16 +789,91 @@ class NetLogHiveGUI(QMainWindow):
         self.select_h3clog_path_btn = QPushButton("选择路径")
         self.select_h3clog_path_btn.clicked.connect(self.select_h3clog_path)
         
+        self.select_h3clog_archive_btn = QPushButton("打开压缩包")
+        self.select_h3clog_archive_btn.setToolTip("直接读取 .zip/.tar.gz/.tar.xz 压缩包中的采集结果，无需先解压")
+        self.select_h3clog_archive_btn.clicked.connect(self.select_h3clog_archive)
+        
+        self.stop_discovery_btn = QPushButton("停止解析")
+        self.stop_discovery_btn.clicked.connect(self.stop_discovery)
+        self.stop_discovery_btn.setEnabled(False)
+        
+        # 采集选择：BrainCollect下的每个result_目录为一次采集
+        snapshot_label = QLabel("采集:")
+        self.snapshot_combo = QComboBox()
+        self.snapshot_combo.setToolTip("选择查看哪一次采集，默认为最新的一次；其他采集在选择时才解析")
+        self.snapshot_combo.setEnabled(False)
+        self.snapshot_combo.activated.connect(self.on_snapshot_selected)
+        
+        # 索引开关
+        self.use_index_checkbox = QCheckBox("使用索引")
+        self.use_index_checkbox.setChecked(False)   # 采集目录可能只读或共享，默认不写入
+        self.use_index_checkbox.setToolTip(f"在采集目录下保存索引文件 {INDEX_FILE_NAME}，再次打开时无需重新解析")
+        
+        # 监视仍在进行的采集
+        self.watch_checkbox = QCheckBox("监视采集")
+        self.watch_checkbox.setToolTip("采集仍在进行时，设备完成后即加入列表；已选择过转换输出目录时同时增量转换有变化的设备"
+                                       "（不支持压缩包）")
+        self.watch_checkbox.toggled.connect(self.on_watch_toggled)
+        
+        # 并行转换进程数
+        jobs_label = QLabel("并行进程数:")
+        self.jobs_spinbox = QSpinBox()
+        self.jobs_spinbox.setRange(1, max(os.cpu_count() or 1, 1) * 2)
+        self.jobs_spinbox.setValue(os.cpu_count() or 1)
+        
+        # 增量转换选项
+        self.force_convert_checkbox = QCheckBox("全部重新转换")
+        self.force_convert_checkbox.setToolTip("忽略输出目录中的转换清单，重新生成所有设备的日志文件")
+        self.prune_outputs_checkbox = QCheckBox("删除多余输出")
+        self.prune_outputs_checkbox.setToolTip("删除以前转换生成、但已不在设备列表中的日志文件")
+        self.pivot_checkbox = QCheckBox("按命令汇总")
+        self.pivot_checkbox.setToolTip(f"同时在输出目录的 {PIVOT_DIR_NAME} 子目录中为每条命令生成一个文件（含所有设备的该命令输出）"
+                                       f"和设备索引CSV；与设备日志在同一次解析中写出，启用时不跳过未变化的设备")
+        
+        # 输出格式：每台设备一个文件（可压缩），或全部写入一个包
+        self.output_format_combo = QComboBox()
+        self.output_format_combo.addItem("文本 .log", (None, None))
+        self.output_format_combo.addItem("gzip .log.gz", ("gz", None))
+        self.output_format_combo.addItem("xz .log.xz", ("xz", None))
+        self.output_format_combo.addItem("单个 zip 包", (None, "convnetlog_logs.zip"))
+        self.output_format_combo.addItem("单个 tar.gz 包", (None, "convnetlog_logs.tar.gz"))
+        self.output_format_combo.setToolTip("压缩格式可用 zcat/xzcat 直接读取；日志包写入所选目录")
+        
         # 格式转换按钮
         self.convert_format_btn = QPushButton("格式转换")
         self.convert_format_btn.clicked.connect(self.convert_format)
         self.convert_format_btn.setEnabled(False)
         
+        self.cancel_convert_btn = QPushButton("取消转换")
+        self.cancel_convert_btn.setToolTip("正在转换的设备在当前命令写完后中止；已完成的设备记录在转换清单中，可继续转换")
+        self.cancel_convert_btn.clicked.connect(self.cancel_convert)
+        self.cancel_convert_btn.setEnabled(False)
+        
+        # 结构化导出（JSONL/SQLite），运行中再次点击为取消
+        self.export_btn = QPushButton("结构化导出")
+        self.export_btn.setToolTip("把当前采集所有设备的命令输出逐条导出为JSONL或SQLite数据库，供分析程序直接查询")
+        self.export_btn.clicked.connect(self.export_records)
+        self.export_btn.setEnabled(False)
+        
         toolbar_layout.addWidget(path_label)
         toolbar_layout.addWidget(self.path_display)
         toolbar_layout.addWidget(self.select_h3clog_path_btn)
+        toolbar_layout.addWidget(self.select_h3clog_archive_btn)
+        toolbar_layout.addWidget(self.stop_discovery_btn)
+        toolbar_layout.addWidget(snapshot_label)
+        toolbar_layout.addWidget(self.snapshot_combo)
+        toolbar_layout.addWidget(self.use_index_checkbox)
+        toolbar_layout.addWidget(self.watch_checkbox)
         toolbar_layout.addStretch()
+        toolbar_layout.addWidget(jobs_label)
+        toolbar_layout.addWidget(self.jobs_spinbox)
+        toolbar_layout.addWidget(self.output_format_combo)
+        toolbar_layout.addWidget(self.force_convert_checkbox)
+        toolbar_layout.addWidget(self.prune_outputs_checkbox)
+        toolbar_layout.addWidget(self.pivot_checkbox)
         toolbar_layout.addWidget(self.convert_format_btn)
+        toolbar_layout.addWidget(self.cancel_convert_btn)
+        toolbar_layout.addWidget(self.export_btn)
         
         main_layout.addLayout(toolbar_layout)
         
@@ -169,33 +887,44 @@ class NetLogHiveGUI(QMainWindow):
         device_title.setFont(QFont("Arial", 11, QFont.Bold))
         device_layout.addWidget(device_title)
         
-        # 使用QTableWidget替代QListWidget
-        self.device_table = QTableWidget()
-        self.device_table.setColumnCount(4)
-        self.device_table.setHorizontalHeaderLabels(["设备名称", "IP地址", "SN号", "状态"])
+        # 设备筛选
+        self.device_filter_edit = QLineEdit()
+        self.device_filter_edit.setPlaceholderText("筛选设备名称/IP/SN/状态")
+        self.device_filter_edit.setClearButtonEnabled(True)
+        device_layout.addWidget(self.device_filter_edit)
+        
+        # 设备数据模型，经筛选代理后显示
+        self.device_model = DeviceTableModel(self)
+        self.device_proxy = DeviceFilterProxyModel(self)
+        self.device_proxy.setSourceModel(self.device_model)
+        self.device_filter_edit.textChanged.connect(self.device_proxy.set_filter_text)
+        
+        self.device_table = QTableView()
+        self.device_table.setModel(self.device_proxy)
         
         # 设置表格属性
-        self.device_table.setSelectionBehavior(QTableWidget.SelectRows)  # 整行选择
+        self.device_table.setSelectionBehavior(QAbstractItemView.SelectRows)  # 整行选择
+        self.device_table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.device_table.setAlternatingRowColors(True)  # 交替行颜色
+        self.device_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.device_table.verticalHeader().setDefaultSectionSize(self.device_table.fontMetrics().height() + 8)
         self.device_table.setSortingEnabled(True)  # 启用排序
+        self.device_table.sortByColumn(-1, Qt.AscendingOrder)  # 初始保持发现顺序
         
         # 让失焦后仍保持高亮
         self._keep_selection_visible(self.device_table)
         
-        # 设置列宽
+        # 设置列宽：按样本行估算，不逐行测量
         header = self.device_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)  # 设备名称列自适应内容宽度
-        header.setSectionResizeMode(1, QHeaderView.ResizeToContents)  # IP地址列自适应内容
-        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)  # SN号列自适应内容
-        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)  # 状态列自适应内容
+        header.setSectionResizeMode(QHeaderView.Interactive)
         
         # 启用列宽调整
         header.setStretchLastSection(False)  # 禁用最后一列自动拉伸
         header.setSectionsMovable(False)     # 禁用列移动
         header.setSectionsClickable(True)    # 启用列头点击排序
         
-        # 连接信号
-        self.device_table.itemClicked.connect(self.on_device_selected)
+        # 连接信号：鼠标点击和键盘移动都会改变当前行
+        self.device_table.selectionModel().currentRowChanged.connect(self.on_device_selected)
         
         device_layout.addWidget(self.device_table)
         
@@ -212,12 +941,35 @@ class NetLogHiveGUI(QMainWindow):
         command_title.setFont(QFont("Arial", 11, QFont.Bold))
         command_layout.addWidget(command_title)
         
-        self.command_list_widget = QListWidget()
+        self.command_model = CommandListModel(self)
+        self.command_list_widget = QListView()
+        self.command_list_widget.setModel(self.command_model)
+        self.command_list_widget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.command_list_widget.setUniformItemSizes(True)
         # 让失焦后仍保持高亮
         self._keep_selection_visible(self.command_list_widget)
-        self.command_list_widget.itemClicked.connect(self.on_command_selected)
+        self.command_list_widget.selectionModel().currentRowChanged.connect(self.on_command_selected)
         command_layout.addWidget(self.command_list_widget)
         
+        # 按输出内容对所有设备分组
+        self.group_by_output_btn = QPushButton("相同输出分组")
+        self.group_by_output_btn.setToolTip("按当前命令的输出对所有设备分组，输出完全相同的设备为一组")
+        self.group_by_output_btn.clicked.connect(self.group_by_output)
+        command_layout.addWidget(self.group_by_output_btn)
+        
+        # 与其他采集比较
+        self.history_btn = QPushButton("历史对比")
+        self.history_btn.setToolTip("查看当前设备的该命令在各次采集中是否有变化，并逐行比较任意两次采集的输出")
+        self.history_btn.clicked.connect(self.show_command_history)
+        command_layout.addWidget(self.history_btn)
+        
+        # 把所有设备该命令的输出解析为表格
+        self.command_table_btn = QPushButton("命令表格")
+        self.command_table_btn.setToolTip("把所有设备当前命令的输出解析为一张表格，可筛选、排序。支持的命令: "
+                                          + "、".join(parser.command for parser in parsers()))
+        self.command_table_btn.clicked.connect(self.show_command_table)
+        command_layout.addWidget(self.command_table_btn)
+        
         # 添加到分割器
         content_layout.addWidget(command_frame)
         
@@ -231,8 +983,8 @@ class NetLogHiveGUI(QMainWindow):
         result_title.setFont(QFont("Arial", 11, QFont.Bold))
         result_layout.addWidget(result_title)
         
-        self.result_text = QTextEdit()
-        self.result_text.setReadOnly(True)
+        # 大体积输出按需分块加载
+        self.result_text = LargeOutputView()
         result_layout.addWidget(self.result_text)
         
         # 添加到分割器
@@ -248,287 +1000,705 @@ class NetLogHiveGUI(QMainWindow):
         log_title.setFont(QFont("Arial", 11, QFont.Bold))
         log_layout.addWidget(log_title)
         
-        self.log_text = QTextEdit()
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
         self.log_text.setMaximumHeight(150)
         log_layout.addWidget(self.log_text)
         
+        # 消息批量刷新到窗口，窗口只保留最近的记录，完整记录写入日志文件
+        self.log_sink = LogSink(self.log_text, parent=self)
+        
         main_layout.addWidget(log_frame)
         
-    def parse_path(self, dirname):
-        """解析路径获取设备列表"""
-        path = pathlib.Path(dirname)
-        for p in path.iterdir():
-            if p.is_dir():
-                if re.fullmatch(r"BrainCollect", p.name):
-                    # 获取所有子目录及其日期时间
-                    subdirs = [d for d in p.iterdir() if d.is_dir() and re.fullmatch(r"result_\d{18}", d.name)]
-                    latest_dir = None
-                    latest_dt = None
-                    for d in subdirs:
-                        dt_str = d.name[7:20]  # 第8到20个字符（索引7到19）
-                        try:
-                            dt = datetime.strptime(dt_str, "%Y%m%d%H%M%S")
-                            if latest_dt is None or dt > latest_dt:
-                                latest_dt = dt
-                                latest_dir = d
-                        except Exception as e:
-                            continue
-                    if latest_dir:
-                        # 只遍历最新子目录
-                        self.parse_path(str(latest_dir))
-                    continue  # 不再递归BrainCollect本身
-                else:
-                    self.parse_path(p)
-            else:
-                # 匹配cmd_info_*.xml文件
-                if re.fullmatch(r"cmd_info_\d{14}\.xml", p.name):
-                    try:
-                        tree = et.parse(p)
-                        root = tree.getroot()
-                        for device in root.findall("device"):
-                            name_elem = device.find("name")
-                            ip_elem = device.find("ip")
-                            sn_elem = device.find("sn")
-                            state_elem = device.find("state")
-                            
-                            # 检查元素是否存在且不为None
-                            if (name_elem is not None and name_elem.text and
-                                ip_elem is not None and ip_elem.text and
-                                sn_elem is not None and sn_elem.text and
-                                state_elem is not None and state_elem.text):
-                                
-                                # 保存唯一设备信息
-                                device_info = {}
-                                device_info["name"] = name_elem.text.strip()
-                                device_info["ip"] = ip_elem.text.strip()
-                                device_info["sn"] = sn_elem.text.strip()
-                                device_info["state"] = state_elem.text.strip()
-                                device_info["path"] = str(p.resolve())
-                                
-                                # 检查是否已存在相同设备（避免重复）
-                                existing_device = None
-                                for existing in self.device_list:
-                                    if (existing["name"] == device_info["name"] and 
-                                        existing["ip"] == device_info["ip"] and 
-                                        existing["sn"] == device_info["sn"]):
-                                        existing_device = existing
-                                        break
-                                
-                                if existing_device is None:
-                                    self.device_list.append(device_info)
-                                    self.log_message(f"发现设备: {device_info['name']} - {device_info['ip']} - {device_info['sn']} - {device_info['state']}")
-                                else:
-                                    self.log_message(f"设备已存在，跳过: {device_info['name']} - {device_info['ip']}")
-                                    
-                    except Exception as e:
-                        self.log_message(f"解析文件 {p} 时出错: {e}")
+    def create_status_bar(self):
+        """创建状态栏：显示解析/转换的实时吞吐量，导出性能报告，可选用cProfile统计"""
+        self.throughput_label = QLabel()
+        self.convert_progress = QProgressBar()
+        self.convert_progress.setMaximumWidth(360)
+        self.convert_progress.setVisible(False)
+        self.cprofile_checkbox = QCheckBox("cProfile")
+        self.cprofile_checkbox.setToolTip(f"用cProfile统计之后的目录解析与格式转换，结果保存在 "
+                                          f"{os.path.dirname(LOG_FILE)} 下（pstats格式）")
+        self.export_profile_btn = QPushButton("导出性能报告")
+        self.export_profile_btn.setToolTip("把最近一次解析、查看、转换各阶段的耗时、读写字节数和计数保存为JSON")
+        self.export_profile_btn.clicked.connect(self.export_profile_report)
+        status_bar = self.statusBar()
+        status_bar.addPermanentWidget(self.throughput_label, 1)
+        status_bar.addPermanentWidget(self.convert_progress)
+        status_bar.addPermanentWidget(self.cprofile_checkbox)
+        status_bar.addPermanentWidget(self.export_profile_btn)
+        self._throughput_timer = QTimer(self)
+        self._throughput_timer.setInterval(1000)
+        self._throughput_timer.timeout.connect(self.update_throughput)
+        self._throughput_timer.start()
+        
+    def update_throughput(self):
+        """状态栏显示正在进行的解析/转换的实时吞吐量（每秒刷新）"""
+        parts = []
+        now = time.monotonic()
+        for label, thread, stats in (("解析", self._discover_thread, self.discover_stats),
+                                     ("转换", self._convert_thread, self.convert_stats)):
+            if thread is None or stats is None:
+                self._throughput_marks.pop(label, None)
+                continue
+            read, written = stats.bytes_total()
+            last = self._throughput_marks.get(label)
+            self._throughput_marks[label] = (now, read, written)
+            if last is None or now <= last[0]:
+                continue
+            seconds = now - last[0]
+            parts.append(f"{label}: 读取 {(read - last[1]) / 1048576 / seconds:.1f} MB/s，"
+                         f"写出 {(written - last[2]) / 1048576 / seconds:.1f} MB/s，累计读取 {read / 1048576:.0f} MB")
+        if parts:
+            self.throughput_label.setText("；".join(parts))
+            
+    def show_run_summary(self, label, stats):
+        """运行结束后在状态栏显示平均吞吐量"""
+        read, written = stats.bytes_total()
+        seconds = max(stats.elapsed, 0.001)
+        self.throughput_label.setText(f"{label}用时 {seconds:.1f} 秒，读取 {read / 1048576:.1f} MB"
+                                      f"（{read / 1048576 / seconds:.1f} MB/s），写出 {written / 1048576:.1f} MB")
+        
+    def profile_path(self, name):
+        """勾选cProfile时返回本次运行的结果文件位置"""
+        if not self.cprofile_checkbox.isChecked():
+            return None
+        path = profile_file(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.log_message(f"cProfile结果将保存到: {path}")
+        return path
+        
+    def export_profile_report(self):
+        """保存最近一次解析、查看、转换的性能报告（JSON）"""
+        file_path, _ = QFileDialog.getSaveFileName(self, "保存性能报告", "convnetlog_profile.json", "JSON (*.json)")
+        if not file_path:
+            return
+        meta = {"root": self.path_display.text()}
+        reports = [stats.report(**meta)
+                   for stats in (self.discover_stats, self.view_stats, self.convert_stats, self.export_stats)
+                   if stats is not None]
+        try:
+            save_report(file_path, reports)
+            self.log_message(f"性能报告已保存: {file_path}")
+        except OSError as e:
+            self.log_message(f"保存性能报告时出错: {str(e)}")
+        
+    def create_search_dock(self):
+        """创建全文搜索停靠窗口"""
+        search_widget = QWidget()
+        search_layout = QVBoxLayout(search_widget)
+        
+        query_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("在所有设备的命令输出中搜索")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.returnPressed.connect(self.run_search)
+        self.search_mode_combo = QComboBox()
+        self.search_mode_combo.addItem("词语", MODE_TERM)
+        self.search_mode_combo.addItem("短语", MODE_PHRASE)
+        self.search_mode_combo.addItem("正则", MODE_REGEX)
+        self.search_btn = QPushButton("搜索")
+        self.search_btn.clicked.connect(self.run_search)
+        query_layout.addWidget(self.search_edit, 1)
+        query_layout.addWidget(self.search_mode_combo)
+        query_layout.addWidget(self.search_btn)
+        search_layout.addLayout(query_layout)
+        
+        index_layout = QHBoxLayout()
+        self.build_search_index_btn = QPushButton("建立索引")
+        self.build_search_index_btn.setToolTip(f"在采集目录下保存全文索引文件 {SEARCH_FILE_NAME}，只处理有变化的结果文件")
+        self.build_search_index_btn.clicked.connect(self.build_search_index)
+        self.search_status_label = QLabel()
+        index_layout.addWidget(self.build_search_index_btn)
+        index_layout.addWidget(self.search_status_label, 1)
+        search_layout.addLayout(index_layout)
+        
+        self.search_hit_model = SearchHitModel(self)
+        self.search_hit_table = QTableView()
+        self.search_hit_table.setModel(self.search_hit_model)
+        self.search_hit_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.search_hit_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.search_hit_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.search_hit_table.verticalHeader().setDefaultSectionSize(self.search_hit_table.fontMetrics().height() + 8)
+        self.search_hit_table.horizontalHeader().setStretchLastSection(True)
+        self.search_hit_table.doubleClicked.connect(self.on_search_hit_activated)
+        search_layout.addWidget(self.search_hit_table)
+        
+        dock = QDockWidget("全文搜索", self)
+        dock.setObjectName("search_dock")
+        dock.setWidget(search_widget)
+        self.addDockWidget(Qt.RightDockWidgetArea, dock)
+        
+    def parse_path(self, dirname, snapshot=None, history=None):
+        """在后台线程中解析路径获取设备列表，发现的设备分批加入表格
+
+        snapshot 为要查看的采集（result_目录名），默认为最新的一次；传入history时先列出全部采集。
+        """
+        self.discover_stats = RunStats("parse_path")
+        self._discover_thread = DiscoverWorker(dirname, self.device_list, self.collection_index,
+                                               stats=self.discover_stats, profile_path=self.profile_path("parse_path"),
+                                               snapshot=snapshot, history=history)
+        self._discover_thread.snapshots_found.connect(self.on_snapshots_found)
+        self._discover_thread.devices_found.connect(self.on_devices_found)
+        # 直接在工作线程中写入日志队列，不经过界面事件队列
+        self._discover_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._discover_thread.finished_all.connect(self.on_discovery_finished)
+        self.stop_discovery_btn.setEnabled(True)
+        self._discover_thread.start()
+
+    def stop_discovery(self):
+        """中止正在进行的目录解析并等待线程退出"""
+        thread = self._discover_thread
+        if thread is not None:
+            # 结束信号仍会送达 on_discovery_finished；若随后开始新的解析，旧线程的信号会被忽略
+            thread.stop()
+            thread.wait()
+
+    def on_devices_found(self, devices):
+        if self.sender() is not self._discover_thread:
+            return  # 已被新的解析取代
+        self.device_model.append_devices(devices)
+
+    def on_discovery_finished(self, cancelled):
+        thread = self.sender()
+        if thread is not self._discover_thread:
+            return
+        self._discover_thread = None
+        self.stop_discovery_btn.setEnabled(False)
+        if thread.updated_count:
+            # 有设备的状态被其他cmd_info文件原地更新
+            self.device_model.refresh()
+        header = self.device_table.horizontalHeader()
+        if header.sortIndicatorSection() >= 0:
+            # 解析过程中追加的设备未参与排序，按当前排序列重新排序
+            self.device_model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+        resize_columns_from_sample(self.device_table)
+        self.convert_format_btn.setEnabled(bool(self.device_list))
+        self.export_btn.setEnabled(bool(self.device_list) or self._export_thread is not None)
+        self.show_run_summary("解析", self.discover_stats)
+        reselect, self._reselect = self._reselect, None
+        if reselect is not None and not cancelled:
+            device = self.device_list.get(*reselect[0])
+            if device is not None:
+                self.show_device_command(device, reselect[1])
+        if cancelled:
+            self.log_message(f"已停止解析，已发现 {len(self.device_list)} 个设备")
+        else:
+            self.log_message(f"成功解析路径，发现 {len(self.device_list)} 个设备")
+            if self.watch_checkbox.isChecked():
+                self.start_watch()
+
+    def on_snapshots_found(self, snapshots):
+        if self.sender() is not self._discover_thread:
+            return
+        self.snapshot_combo.clear()
+        for row, snapshot in enumerate(snapshots):
+            latest = "（最新）" if row == 0 else ""
+            self.snapshot_combo.addItem(f"{snapshot.label}{latest}", snapshot.name)
+        self.snapshot_combo.setEnabled(len(snapshots) > 1)
+
+    def on_snapshot_selected(self, row):
+        """切换查看的采集：重新解析该次采集的设备列表，并尽量保持当前选中的设备和命令"""
+        snapshot = self.snapshot_combo.itemData(row) if row > 0 else None
+        if snapshot == self.current_snapshot:
+            return
+        self.current_snapshot = snapshot
+        # 不同采集中的同一设备键对应不同的输出，预取的内容全部作废
+        self.loader.cancel()
+        command_index = self.command_list_widget.currentIndex()
+        if self.current_device is not None and command_index.isValid():
+            self._reselect = (self.current_device.key, command_index.data())
+        self.stop_watch()
+        self.stop_discovery()
+        self.stop_grouping()
+        self.stop_command_table()
+        self.device_list.clear()
+        self.update_device_list()
+        self.current_device = None
+        self.current_device_commands = []
+        self.command_model.clear()
+        self.result_text.clear()
+        self.convert_format_btn.setEnabled(False)
+        self.export_btn.setEnabled(self._export_thread is not None)
+        self.log_message(f"查看采集: {self.snapshot_combo.itemText(row)}")
+        self.parse_path(self.history.root, snapshot)
+
+    def show_command_history(self):
+        """打开当前设备、当前命令的历史对比窗口"""
+        index = self.command_list_widget.currentIndex()
+        if self.current_device is None or not index.isValid() or self.history is None:
+            return
+        if self.snapshot_combo.count() < 2:
+            self.log_message("采集目录中只有一次采集，无法进行历史对比")
+            return
+        dialog = SnapshotDiffDialog(self.history, self.current_device, index.data(),
+                                    self.current_snapshot, self)
+        dialog.log.connect(self.log_sink.write, Qt.DirectConnection)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.show()
+
+    def on_watch_toggled(self, checked):
+        if not checked:
+            self.stop_watch()
+        elif self.history is not None and self._discover_thread is None:
+            self.start_watch()
+
+    def start_watch(self):
+        """解析完成后开始监视当前查看的采集"""
+        if self._watch_thread is not None or self.history is None:
+            return
+        if is_archive(self.history.root):
+            self.log_message("压缩包中的采集结果不会变化，无需监视")
+            return
+        compression, bundle = self.output_format_combo.currentData()
+        # 增量转换只支持每台设备一个文件的输出
+        save_path = self.save_log_path if self.save_log_path and bundle is None else None
+        self._watch_thread = WatchWorker(self.history.root, [device.copy() for device in self.device_list],
+                                         self.current_snapshot,
+                                         self.collection_index, save_path, compression, self.jobs_spinbox.value(),
+                                         lambda: self._convert_thread is not None, self)
+        self._watch_thread.devices_found.connect(self.on_watch_devices_found)
+        self._watch_thread.devices_updated.connect(self.on_watch_devices_updated)
+        self._watch_thread.results_changed.connect(self.on_watch_results_changed)
+        self._watch_thread.snapshot_changed.connect(self.on_watch_snapshot_changed)
+        self._watch_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._watch_thread.finished_all.connect(self.on_watch_finished)
+        if save_path is not None:
+            self.log_message(f"有变化的设备将增量转换到: {save_path}")
+        self._watch_thread.start()
+
+    def stop_watch(self):
+        thread = self._watch_thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._watch_thread = None
+
+    def on_watch_finished(self):
+        if self.sender() is self._watch_thread:
+            self._watch_thread = None
+
+    def on_watch_devices_found(self, records):
+        """把监视线程新登记的设备（副本）加入界面的设备登记表"""
+        if self.sender() is not self._watch_thread:
+            return
+        added = []
+        for record in records:
+            device, status = self.device_list.add(record)
+            if status == DeviceRegistry.ADDED:
+                added.append(device)
+        if not added:
+            return
+        self.device_model.append_devices(added)
+        self.convert_format_btn.setEnabled(self._convert_thread is None)
+        self.export_btn.setEnabled(True)
+
+    def on_watch_devices_updated(self, records):
+        """按监视线程中更新后的副本原地更新界面中的设备记录"""
+        if self.sender() is not self._watch_thread:
+            return
+        for record in records:
+            device = self.device_list.get(*record.key)
+            if device is not None:
+                device.state, device.path, device.collected = record.state, record.path, record.collected
+        self.device_model.refresh()
+
+    def on_watch_results_changed(self, records):
+        """结果文件有增减或变化：重新定位结果文件，正在查看的设备重新加载"""
+        if self.sender() is not self._watch_thread:
+            return
+        self.resolver.clear()
+        self.loader.cancel()
+        if self.current_device is not None and any(record.key == self.current_device.key for record in records):
+            index = self.command_list_widget.currentIndex()
+            self.update_command_list(self.current_device, index.data() if index.isValid() else None)
+
+    def on_watch_snapshot_changed(self):
+        """出现了新的一次采集：重新打开采集目录，解析完成后继续监视"""
+        if self.sender() is not self._watch_thread or self.current_snapshot is not None:
+            return
+        self.log_message("监视: 出现新的一次采集，重新解析")
+        self._watch_thread.wait()
+        self._watch_thread = None
+        self.open_collection(self.history.root)
+
+    def close_history_dialogs(self):
+        for dialog in self.findChildren(SnapshotDiffDialog):
+            dialog.close()
 
     def select_h3clog_path(self):
         """选择采集日志文件路径"""
         dir_path = QFileDialog.getExistingDirectory(self, "采集日志文件目录")
         if dir_path:
-            self.path_display.setText(dir_path)
-            self.log_message(f"已选择采集日志文件路径: {dir_path}")
-            
-            # 解析路径获取设备列表
-            try:
-                # 清空设备列表
-                self.device_list.clear()
-                
-                # 调用parse_path函数
-                self.parse_path(dir_path)
-                
-                # 更新设备列表显示
-                self.update_device_list()
-                self.convert_format_btn.setEnabled(True)
-                self.log_message(f"成功解析路径，发现 {len(self.device_list)} 个设备")
-            except Exception as e:
-                self.log_message(f"解析路径时出错: {str(e)}")
-                
-    def update_device_list(self):
-        """更新设备列表显示"""
-        # 暂时禁用排序以避免更新时的排序问题
-        self.device_table.setSortingEnabled(False)
-        
-        # 清空表格
-        self.device_table.setRowCount(0)
-        
-        # 添加设备数据
-        for row, device in enumerate(self.device_list):
-            self.device_table.insertRow(row)
-            
-            # 创建设备名称项
-            name_item = QTableWidgetItem(device['name'])
-            name_item.setData(Qt.UserRole, device)  # 存储设备数据
-            
-            # 创建IP地址项
-            ip_item = QTableWidgetItem(device['ip'])
-            
-            # 创建SN号项
-            sn_item = QTableWidgetItem(device['sn'])
+            self.open_collection(dir_path)
             
-            # 创建状态项
-            state_item = QTableWidgetItem(device['state'])
+    def select_h3clog_archive(self):
+        """选择采集日志压缩包，直接读取包内文件，不解压到磁盘"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "采集日志压缩包", "", "压缩包 (*.zip *.tar *.tar.gz *.tgz *.tar.xz *.txz);;所有文件 (*)")
+        if file_path:
+            self.open_collection(file_path)
             
-            # 设置单元格内容
-            self.device_table.setItem(row, 0, name_item)
-            self.device_table.setItem(row, 1, ip_item)
-            self.device_table.setItem(row, 2, sn_item)
-            self.device_table.setItem(row, 3, state_item)
-            
-            # 如果状态不是"成功"，设置整行红色字体
-            if device['state'] != "成功":
-                for col in range(4):
-                    item = self.device_table.item(row, col)
-                    if item:
-                        item.setForeground(QColor(255, 0, 0))
-                  
-        # 重新启用排序
-        self.device_table.setSortingEnabled(True)
-        
-        # 调整列宽以适应内容
-        self.device_table.resizeColumnsToContents()
-        
-                    
-    def on_device_selected(self, item):
-        """设备选择事件"""
-        # 获取选中的行
-        row = item.row()
-        # 从第一列获取设备数据
-        device_item = self.device_table.item(row, 0)
-        if device_item:
-            device = device_item.data(Qt.UserRole)
-            self.current_device = device
-            self.log_message(f"已选择设备: {device['name']}")
-            
-            # 更新命令列表
-            self.update_command_list(device)
-            # 清空结果列表
-            self.result_text.setText("")
-        
-    def update_command_list(self, device):
-        """更新命令列表"""
-        self.command_list_widget.clear()
+    def open_collection(self, dir_path):
+        """打开采集目录或压缩包并在后台解析设备列表"""
+        self.path_display.setText(dir_path)
+        self.log_message(f"已选择采集日志文件路径: {dir_path}")
         
+        # 解析路径获取设备列表
         try:
-            # 解析设备的结果文件获取命令列表
-            commands = self.get_device_commands(device)
-            self.current_device_commands = commands
+            self.stop_watch()
+            self.stop_discovery()
+            self.close_history_dialogs()
+            # 清空设备列表
+            self.device_list.clear()
+            self.view_stats = RunStats("view")
+            self.resolver = ResultResolver(self.view_stats)
+            self.result_cache.clear()
+            self.table_cache.clear()
+            self.update_device_list()
+            self.convert_format_btn.setEnabled(False)
+            self.export_btn.setEnabled(self._export_thread is not None)
+            self.stop_grouping()
+            self.stop_command_table()
+            self.open_collection_index(dir_path)
+            self.loader.reset(self.resolver, self.collection_index, self.result_cache, self.view_stats)
+            self.close_search_index()
+            if self._convert_thread is None and self._export_thread is None:
+                # 读取过的压缩包不再使用，关闭各线程打开的文件（转换、导出仍在读取时保留）
+                close_archives()
+            self.search_hit_model.set_hits([])
+            self.snapshot_combo.clear()
+            self.snapshot_combo.setEnabled(False)
+            self.current_snapshot = None
+            self._reselect = None
+            self.history = SnapshotHistory(dir_path, self.collection_index, self.result_cache,
+                                           workers=DISCOVERY_WORKERS)
             
-            for cmd in commands:
-                item = QListWidgetItem(cmd)
-                self.command_list_widget.addItem(item)
-                
+            # 调用parse_path函数
+            self.parse_path(dir_path, history=self.history)
         except Exception as e:
-            self.log_message(f"获取设备命令列表时出错: {str(e)}")
-            
-    def get_device_commands(self, device):
-        """获取设备的命令列表"""
-        commands = []
+            self.log_message(f"解析路径时出错: {str(e)}")
+                
+    def open_collection_index(self, dir_path):
+        """打开（或创建）采集目录的索引，未启用或无法写入时不使用索引"""
+        if self.collection_index is not None:
+            self.collection_index.close()
+            self.collection_index = None
+        if not self.use_index_checkbox.isChecked():
+            return
         try:
-            path = pathlib.Path(device['path'])
-            cmds_result_path = path.parent.joinpath("cmdsResult", "network")
+            self.collection_index = CollectionIndex(dir_path, self.view_stats)
+        except (sqlite3.Error, OSError) as e:
+            self.log_message(f"无法打开索引文件，将直接解析采集目录: {str(e)}")
             
-            if cmds_result_path.exists():
-                for p in cmds_result_path.iterdir():
-                    if re.fullmatch(r"ssh_\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}_[-0-9a-zA-Z_]*\.xml", p.name):
-                        tree = et.parse(p)
-                        root = tree.getroot()
-                        for cmd_elem in root.findall(".//command"):
-                            if cmd_elem.text and cmd_elem.text not in commands:
-                                commands.append(cmd_elem.text)
-        except Exception as e:
-            self.log_message(f"解析设备命令时出错: {str(e)}")
+    def open_search_index(self):
+        """打开当前采集目录的全文索引，需要启用采集目录索引（提供echo的字节位置）"""
+        if self.search_index is not None:
+            return self.search_index
+        if self.collection_index is None:
+            self.log_message("全文搜索需要启用\"使用索引\"并重新选择采集日志路径")
+            return None
+        try:
+            self.search_index = SearchIndex(self.collection_index.root)
+        except (sqlite3.Error, OSError) as e:
+            self.log_message(f"无法打开全文索引文件: {str(e)}")
+        return self.search_index
+        
+    def stop_search(self):
+        thread = self._search_thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._search_thread = None
+        
+    def close_search_index(self):
+        self.stop_search()
+        thread = self._search_index_thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._search_index_thread = None
+            self.build_search_index_btn.setEnabled(True)
+        if self.search_index is not None:
+            self.search_index.close()
+            self.search_index = None
+        self.search_status_label.clear()
             
-        return commands
+    def build_search_index(self):
+        """在后台线程中为所有设备的结果文件建立（增量更新）全文索引"""
+        if self._search_index_thread is not None or not self.device_list:
+            return
+        search_index = self.open_search_index()
+        if search_index is None:
+            return
+        self.build_search_index_btn.setEnabled(False)
+        self._search_index_thread = SearchIndexWorker(search_index, list(self.device_list), self.resolver,
+                                                      self.collection_index)
+        self._search_index_thread.progress.connect(self.on_search_index_progress)
+        self._search_index_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._search_index_thread.finished_all.connect(self.on_search_index_finished)
+        self._search_index_thread.start()
+        
+    def on_search_index_progress(self, done, total):
+        self.search_status_label.setText(f"正在建立索引: {done}/{total}")
+        
+    def on_search_index_finished(self, indexed):
+        if self.sender() is not self._search_index_thread:
+            return
+        self._search_index_thread = None
+        self.build_search_index_btn.setEnabled(True)
+        count = self.search_index.doc_count()
+        self.search_status_label.setText(f"已索引 {count} 条命令输出")
+        self.log_message(f"全文索引更新完成，新索引 {indexed} 个结果文件，共 {count} 条命令输出")
+        
+    def run_search(self):
+        """在后台线程中查询全文索引；正在进行的查询被新的查询取代"""
+        query = self.search_edit.text()
+        if not query.strip():
+            return
+        search_index = self.open_search_index()
+        if search_index is None:
+            return
+        # 旧的查询在读取下一段输出前停止
+        self.stop_search()
+        self._search_thread = SearchWorker(search_index, query, self.search_mode_combo.currentData())
+        self._search_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._search_thread.finished_all.connect(self.on_search_finished)
+        self.search_status_label.setText("正在搜索...")
+        self._search_thread.start()
+        
+    def on_search_finished(self, hits, seconds):
+        if self.sender() is not self._search_thread:
+            return
+        self._search_thread = None
+        if hits is None:
+            self.search_status_label.setText("搜索出错")
+            return
+        self.search_hit_model.set_hits(hits)
+        resize_columns_from_sample(self.search_hit_table)
+        self.search_status_label.setText(f"找到 {len(hits)} 行，用时 {seconds * 1000:.0f} 毫秒")
+        
+    def on_search_hit_activated(self, index):
+        """打开搜索结果所在设备的命令输出，并定位到命中的行"""
+        hit = index.data(Qt.UserRole)
+        if hit is None:
+            return
+        device = self.device_list.get(hit.device, hit.ip, hit.sn)
+        if device is None:
+            self.log_message(f"设备列表中没有该设备: {hit.device}")
+            return
+        self.show_device_command(device, hit.command, hit.line.strip())
+        
+    def show_device_command(self, device, command, find=None):
+        """在设备列表和命令列表中选中指定设备及命令，并显示执行结果（find 为显示后要查找的文字）"""
+        row = self.device_model.row_of(device)
+        if row >= 0:
+            proxy_index = self.device_proxy.mapFromSource(self.device_model.index(row, 0))
+            if proxy_index.isValid():
+                self._selecting = True
+                try:
+                    self.device_table.selectRow(proxy_index.row())
+                finally:
+                    self._selecting = False
+                self.device_table.scrollTo(proxy_index)
+                self.prefetch_neighbours(proxy_index)
+        self.current_device = device
+        self.result_text.clear()
+        self.update_command_list(device, command, find)
+        
+    def stop_grouping(self):
+        thread = self._group_thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._group_thread = None
+            self.group_by_output_btn.setEnabled(True)
+        
+    def group_by_output(self):
+        """在后台线程中按当前命令的输出对所有设备分组"""
+        index = self.command_list_widget.currentIndex()
+        if not index.isValid() or self._group_thread is not None:
+            return
+        command = index.data()
+        self.group_by_output_btn.setEnabled(False)
+        self._group_thread = GroupWorker(list(self.device_list), self.resolver, command,
+                                         self.collection_index, self.result_cache)
+        self._group_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._group_thread.finished_all.connect(self.on_group_finished)
+        self._group_thread.start()
+        
+    def on_group_finished(self, groups):
+        thread = self.sender()
+        if thread is not self._group_thread:
+            return
+        self._group_thread = None
+        self.group_by_output_btn.setEnabled(True)
+        self.log_message(f"命令 {thread.command} 在 {sum(len(g) for g in groups)} 台设备上共有 {len(groups)} 种不同的输出")
+        dialog = OutputGroupsDialog(thread.command, groups, self)
+        dialog.device_activated.connect(self.show_device_command)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.show()
+        
+    def stop_command_table(self):
+        thread = self._table_thread
+        if thread is not None:
+            thread.stop()
+            thread.wait()
+            self._table_thread = None
+            self.command_table_btn.setEnabled(True)
+        
+    def show_command_table(self):
+        """在后台线程中把所有设备当前命令的输出解析为表格"""
+        index = self.command_list_widget.currentIndex()
+        if not index.isValid() or self._table_thread is not None:
+            return
+        command = index.data()
+        if find_parser(command) is None:
+            self.log_message(f"暂不支持把命令 {command} 的输出解析为表格")
+            return
+        self.command_table_btn.setEnabled(False)
+        self.statusBar().showMessage(f"正在解析 {command} ...")
+        self._table_thread = CommandTableWorker(list(self.device_list), self.resolver, command,
+                                                self.collection_index, self.result_cache, self.table_cache,
+                                                self.view_stats)
+        self._table_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._table_thread.finished_all.connect(self.on_command_table_finished)
+        self._table_thread.start()
+        
+    def on_command_table_finished(self, table):
+        thread = self.sender()
+        if thread is not self._table_thread:
+            return
+        self._table_thread = None
+        self.command_table_btn.setEnabled(True)
+        self.statusBar().clearMessage()
+        if table is None:
+            return
+        self.log_message(f"命令 {thread.command} 解析为 {len(table)} 行，"
+                         f"解析结果缓存命中 {self.table_cache.hits} 次、未命中 {self.table_cache.misses} 次")
+        dialog = CommandTableDialog(thread.command, table, self)
+        dialog.device_activated.connect(self.show_table_device)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.show()
+        
+    def show_table_device(self, name, ip, command):
+        """显示命令表格中双击的行所属设备的输出"""
+        for device in self.device_list.by_ip(ip):
+            if device.name == name:
+                self.show_device_command(device, command)
+                return
+        
+    def update_device_list(self):
+        """更新设备列表显示"""
+        self.device_model.set_devices(self.device_list)
+        
+        # 按样本行调整列宽
+        resize_columns_from_sample(self.device_table)
+        
+    def on_device_selected(self, index, previous=None):
+        """设备选择事件：在后台加载命令列表，并预取相邻设备"""
+        if self._selecting:
+            return
+        # 从模型获取该行的设备记录
+        device = index.data(Qt.UserRole)
+        if device is None or device is self.current_device:
+            return
+        self.current_device = device
+        self.log_message(f"已选择设备: {device.name}")
+        
+        # 更新命令列表
+        self.update_command_list(device)
+        # 清空结果列表
+        self.result_text.clear()
+        self.prefetch_neighbours(index)
         
-    def on_command_selected(self, item):
+    def prefetch_neighbours(self, index):
+        """预取表格中当前行上下相邻设备的命令列表"""
+        self.loader.cancel_prefetch()
+        neighbours = []
+        for distance in range(1, PREFETCH_NEIGHBOURS + 1):
+            for row in (index.row() + distance, index.row() - distance):
+                if 0 <= row < self.device_proxy.rowCount():
+                    device = self.device_proxy.index(row, 0).data(Qt.UserRole)
+                    if device is not None:
+                        neighbours.append(device)
+        self.loader.prefetch_devices(neighbours)
+        
+    def update_command_list(self, device, command=None, find=None):
+        """在后台加载设备的命令列表，加载后选中command（若有）并显示其输出"""
+        self.command_model.clear()
+        self.current_device_commands = []
+        self._pending_command = (command, find) if command is not None else None
+        self.loader.load_commands(device)
+        
+    def on_commands_loaded(self, request_id, device, commands):
+        if not self.loader.is_current(KIND_COMMANDS, request_id) or device is not self.current_device:
+            return
+        self.current_device_commands = commands
+        self.command_model.set_commands(commands)
+        pending, self._pending_command = self._pending_command, None
+        if pending is not None and pending[0] in commands:
+            command, find = pending
+            self.command_model.fetch_all()
+            self._selecting = True
+            try:
+                self.command_list_widget.setCurrentIndex(self.command_model.index(commands.index(command), 0))
+            finally:
+                self._selecting = False
+            self.display_command_result(command, find)
+        # 预取前几条命令的输出（之后的相邻设备预取仍在进行）
+        self.loader.prefetch_results(device, [c for c in commands[:PREFETCH_COMMANDS]
+                                              if pending is None or c != pending[0]])
+        
+    def on_command_selected(self, index, previous=None):
         """命令选择事件"""
-        if not self.current_device:
+        if self._selecting or not self.current_device or not index.isValid():
             return
             
-        command = item.text()
+        command = index.data()
         self.log_message(f"已选择命令: {command}")
         
         # 显示命令执行结果
         self.display_command_result(command)
         
-    def display_command_result(self, command):
-        """显示命令执行结果"""
-        try:
-            result = ""
-            path = pathlib.Path(self.current_device['path'])
-            cmds_result_path = path.parent.joinpath("cmdsResult", "network")
-            
-            if cmds_result_path.exists():
-                for p in cmds_result_path.iterdir():
-                    if re.fullmatch(r"ssh_\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}_[-0-9a-zA-Z_]*\.xml", p.name):
-                        tree = et.parse(p)
-                        root = tree.getroot()
-                        
-                        # 构建父节点映射
-                        parent_map = {c: p for p in root.iter() for c in p}
-                        
-                        for cmd_elem in root.findall(".//command"):
-                            if cmd_elem.text and cmd_elem.text == command:
-                                # 查找紧跟的echo标签
-                                echo_text = ""
-                                parent = parent_map.get(cmd_elem)
-                                if parent is not None:
-                                    children = list(parent)
-                                    for idx, child in enumerate(children):
-                                        if child == cmd_elem and idx + 1 < len(children):
-                                            next_elem = children[idx + 1]
-                                            if next_elem.tag == "echo":
-                                                echo_text = next_elem.text.strip() if next_elem.text else ""
-                                                break
-                                
-                                result += f"命令: {command}\n"
-                                result += f"执行结果:\n{echo_text}\n"
-                                result += "-" * 50 + "\n"
-                                                                
-            if result:
-                self.result_text.setText(result)
-            else:
-                self.result_text.setText("未找到该命令的执行结果")
-                
-        except Exception as e:
-            self.log_message(f"显示命令结果时出错: {str(e)}")
-            self.result_text.setText(f"显示结果时出错: {str(e)}")
+    def display_command_result(self, command, find=None):
+        """在后台加载命令执行结果，加载完成前保留当前显示的内容；find 为加载后要查找的文字"""
+        self._pending_find = find
+        self.statusBar().showMessage(f"正在加载 {command} ...")
+        self.loader.load_result(self.current_device, command)
+        
+    def on_result_loaded(self, request_id, device, command, store, seconds):
+        if not self.loader.is_current(KIND_RESULT, request_id) or device is not self.current_device:
+            if store is not None:
+                store.close()
+            return
+        if store is None:
+            self.result_text.set_text("未找到该命令的执行结果")
+            self.statusBar().clearMessage()
+            return
+        self.result_text.set_store(store)
+        self.statusBar().showMessage(f"显示 {store.size / 1048576:.2f} MB，用时 {seconds:.3f} 秒", 5000)
+        find, self._pending_find = self._pending_find, None
+        if find:
+            self.result_text.find_text(find)
+        
+    def on_load_failed(self, kind, request_id, message):
+        if not self.loader.is_current(kind, request_id):
+            return
+        if kind == KIND_COMMANDS:
+            self.log_message(f"获取设备命令列表时出错: {message}")
+        else:
+            self.log_message(f"显示命令结果时出错: {message}")
+            self.result_text.set_text(f"显示结果时出错: {message}")
+            self.statusBar().clearMessage()
     
     def save_commands_result(self, device):
         try:
-            path = pathlib.Path(device["path"])
-            cmds_result_path = path.parent.joinpath("cmdsResult", "network")
-            
-            if cmds_result_path.exists():
-                for p in cmds_result_path.iterdir():
-                    if re.fullmatch(r"ssh_\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}_[-0-9a-zA-Z_]*\.xml", p.name):
-                        self.log_message(f"转换文件: {p.name}")
-                        tree = et.parse(p)
-                        root = tree.getroot()
-                        # 构建父节点映射
-                        parent_map = {c: p for p in root.iter() for c in p}
-                        file_name = pathlib.Path(self.save_log_path).joinpath(f"{device['name']}.log")
-                        f = open(file_name, "w", encoding="utf-8")
-                        for cmd_elem in root.findall(".//command"):
-                            if cmd_elem.text:
-                                 # 查找紧跟的echo标签
-                                echo_text = ""
-                                parent = parent_map.get(cmd_elem)
-                                if parent is not None:
-                                    children = list(parent)
-                                    for idx, child in enumerate(children):
-                                        if child == cmd_elem and idx + 1 < len(children):
-                                            next_elem = children[idx + 1]
-                                            if next_elem.tag == "echo":
-                                                echo_text = next_elem.text.strip() if next_elem.text else ""
-                                                echo_list = echo_text.split("\n")
-                                                f.write(f"#\n<{device['name']}>{cmd_elem.text}\n")
-                                                for line in echo_list[1:len(echo_list) - 1]:
-                                                    f.write(f"{line}\n")
-                        f.close()
+            files = self.resolver.files_for(device)
+            if files:
+                file_name = pathlib.Path(self.save_log_path).joinpath(f"{device.name}.log")
+                with open(file_name, "w", encoding="utf-8") as f:
+                    write_device_log(f, device.name, files, self.log_message, self.result_cache)
         except Exception as e:
             self.log_message(f"转换文件格式时出错: {str(e)}")
         
@@ -549,31 +1719,105 @@ class NetLogHiveGUI(QMainWindow):
             self.convert_format_btn.setEnabled(False)
             
             # 启动后台线程
-            self._convert_thread = ConvertWorker(self.device_list.copy(), self.save_log_path)
-            self._convert_thread.log.connect(self.log_message)
+            compression, bundle = self.output_format_combo.currentData()
+            force = self.force_convert_checkbox.isChecked()
+            pivot = PIVOT_DIR_NAME if self.pivot_checkbox.isChecked() else None
+            resume = False
+            if bundle is None and pivot is None:
+                unfinished = ConversionManifest(dir_path).unfinished_job(compression)
+                if unfinished is not None:
+                    job, done = unfinished
+                    answer = QMessageBox.question(
+                        self, "继续转换",
+                        f"该目录中有 {job['started']} 开始、尚未完成的转换（已完成 {done} 台设备）。\n"
+                        f"是否继续上次的转换？选择“否”将开始新的转换。",
+                        QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes)
+                    if answer == QMessageBox.Cancel:
+                        self.convert_format_btn.setEnabled(True)
+                        return
+                    resume = answer == QMessageBox.Yes
+                    if resume and job.get("force"):
+                        force = True   # 继续强制重新生成的任务，只处理其中尚未完成的设备
+            self.convert_stats = RunStats("convert")
+            self._convert_thread = ConvertWorker(list(self.device_list), self.save_log_path, self.result_cache,
+                                                 self.jobs_spinbox.value(), force,
+                                                 self.prune_outputs_checkbox.isChecked(), compression, bundle,
+                                                 self.convert_stats, self.profile_path("convert"), resume, pivot)
+            self._convert_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+            self._convert_thread.progress.connect(self.on_convert_progress)
             self._convert_thread.finished_all.connect(self.on_convert_finished)
+            self.cancel_convert_btn.setEnabled(True)
+            self.convert_progress.setRange(0, 1000)
+            self.convert_progress.setValue(0)
+            self.convert_progress.setFormat("准备转换…")
+            self.convert_progress.setVisible(True)
             self._convert_thread.start()
         
       
+    def cancel_convert(self):
+        """请求取消正在进行的转换，不等待线程退出（完成后仍会收到 finished_all）"""
+        if self._convert_thread is not None:
+            self._convert_thread.stop()
+            self.cancel_convert_btn.setEnabled(False)
+            self.convert_progress.setFormat("正在取消…")
+            
+    def on_convert_progress(self, done, total, done_mb, total_mb, remaining):
+        if self.sender() is not self._convert_thread:
+            return
+        fraction = done_mb / total_mb if total_mb > 0 else (done / total if total else 1.0)
+        self.convert_progress.setValue(int(fraction * 1000))
+        eta = ""
+        if remaining >= 0:
+            minutes, seconds = divmod(int(remaining + 0.5), 60)
+            eta = f"，剩余约 {minutes}:{seconds:02d}"
+        self.convert_progress.setFormat(f"{done}/{total} 台，{done_mb:.0f}/{total_mb:.0f} MB{eta}")
+        
     def on_convert_finished(self):
+        thread = self.sender()
         self.convert_format_btn.setEnabled(True)
-        self.log_message("所有日志文件格式转换完成")
+        self.cancel_convert_btn.setEnabled(False)
+        self.convert_progress.setVisible(False)
+        if thread is not None and thread.stopped:
+            self.log_message("日志文件格式转换已取消")
+        else:
+            self.log_message("所有日志文件格式转换完成")
         self._convert_thread = None
+        self.show_run_summary("转换", self.convert_stats)
+        
+    def export_records(self):
+        """把当前设备列表的命令输出导出为JSONL或SQLite；导出进行中时取消导出"""
+        if self._export_thread is not None:
+            self._export_thread.stop()
+            self.export_btn.setEnabled(False)
+            self.log_message("正在取消导出…")
+            return
+        if not self.device_list:
+            return
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "结构化导出", "convnetlog_export.db",
+            "SQLite 数据库 (*.db *.sqlite);;JSONL (*.jsonl);;gzip JSONL (*.jsonl.gz)")
+        if not file_path:
+            return
+        self.export_stats = RunStats("export")
+        self._export_thread = ExportWorker(list(self.device_list), [file_path], self.export_stats,
+                                           self.profile_path("export"), self)
+        self._export_thread.log.connect(self.log_sink.write, Qt.DirectConnection)
+        self._export_thread.finished_all.connect(self.on_export_finished)
+        self.export_btn.setText("取消导出")
+        self.log_message(f"开始导出: {file_path}")
+        self._export_thread.start()
+
+    def on_export_finished(self):
+        if self.sender() is not self._export_thread:
+            return
+        self._export_thread = None
+        self.export_btn.setText("结构化导出")
+        self.export_btn.setEnabled(bool(self.device_list))
+        self.show_run_summary("导出", self.export_stats)
         
     def log_message(self, message):
-        """添加日志消息（带时间戳和异常详细信息）"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # 如果是异常对象，自动补充traceback
-        if isinstance(message, Exception):
-            import traceback
-            details = traceback.format_exc()
-            log_entry = f"[{timestamp}] 错误: {str(message)}\n{details}"
-        else:
-            log_entry = f"[{timestamp}] {message}"
-        self.log_text.append(log_entry)
-        # 自动滚动到底部
-        scrollbar = self.log_text.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        """添加日志消息（带时间戳和异常详细信息），可在任意线程调用"""
+        self.log_sink.write(message)
     
     
     def on_resize_event(self, event):
@@ -614,6 +1858,27 @@ class NetLogHiveGUI(QMainWindow):
         frame.moveCenter(available.center())
         self.move(frame.topLeft())
 
+    def closeEvent(self, event):
+        """关闭窗口前停止后台解析和转换"""
+        if self._convert_thread is not None:
+            # 已完成的设备已写入转换清单，下次可继续
+            self._convert_thread.stop()
+            self._convert_thread.wait()
+        self.stop_watch()
+        if self._export_thread is not None:
+            # 未完成的导出文件会被删除
+            self._export_thread.stop()
+            self._export_thread.wait()
+        self.stop_discovery()
+        self.stop_grouping()
+        self.stop_command_table()
+        self.close_history_dialogs()
+        self.loader.shutdown()
+        self.close_search_index()
+        close_archives()
+        self.log_sink.close()
+        super().closeEvent(event)
+
     def showEvent(self, event):
         super().showEvent(event)
         if not getattr(self, '_centered', False):
@@ -621,6 +1886,8 @@ class NetLogHiveGUI(QMainWindow):
             self._centered = True
 
 def main():
+    # 打包为exe后进程池需要
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     
     # 设置应用程序样式
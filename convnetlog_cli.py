@@ -0,0 +1,599 @@
+"""网络日志查看转换工具的命令行入口（不加载PyQt5，可在无界面的服务器上运行）
+
+用法:
+    python convnetlog_cli.py convert <采集目录> <输出目录> [--jobs N] [--summary FILE] [--force] [--prune]
+                                                      [--compress gz|xz] [--bundle 文件名] [--resume] [--progress]
+                                                      [--by-command [目录]] [--by-command-csv]
+    python convnetlog_cli.py list <采集目录>
+    python convnetlog_cli.py search <采集目录> <查询> --index [--mode term|phrase|regex]
+    python convnetlog_cli.py groups <采集目录> <命令>
+    python convnetlog_cli.py table <采集目录> <命令> [--where 条件 ...] [--sort 列] [--desc] [--limit N] [--csv FILE]
+    python convnetlog_cli.py snapshots <采集目录>
+    python convnetlog_cli.py diff <采集目录> <设备名/IP/SN> <命令> [--old result_...] [--new result_...] [--unified]
+    python convnetlog_cli.py watch <采集目录> [输出目录] [--interval 秒] [--settle 秒] [--no-inotify] [--idle-exit 秒]
+    python convnetlog_cli.py export <采集目录> <输出文件.jsonl|.jsonl.gz|.db> [...] [--snapshot result_...|--all-snapshots]
+
+各子命令均可用 --profile-report FILE 写出分阶段的耗时/字节数统计（JSON），--cprofile FILE 写出cProfile数据。
+
+convert 默认增量转换，只重新生成输入有变化的设备（中断后再次运行即从中断处继续）；在标准输出（或 --summary 指定的文件）写出JSON格式的结果汇总；
+全部设备转换成功时退出码为0，有设备转换失败时为1，参数或目录错误时为2；
+按 Ctrl+C 取消转换时退出码为130，已完成的设备记录在转换清单中，再次运行即可继续。
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+
+from convnetlog_core import (
+    COMPRESSIONS, PIVOT_DIR_NAME, CollectionIndex, ConversionCancelled, bundle_format, ResultResolver, convert_devices,
+    discover_devices, estimate_remaining, group_devices_by_output
+)
+from convnetlog_export import EXPORT_FORMATS, export_devices
+from convnetlog_fs import is_archive
+from convnetlog_history import SnapshotHistory
+from convnetlog_parsers import DEVICE_COLUMNS, ColumnarTable, Condition, TableCache, command_table, find_parser, parsers
+from convnetlog_profile import RunStats, profiled, save_report
+from convnetlog_search import MODE_PHRASE, MODE_REGEX, MODE_TERM, SearchIndex
+from convnetlog_watch import POLL_SECONDS, SETTLE_SECONDS, CollectionWatcher, LiveCollection
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+
+def log_stderr(message):
+    print(message, file=sys.stderr)
+
+
+def open_index(root, enabled, stats=None):
+    """打开采集目录索引，未启用或无法写入时返回None"""
+    if not enabled:
+        return None
+    try:
+        return CollectionIndex(root, stats)
+    except Exception as e:
+        log_stderr(f"无法打开索引文件，将直接解析采集目录: {str(e)}")
+        return None
+
+
+def write_summary(summary, target):
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if target in (None, "-"):
+        print(text)
+    else:
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def cmd_list(args, stats=None):
+    index = open_index(args.root, args.index, stats)
+    try:
+        devices = discover_devices(args.root, index, log_stderr if args.verbose else None, args.scan_workers,
+                                   stats=stats)
+    finally:
+        if index is not None:
+            index.close()
+    write_summary({"root": os.path.abspath(args.root), "devices": [d.to_dict() for d in devices]}, args.summary)
+    return EXIT_OK
+
+
+def cmd_search(args, stats=None):
+    if args.mode == MODE_REGEX:
+        try:
+            re.compile(args.query)
+        except re.error as e:
+            log_stderr(f"正则表达式错误: {str(e)}")
+            return EXIT_USAGE
+    if not args.index:
+        log_stderr("全文搜索需要使用采集目录索引，请加上 --index")
+        return EXIT_USAGE
+    index = open_index(args.root, True, stats)
+    if index is None:
+        return EXIT_USAGE
+    search_index = SearchIndex(args.root)
+    try:
+        devices = discover_devices(args.root, index, log_stderr if args.verbose else None, args.scan_workers,
+                                   stats=stats)
+        indexed = search_index.update(devices, ResultResolver(stats), index)
+        if args.verbose:
+            log_stderr(f"全文索引更新 {indexed} 个结果文件，共 {search_index.doc_count()} 条命令输出")
+        start = time.perf_counter()
+        hits = search_index.search(args.query, args.mode, args.max_hits)
+        seconds = time.perf_counter() - start
+    finally:
+        search_index.close()
+        index.close()
+    write_summary({
+        "root": os.path.abspath(args.root),
+        "query": args.query,
+        "mode": args.mode,
+        "seconds": round(seconds, 3),
+        "hits": [hit._asdict() for hit in hits],
+    }, args.summary)
+    return EXIT_OK
+
+
+def cmd_groups(args, stats=None):
+    index = open_index(args.root, args.index, stats)
+    try:
+        devices = discover_devices(args.root, index, log_stderr if args.verbose else None, args.scan_workers,
+                                   stats=stats)
+        groups = group_devices_by_output(devices, ResultResolver(stats), args.command_text, index)
+    finally:
+        if index is not None:
+            index.close()
+    write_summary({
+        "root": os.path.abspath(args.root),
+        "command": args.command_text,
+        "groups": [[d.to_dict() for d in group] for group in groups],
+    }, args.summary)
+    return EXIT_OK
+
+
+def cmd_table(args, stats=None):
+    parser = find_parser(args.command_text)
+    if parser is None:
+        log_stderr(f"暂不支持解析该命令，支持的命令: {', '.join(p.command for p in parsers())}")
+        return EXIT_USAGE
+    # 先按列定义检查条件和排序列，避免解析完所有设备后才报错
+    template = ColumnarTable(DEVICE_COLUMNS + parser.columns)
+    try:
+        conditions = [Condition.parse(text, template) for text in args.where]
+    except ValueError as e:
+        log_stderr(str(e))
+        return EXIT_USAGE
+    if args.sort is not None and args.sort not in template.names:
+        log_stderr(f"没有这一列: {args.sort}（可用的列: {', '.join(template.names)}）")
+        return EXIT_USAGE
+    index = open_index(args.root, args.index, stats)
+    tables = TableCache()
+    try:
+        devices = discover_devices(args.root, index, log_stderr if args.verbose else None, args.scan_workers,
+                                   stats=stats)
+        table = command_table(devices, args.command_text, ResultResolver(stats), index, tables=tables, stats=stats)
+    finally:
+        if index is not None:
+            index.close()
+    rows = table.select(conditions)
+    if args.sort is not None:
+        rows = table.sorted_rows(args.sort, rows, args.desc)
+    matched = len(rows)
+    if args.limit is not None:
+        rows = rows[:args.limit]
+    summary = {
+        "root": os.path.abspath(args.root),
+        "command": args.command_text,
+        "parser": parser.name,
+        "columns": table.names,
+        "total": len(table),
+        "matched": matched,
+        "cache_hits": tables.hits,
+    }
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(table.names)
+            writer.writerows(table.rows(rows))
+        summary["csv"] = os.path.abspath(args.csv)
+    else:
+        summary["rows"] = list(table.rows(rows))
+    write_summary(summary, args.summary)
+    return EXIT_OK
+
+
+def cmd_snapshots(args, stats=None):
+    history = SnapshotHistory(args.root, log=log_stderr if args.verbose else None)
+    write_summary({"root": os.path.abspath(args.root),
+                   "snapshots": [snapshot.to_dict() for snapshot in history.snapshots()]}, args.summary)
+    return EXIT_OK
+
+
+def _find_history_device(history, names, text):
+    """在指定的各次采集中按设备名、IP或SN查找设备"""
+    for name in names:
+        registry = history.devices(name)
+        for device in registry:
+            if text in (device.name, device.ip, device.sn):
+                return device
+    return None
+
+
+def cmd_diff(args, stats=None):
+    index = open_index(args.root, args.index, stats)
+    try:
+        history = SnapshotHistory(args.root, index, log=log_stderr if args.verbose else None,
+                                  workers=args.scan_workers, stats=stats)
+        names = [snapshot.name for snapshot in history.snapshots()]
+        for name in (args.old, args.new):
+            if name is not None and name not in names:
+                log_stderr(f"采集目录中没有这次采集: {name}")
+                return EXIT_USAGE
+        if len(names) < 2 and (args.old is None or args.new is None):
+            log_stderr("采集目录中只有一次采集，无法比较")
+            return EXIT_USAGE
+        new = args.new or names[0]
+        old = args.old or names[names.index(new) + 1 if names.index(new) + 1 < len(names) else 0]
+        device = _find_history_device(history, [new, old] + names, args.device)
+        if device is None:
+            log_stderr(f"没有找到设备: {args.device}")
+            return EXIT_USAGE
+        result = history.diff(device, args.command_text, old, new, args.context)
+        timeline = history.timeline(device, args.command_text) if args.timeline else None
+    finally:
+        if index is not None:
+            index.close()
+    if args.unified:
+        for line in result.lines:
+            print(line)
+        return EXIT_OK
+    summary = {
+        "root": os.path.abspath(args.root),
+        "device": device.to_dict(),
+        "command": args.command_text,
+        "old": old,
+        "new": new,
+        "changed": result.changed,
+        "added": result.added,
+        "removed": result.removed,
+        "diff": result.lines,
+    }
+    if timeline is not None:
+        summary["timeline"] = [{"snapshot": entry.snapshot.name, "status": entry.status} for entry in timeline]
+    write_summary(summary, args.summary)
+    return EXIT_OK
+
+
+def cmd_convert(args, stats=None):
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    index = open_index(args.root, args.index, stats)
+    try:
+        devices = discover_devices(args.root, index, log_stderr if args.verbose else None, args.scan_workers,
+                                   stats=stats)
+    finally:
+        if index is not None:
+            index.close()
+
+    results = []
+
+    def on_result(result):
+        device, file_count, error, elapsed = result
+        if error is not None:
+            status = "failed"
+            log_stderr(f"转换文件格式时出错: {device.name}: {error}")
+        elif file_count == 0:
+            status = "no_result"
+        else:
+            status = "ok"
+        results.append({
+            "name": device.name, "ip": device.ip, "sn": device.sn, "state": device.state,
+            "status": status, "files": file_count, "error": error, "seconds": round(elapsed, 3),
+        })
+
+    last_progress = [0.0]
+
+    def on_progress(done, total, done_bytes, total_bytes):
+        now = time.perf_counter()
+        if now - last_progress[0] < 2 and done < total:
+            return
+        last_progress[0] = now
+        remaining = estimate_remaining(now - convert_start, done_bytes, total_bytes)
+        eta = f"，剩余约 {remaining:.0f} 秒" if remaining is not None else ""
+        log_stderr(f"进度: {done}/{total} 台，{done_bytes / 1048576:.1f}/{total_bytes / 1048576:.1f} MB{eta}")
+
+    def on_skipped(device):
+        results.append({
+            "name": device.name, "ip": device.ip, "sn": device.sn, "state": device.state,
+            "status": "unchanged", "files": None, "error": None, "seconds": 0.0,
+        })
+
+    interrupted = []
+
+    def on_interrupt(signum, frame):
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+        log_stderr("正在取消转换，再次运行即可继续（再按一次 Ctrl+C 立即退出）")
+
+    convert_start = time.perf_counter()
+    previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        succeeded, failed, no_result, unchanged = convert_devices(
+            devices, args.output, args.jobs, log=log_stderr if args.verbose else None, on_result=on_result,
+            stopped=lambda: bool(interrupted), force=args.force, prune=args.prune, on_skipped=on_skipped,
+            compression=args.compress, bundle=args.bundle, stats=stats,
+            on_progress=on_progress if args.progress else None, resume=args.resume, pivot=args.by_command,
+            pivot_csv=args.by_command_csv)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    summary = {
+        "root": os.path.abspath(args.root),
+        "output": os.path.abspath(args.output),
+        "jobs": args.jobs,
+        "compression": args.compress,
+        "bundle": args.bundle,
+        "by_command": os.path.abspath(os.path.join(args.output, args.by_command)) if args.by_command else None,
+        "seconds": round(time.perf_counter() - start, 3),
+        "devices": len(devices),
+        "ok": succeeded,
+        "failed": failed,
+        "no_result": no_result,
+        "unchanged": unchanged,
+        "cancelled": bool(interrupted),
+        "results": results,
+    }
+    write_summary(summary, args.summary)
+    if not args.quiet:
+        log_stderr(f"转换 {succeeded + failed} 台设备，失败 {failed} 台，无结果文件 {no_result} 台，"
+                   f"未变化跳过 {unchanged} 台，用时 {summary['seconds']:.2f} 秒（{args.jobs} 个进程）")
+    if interrupted:
+        return EXIT_CANCELLED
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def cmd_watch(args, stats=None):
+    """监视仍在进行的采集：只登记新写完的文件，给出输出目录时只转换有变化的设备，Ctrl+C 结束"""
+    if is_archive(args.root):
+        log_stderr("压缩包中的采集结果不会变化，无法监视")
+        return EXIT_USAGE
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    index = open_index(args.root, args.index, stats)
+    watcher = CollectionWatcher(args.root, args.snapshot, args.interval, args.settle, args.inotify, log_stderr, stats)
+    live = LiveCollection(index=index, log=log_stderr, stats=stats)
+    totals = {"rounds": 0, "ok": 0, "failed": 0, "no_result": 0, "unchanged": 0, "snapshots": 0}
+    last_change = [time.monotonic()]
+    interrupted = []
+
+    def stopped():
+        if args.idle_exit is not None and time.monotonic() - last_change[0] >= args.idle_exit:
+            return True
+        return bool(interrupted)
+
+    def on_changes(changes):
+        last_change[0] = time.monotonic()
+        update = live.apply(changes)
+        totals["rounds"] += 1
+        if update.reset:
+            totals["snapshots"] += 1
+            log_stderr("跟踪的采集已变为新的一次，重新登记设备")
+        log_stderr(f"新写完 cmd_info 文件 {len(changes.cmd_info)} 个、结果文件 {len(changes.results)} 个；"
+                   f"新设备 {len(update.added)} 台，更新 {len(update.updated)} 台，结果有变化 {len(update.results)} 台"
+                   f"（共 {len(live.registry)} 台）")
+        if not args.output or not update.devices:
+            return
+        counts = convert_devices(update.devices, args.output, args.jobs, log=log_stderr if args.verbose else None,
+                                 stopped=lambda: bool(interrupted), compression=args.compress, stats=stats)
+        for key, value in zip(("ok", "failed", "no_result", "unchanged"), counts):
+            totals[key] += value
+        log_stderr(f"转换 {counts[0] + counts[1]} 台设备，失败 {counts[1]} 台，未变化跳过 {counts[3]} 台")
+
+    def on_interrupt(signum, frame):
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+        log_stderr("正在停止监视（再按一次 Ctrl+C 立即退出）")
+
+    uses_inotify = watcher.uses_inotify
+    log_stderr(f"开始监视 {os.path.abspath(args.root)}（{'inotify' if uses_inotify else '轮询'}，"
+               f"间隔 {args.interval} 秒，文件保持 {args.settle} 秒不变后处理）")
+    previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        watcher.run(on_changes, stopped)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        watcher.close()
+        if index is not None:
+            index.close()
+    summary = {
+        "root": os.path.abspath(args.root),
+        "output": os.path.abspath(args.output) if args.output else None,
+        "seconds": round(time.perf_counter() - start, 3),
+        "devices": len(live.registry),
+        "inotify": uses_inotify,
+    }
+    summary.update(totals)
+    write_summary(summary, args.summary)
+    return EXIT_FAILED if totals["failed"] else EXIT_OK
+
+
+def cmd_export(args, stats=None):
+    start = time.perf_counter()
+    log = log_stderr if args.verbose else None
+    index = open_index(args.root, args.index, stats)
+    try:
+        if args.all_snapshots or args.snapshot:
+            history = SnapshotHistory(args.root, index, log=log, workers=args.scan_workers, stats=stats)
+            names = [snapshot.name for snapshot in history.snapshots()]
+            if args.snapshot:
+                if args.snapshot not in names:
+                    log_stderr(f"采集目录中没有这次采集: {args.snapshot}")
+                    return EXIT_USAGE
+                names = [args.snapshot]
+            devices = [device for name in reversed(names) for device in history.devices(name)]
+        else:
+            devices = list(discover_devices(args.root, index, log, args.scan_workers, stats=stats))
+    finally:
+        if index is not None:
+            index.close()
+
+    done = [0, 0.0]   # 已处理的设备数, 上次显示进度的时间
+
+    def on_device(device, records):
+        done[0] += 1
+        now = time.perf_counter()
+        if args.progress and (now - done[1] >= 2 or done[0] == len(devices)):
+            done[1] = now
+            log_stderr(f"进度: {done[0]}/{len(devices)} 台")
+
+    interrupted = []
+
+    def on_interrupt(signum, frame):
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+        log_stderr("正在取消导出（再按一次 Ctrl+C 立即退出）")
+
+    previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        records = export_devices(devices, args.output, stopped=lambda: bool(interrupted), stats=stats,
+                                 on_device=on_device, fmt=args.format)
+    except ConversionCancelled:
+        records = None
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    summary = {
+        "root": os.path.abspath(args.root),
+        "output": [os.path.abspath(path) for path in args.output],
+        "format": args.format,
+        "snapshots": args.snapshot or ("all" if args.all_snapshots else "latest"),
+        "devices": len(devices),
+        "records": records,
+        "seconds": round(time.perf_counter() - start, 3),
+        "cancelled": records is None,
+    }
+    write_summary(summary, args.summary)
+    return EXIT_CANCELLED if records is None else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="convnetlog", description="H3C标杆神器网络日志转换工具（命令行）")
+    sub = parser.add_subparsers(dest="command")
+
+    def add_common(p):
+        p.add_argument("root", help="采集日志根目录，或 .zip/.tar.gz/.tar.xz 压缩包")
+        p.add_argument("--index", action="store_true",
+                       help="在采集目录下（压缩包旁边）读写索引文件，再次运行时无需重新解析；默认不写入采集目录")
+        p.add_argument("--summary", metavar="FILE", help="JSON汇总输出文件，默认写到标准输出")
+        p.add_argument("--scan-workers", type=int, default=8, help="并行遍历目录的线程数")
+        p.add_argument("-v", "--verbose", action="store_true", help="输出详细的处理过程")
+        p.add_argument("--profile-report", metavar="FILE", help="写出分阶段的耗时、读写字节数与计数（JSON）")
+        p.add_argument("--cprofile", metavar="FILE", help="用cProfile统计整个运行过程，写出到FILE（pstats格式）")
+
+    p = sub.add_parser("convert", help="批量转换为 <设备名>.log")
+    add_common(p)
+    p.add_argument("output", help="输出目录")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    p.add_argument("-q", "--quiet", action="store_true", help="不输出结果统计")
+    p.add_argument("--force", action="store_true", help="忽略转换清单，重新生成所有设备的日志文件")
+    p.add_argument("--prune", action="store_true", help="删除以前转换生成、但已不在设备列表中的日志文件")
+    p.add_argument("--compress", choices=[c for c in COMPRESSIONS if c], help="输出压缩的 .log.gz 或 .log.xz")
+    p.add_argument("--bundle", metavar="FILE",
+                   help="所有设备的日志写入输出目录下的单个包（.zip/.tar/.tar.gz/.tar.xz），不生成单独的文件")
+    p.add_argument("--resume", action="store_true",
+                   help="继续输出目录中未完成的转换（与 --force 同用时只重新生成上次尚未完成的设备）")
+    p.add_argument("--progress", action="store_true", help="在标准错误输出中定期显示进度和预计剩余时间")
+    p.add_argument("--by-command", nargs="?", const=PIVOT_DIR_NAME, metavar="DIR",
+                   help=f"同时按命令汇总：每条命令一个文件，包含所有设备的该命令输出，写入输出目录下的DIR"
+                        f"（默认 {PIVOT_DIR_NAME}）；启用时不跳过未变化的设备")
+    p.add_argument("--by-command-csv", action="store_true",
+                   help="按命令汇总时同时为每条命令写CSV索引（设备名、IP、SN、输出字节数）")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("list", help="列出采集目录中的设备")
+    add_common(p)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("search", help="在所有设备的命令输出中全文搜索（增量更新全文索引）")
+    add_common(p)
+    p.add_argument("query", help="查询内容")
+    p.add_argument("--mode", choices=(MODE_TERM, MODE_PHRASE, MODE_REGEX), default=MODE_TERM,
+                   help="term: 所有词语出现在同一行；phrase: 短语；regex: 正则表达式")
+    p.add_argument("--max-hits", type=int, default=1000, help="最多返回的行数")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("groups", help="按某条命令的输出对设备分组，输出完全相同的设备为一组")
+    add_common(p)
+    p.add_argument("command_text", metavar="command", help="命令，例如 \"display version\"")
+    p.set_defaults(func=cmd_groups)
+
+    p = sub.add_parser("table", help="把所有设备某条命令的输出解析为一张表格，按条件筛选、排序")
+    add_common(p)
+    p.add_argument("command_text", metavar="command", help="命令，例如 \"display counters inbound interface\"")
+    p.add_argument("--where", action="append", default=[], metavar="COND",
+                   help="筛选条件，可指定多个（同时满足），如 errors>0、interface~GE1/0；运算符 > >= < <= = != ~")
+    p.add_argument("--sort", metavar="COLUMN", help="按该列排序")
+    p.add_argument("--desc", action="store_true", help="从大到小排序")
+    p.add_argument("--limit", type=int, metavar="N", help="最多输出的行数")
+    p.add_argument("--csv", metavar="FILE", help="把结果写入CSV文件，JSON汇总中不再包含各行")
+    p.set_defaults(func=cmd_table)
+
+    p = sub.add_parser("snapshots", help="列出采集目录中的全部采集（BrainCollect下的result_目录）")
+    add_common(p)
+    p.set_defaults(func=cmd_snapshots)
+
+    p = sub.add_parser("diff", help="比较某台设备的一条命令在两次采集间的输出")
+    add_common(p)
+    p.add_argument("device", help="设备名称、IP或SN")
+    p.add_argument("command_text", metavar="command", help="命令，例如 \"display interface brief\"")
+    p.add_argument("--old", metavar="SNAPSHOT", help="较早的一次采集（result_目录名），默认为 --new 的前一次")
+    p.add_argument("--new", metavar="SNAPSHOT", help="较新的一次采集（result_目录名），默认为最新的一次")
+    p.add_argument("-U", "--context", type=int, default=3, help="差异前后显示的行数")
+    p.add_argument("--timeline", action="store_true", help="同时列出该命令在每次采集中是否有变化")
+    p.add_argument("--unified", action="store_true", help="只在标准输出中写出unified diff格式的差异")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser("watch", help="监视仍在进行的采集，只处理新写完的文件（可同时增量转换），Ctrl+C 结束")
+    add_common(p)
+    p.add_argument("output", nargs="?", help="输出目录；给出时把有变化的设备增量转换到该目录")
+    p.add_argument("-j", "--jobs", type=int, default=1, help="每次增量转换的并行进程数")
+    p.add_argument("--compress", choices=[c for c in COMPRESSIONS if c], help="输出压缩的 .log.gz 或 .log.xz")
+    p.add_argument("--snapshot", metavar="SNAPSHOT", help="只监视指定的一次采集（result_目录名），默认跟踪最新的一次")
+    p.add_argument("--interval", type=float, default=POLL_SECONDS, help="轮询间隔（秒）")
+    p.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                   help="文件大小和修改时间保持不变多少秒后视为写完")
+    p.add_argument("--no-inotify", dest="inotify", action="store_false", help="不使用inotify，只按轮询发现变化")
+    p.add_argument("--idle-exit", type=float, metavar="SECONDS", help="连续这么多秒没有变化时自动结束")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("export", help="把设备和命令输出导出为JSONL或SQLite，供分析程序直接读取")
+    add_common(p)
+    p.add_argument("output", nargs="+",
+                   help="输出文件，可指定多个（一次解析同时写入）：.db/.sqlite 为SQLite，其余为JSONL，"
+                        ".jsonl.gz/.jsonl.xz 压缩")
+    p.add_argument("--format", choices=EXPORT_FORMATS, help="统一使用的格式，默认按文件名判断")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--snapshot", metavar="SNAPSHOT", help="导出指定的一次采集（result_目录名），默认为最新的一次")
+    group.add_argument("--all-snapshots", action="store_true", help="导出全部采集，记录中的snapshot区分各次采集")
+    p.add_argument("--progress", action="store_true", help="在标准错误输出中定期显示进度")
+    p.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, "func", None):
+        parser.print_help(sys.stderr)
+        return EXIT_USAGE
+    if not (os.path.isdir(args.root) or is_archive(args.root)):
+        log_stderr(f"采集日志目录或压缩包不存在: {args.root}")
+        return EXIT_USAGE
+    if getattr(args, "bundle", None) and bundle_format(args.bundle) is None:
+        log_stderr(f"不支持的日志包格式: {args.bundle}")
+        return EXIT_USAGE
+    if getattr(args, "by_command_csv", False) and not args.by_command:
+        log_stderr("--by-command-csv 需要与 --by-command 同时使用")
+        return EXIT_USAGE
+    if getattr(args, "jobs", 1) < 1:
+        log_stderr("并行进程数必须大于0")
+        return EXIT_USAGE
+    stats = RunStats(args.command) if args.profile_report else None
+    with profiled(args.cprofile):
+        code = args.func(args, stats)
+    if stats is not None:
+        save_report(args.profile_report,
+                    stats.report(root=os.path.abspath(args.root), jobs=getattr(args, "jobs", None)))
+    return code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
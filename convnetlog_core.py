@@ -0,0 +1,1792 @@
+"""网络日志采集结果的解析与转换（不依赖PyQt5，可在无界面环境使用）"""
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import sys
+import pathlib
+import re
+import shutil
+import signal
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as et
+import zipfile
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from xml.parsers import expat
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing.util import Finalize
+from datetime import datetime
+
+from convnetlog_fs import (
+    ArchivePath, as_path, close_archives, collection_root, fs_exists, fs_open, fs_scandir, fs_stat, record_path,
+    relative_key, sidecar_path
+)
+from convnetlog_profile import RunStats
+
+# ssh_<ip>_<后缀>.xml，后缀一般为设备名称或SN
+SSH_RESULT_PATTERN = re.compile(r"ssh_(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})_([-0-9a-zA-Z_]*)\.xml")
+
+class ResultResolver:
+    """结果文件定位：每个cmdsResult/network目录只扫描一次，按文件名中的IP建立索引
+
+    传入RunStats时统计目录扫描与文件名匹配（match_result_files 阶段）。
+    """
+
+    def __init__(self, stats=None):
+        self._dirs = {}
+        self.stats = stats
+
+    def clear(self):
+        self._dirs.clear()
+
+    def forget(self, cmds_result_path):
+        """目录中的结果文件有增减时丢弃其索引，下次用到时重新扫描该目录"""
+        self._dirs.pop(str(cmds_result_path), None)
+
+    def _index(self, cmds_result_path):
+        key = str(cmds_result_path)
+        index = self._dirs.get(key)
+        if index is None:
+            start = time.perf_counter()
+            index = {}
+            entries = 0
+            if fs_exists(cmds_result_path):
+                for entry in fs_scandir(cmds_result_path):
+                    entries += 1
+                    m = SSH_RESULT_PATTERN.fullmatch(entry.name)
+                    if m:
+                        index.setdefault(m.group(1), []).append((m.group(2), as_path(entry.path)))
+            for files in index.values():
+                files.sort()
+            self._dirs[key] = index
+            if self.stats is not None:
+                self.stats.add("match_result_files", time.perf_counter() - start, entries=entries,
+                               result_files=sum(map(len, index.values())))
+        return index
+
+    def files_for(self, device):
+        """返回属于该设备的结果文件列表"""
+        cmds_result_path = as_path(device.path).parent.joinpath("cmdsResult", "network")
+        candidates = self._index(cmds_result_path).get(device.ip, [])
+        if len(candidates) > 1:
+            # 同一IP有多个文件时，用设备名称/SN区分：后缀中以 -/_ 分隔的完整一段须与名称或SN相同
+            # （不能只看是否包含，否则 SW1 会匹配到 SW10 的文件），都不匹配时返回全部文件
+            matched = [p for suffix, p in candidates if _suffix_matches(suffix, device)]
+            if matched:
+                return matched
+        return [p for suffix, p in candidates]
+
+def _suffix_matches(suffix, device):
+    """结果文件名后缀中是否有与设备名称或SN完全相同、前后为开头/结尾或 -/_ 的一段"""
+    for key in (device.name, device.sn):
+        if not key:
+            continue
+        start = suffix.find(key)
+        while start >= 0:
+            end = start + len(key)
+            if (start == 0 or suffix[start - 1] in "-_") and (end == len(suffix) or suffix[end] in "-_"):
+                return True
+            start = suffix.find(key, start + 1)
+    return False
+
+def iter_command_echo(source):
+    """流式解析结果文件，依次产出 (命令, 回显)
+
+    command 与其后紧邻的 echo 兄弟节点配对；后面没有 echo 的命令回显为 None。
+    已处理的节点会立即清除，内存占用与文件大小无关。
+    """
+    if isinstance(source, ArchivePath):
+        with source.open() as f:
+            yield from iter_command_echo(f)
+        return
+    stack = []
+    pending = None  # (命令文本, 所在层级)
+    for event, elem in et.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if pending is not None and pending[1] == len(stack) and elem.tag != "echo":
+                yield pending[0], None
+                pending = None
+            stack.append(elem)
+            continue
+        stack.pop()
+        depth = len(stack)
+        if pending is not None and depth < pending[1]:
+            # 父节点结束，命令后面没有echo
+            yield pending[0], None
+            pending = None
+        if elem.tag == "command":
+            if pending is not None:
+                yield pending[0], None
+            pending = (elem.text, depth) if elem.text else None
+        elif elem.tag == "echo" and pending is not None and pending[1] == depth:
+            yield pending[0], elem.text or ""
+            pending = None
+        # 释放已处理的节点
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+    if pending is not None:
+        yield pending[0], None
+
+class EchoStore:
+    """内容寻址的echo正文存储
+
+    以正文内容为键（字符串哈希只计算一次并缓存在对象上），相同内容只保留一个对象，
+    按引用计数释放。线程安全。
+    """
+
+    def __init__(self):
+        self._entries = {}   # 内容 -> [规范对象, 引用数]
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def intern(self, text):
+        """返回与text内容相同的共享对象"""
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is None:
+                entry = self._entries[text] = [text, 0]
+                self.nbytes += sys.getsizeof(text) + 64
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, text):
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._entries[text]
+                    self.nbytes -= sys.getsizeof(text) + 64
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+def echo_log_body(echo):
+    """echo转换为日志正文：去掉首行（提示符和命令）与末行（提示符）"""
+    echo_list = echo.strip().split("\n")
+    if len(echo_list) > 2:
+        return "\n".join(echo_list[1:len(echo_list) - 1]) + "\n"
+    return ""
+
+class Echo:
+    """拆分后的echo：首行（提示符和命令）、正文、末行（提示符）
+
+    提示符中带有设备名，只有正文在设备间可能完全相同，传入EchoStore时正文放入共享存储。
+    不足三行时正文为None，只有一行时末行也为None。
+    """
+    __slots__ = ("head", "body", "tail")
+
+    def __init__(self, text, store=None):
+        text = text.strip()
+        first = text.find("\n")
+        last = text.rfind("\n")
+        if first < 0:
+            self.head, self.body, self.tail = text, None, None
+        elif first == last:
+            self.head, self.body, self.tail = text[:first], None, text[last + 1:]
+        else:
+            body = text[first + 1:last]
+            self.head, self.tail = text[:first], text[last + 1:]
+            self.body = store.intern(body) if store is not None else body
+
+    def text(self):
+        """去掉首尾空白后的完整echo"""
+        parts = [self.head]
+        if self.body is not None:
+            parts.append(self.body)
+        if self.tail is not None:
+            parts.append(self.tail)
+        return "\n".join(parts)
+
+    def log_body(self):
+        """与 echo_log_body 相同"""
+        return self.body + "\n" if self.body is not None else ""
+
+    @property
+    def nbytes(self):
+        """不含正文的占用"""
+        return 72 + sys.getsizeof(self.head) + (sys.getsizeof(self.tail) if self.tail is not None else 0)
+
+class ParsedResult:
+    """单个结果文件的解析结果：按顺序的 (命令, Echo) 列表及命令到Echo的映射，没有echo的命令为None
+
+    传入EchoStore时echo正文放入共享存储，nbytes 不计正文本身（由存储统计）。
+    """
+    __slots__ = ("pairs", "by_command", "nbytes")
+
+    def __init__(self, pairs, store=None):
+        pairs = [(command, Echo(echo, store) if echo is not None else None) for command, echo in pairs]
+        self.pairs = pairs
+        self.by_command = {}
+        nbytes = sys.getsizeof(pairs)
+        for command, echo in pairs:
+            self.by_command.setdefault(command, []).append(echo)
+            nbytes += sys.getsizeof(command) + 64
+            if echo is not None:
+                nbytes += echo.nbytes
+                if store is None and echo.body is not None:
+                    nbytes += sys.getsizeof(echo.body)
+        self.nbytes = nbytes
+
+    def release(self, store):
+        for command, echo in self.pairs:
+            if echo is not None and echo.body is not None:
+                store.release(echo.body)
+
+# 解析结果缓存默认内存预算
+RESULT_CACHE_BYTES = 256 * 1024 * 1024
+
+class ResultCache:
+    """已解析结果文件的LRU缓存
+
+    以 (路径, mtime, size) 判断是否失效，总占用超过内存预算时淘汰最久未使用的文件。
+    echo正文保存在内容寻址的 echoes 中，多台设备相同的输出只占一份内存。
+    界面与转换线程共用，内部加锁。
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.echoes = EchoStore()
+        self._entries = OrderedDict()  # 路径 -> (mtime, size, ParsedResult)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.echoes.clear()
+
+    def peek(self, path):
+        """只查缓存，未命中或已失效返回None"""
+        st = fs_stat(path)
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(key)
+                return entry[2]
+        return None
+
+    def _drop(self, result):
+        self._bytes -= result.nbytes
+        result.release(self.echoes)
+
+    def get(self, path):
+        """返回文件的ParsedResult，未命中时解析并放入缓存"""
+        result = self.peek(path)
+        if result is not None:
+            return result
+        st = fs_stat(path)
+        result = ParsedResult(list(iter_command_echo(path)), self.echoes)
+        key = str(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._drop(old[2])
+            self._entries[key] = (st.st_mtime_ns, st.st_size, result)
+            self._bytes += result.nbytes
+            while self._bytes + self.echoes.nbytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._drop(evicted[2])
+        return result
+
+class DeviceRecord:
+    """设备记录，collected 为所在cmd_info文件名中的采集时间"""
+    __slots__ = ("name", "ip", "sn", "state", "path", "collected")
+
+    def __init__(self, name, ip, sn, state, path, collected=""):
+        self.name = name
+        self.ip = ip
+        self.sn = sn
+        self.state = state
+        self.path = path
+        self.collected = collected
+
+    @property
+    def key(self):
+        return (self.name, self.ip, self.sn)
+
+    @property
+    def rank(self):
+        """合并重复设备时的优先级：采集成功优先，其次采集时间较新"""
+        return (self.state == "成功", self.collected)
+
+    def to_dict(self):
+        return {slot: str(getattr(self, slot)) for slot in self.__slots__}
+
+    def copy(self):
+        return DeviceRecord(self.name, self.ip, self.sn, self.state, self.path, self.collected)
+
+    def __repr__(self):
+        return f"DeviceRecord({self.name!r}, {self.ip!r}, {self.sn!r}, {self.state!r})"
+
+class DeviceRegistry:
+    """设备登记表
+
+    以 (名称, IP, SN) 为键的哈希索引去重，并提供按IP、按SN的查找。同一设备出现在多个
+    cmd_info文件中时保留采集成功且时间最新的一条，原记录对象原地更新。
+    """
+    ADDED = "added"
+    UPDATED = "updated"
+    DUPLICATE = "duplicate"
+
+    def __init__(self, records=()):
+        self._records = []
+        self._by_key = {}
+        self._by_ip = {}
+        self._by_sn = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def clear(self):
+        self._records.clear()
+        self._by_key.clear()
+        self._by_ip.clear()
+        self._by_sn.clear()
+
+    def get(self, name, ip, sn):
+        return self._by_key.get((name, ip, sn))
+
+    def by_ip(self, ip):
+        return self._by_ip.get(ip, [])
+
+    def by_sn(self, sn):
+        return self._by_sn.get(sn, [])
+
+    def add(self, record):
+        """登记设备，返回 (登记后的记录, ADDED/UPDATED/DUPLICATE)"""
+        existing = self._by_key.get(record.key)
+        if existing is None:
+            self._records.append(record)
+            self._by_key[record.key] = record
+            self._by_ip.setdefault(record.ip, []).append(record)
+            self._by_sn.setdefault(record.sn, []).append(record)
+            return record, self.ADDED
+        if record.rank > existing.rank:
+            existing.state = record.state
+            existing.path = record.path
+            existing.collected = record.collected
+            return existing, self.UPDATED
+        return existing, self.DUPLICATE
+
+def _collected_time(path):
+    """cmd_info_<14位时间>.xml 中的采集时间"""
+    m = re.search(r"cmd_info_(\d{14})", as_path(path).name)
+    return m.group(1) if m else ""
+
+def read_cmd_info(path):
+    """解析cmd_info_*.xml，返回其中信息完整的设备记录列表"""
+    devices = []
+    resolved = record_path(path)
+    collected = _collected_time(path)
+    with fs_open(path) as f:
+        root = et.parse(f).getroot()
+    for device in root.findall("device"):
+        name_elem = device.find("name")
+        ip_elem = device.find("ip")
+        sn_elem = device.find("sn")
+        state_elem = device.find("state")
+        
+        # 检查元素是否存在且不为None
+        if (name_elem is not None and name_elem.text and
+            ip_elem is not None and ip_elem.text and
+            sn_elem is not None and sn_elem.text and
+            state_elem is not None and state_elem.text):
+            
+            devices.append(DeviceRecord(name_elem.text.strip(), ip_elem.text.strip(), sn_elem.text.strip(),
+                                        state_elem.text.strip(), resolved, collected))
+    return devices
+
+CMD_INFO_PATTERN = re.compile(r"cmd_info_\d{14}\.xml")
+RESULT_DIR_PATTERN = re.compile(r"result_\d{18}")
+
+def _result_dirs(brain_collect):
+    """产出BrainCollect下的 (采集时间, result_子目录名, 路径)"""
+    for d in fs_scandir(brain_collect):
+        if d.is_dir() and RESULT_DIR_PATTERN.fullmatch(d.name):
+            try:
+                dt = datetime.strptime(d.name[7:21], "%Y%m%d%H%M%S")
+            except ValueError:
+                continue
+            yield dt, d.name, d.path
+
+def _latest_result_dir(brain_collect):
+    """返回BrainCollect下时间最新的result_子目录"""
+    latest = max(_result_dirs(brain_collect), default=None, key=lambda item: (item[0], item[1]))
+    return latest[2] if latest is not None else None
+
+def _snapshot_dir(brain_collect, snapshot):
+    """BrainCollect下名为snapshot的result_子目录，不存在时为None"""
+    for dt, name, path in _result_dirs(brain_collect):
+        if name == snapshot:
+            return path
+    return None
+
+def choose_result_dir(brain_collect, snapshot=None):
+    """BrainCollect下要读取的result_子目录：snapshot为None时是最新的一次，否则为同名的一次，没有时为None"""
+    if snapshot is None:
+        return _latest_result_dir(brain_collect)
+    return _snapshot_dir(brain_collect, snapshot)
+
+def _scan_dir(path, snapshot=None):
+    """扫描单个目录，返回 (待遍历的子目录, cmd_info文件)
+
+    BrainCollect只进入一个result_子目录（见 choose_result_dir）。
+    """
+    subdirs = []
+    files = []
+    for entry in fs_scandir(path):
+        if entry.is_dir():
+            if entry.name == "BrainCollect":
+                result_dir = choose_result_dir(entry.path, snapshot)
+                if result_dir:
+                    subdirs.append(result_dir)
+            else:
+                subdirs.append(entry.path)
+        elif CMD_INFO_PATTERN.fullmatch(entry.name):
+            files.append(entry.path)
+    return subdirs, files
+
+def _scan_dir_stats(path, stats, snapshot=None):
+    if stats is None:
+        return _scan_dir(path, snapshot)
+    with stats.timed("scan_dir") as record:
+        subdirs, files = _scan_dir(path, snapshot)
+        record["cmd_info_files"] = len(files)
+    return subdirs, files
+
+class Snapshot:
+    """一次采集：各BrainCollect目录下同名的 result_<18位> 子目录"""
+    __slots__ = ("name", "time", "dirs")
+
+    def __init__(self, name, time, dirs=()):
+        self.name = name
+        self.time = time
+        self.dirs = list(dirs)
+
+    @property
+    def label(self):
+        return self.time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def to_dict(self):
+        return {"name": self.name, "time": self.time.isoformat(), "dirs": [str(d) for d in self.dirs]}
+
+    def __repr__(self):
+        return f"Snapshot({self.name!r})"
+
+def find_snapshots(dirname, log=None, stopped=None):
+    """列出采集目录中的全部采集（BrainCollect下的result_子目录），按时间从新到旧排列
+
+    只遍历到BrainCollect为止，不进入result_子目录，也不读取cmd_info文件。
+    """
+    root = collection_root(dirname)
+    if not isinstance(root, ArchivePath):
+        root = str(root)
+    snapshots = {}
+    stack = [root]
+    while stack:
+        if stopped is not None and stopped():
+            break
+        path = stack.pop()
+        try:
+            for entry in fs_scandir(path):
+                if not entry.is_dir():
+                    continue
+                if entry.name != "BrainCollect":
+                    stack.append(entry.path)
+                    continue
+                for dt, name, result_dir in _result_dirs(entry.path):
+                    snapshot = snapshots.get(name)
+                    if snapshot is None:
+                        snapshot = snapshots[name] = Snapshot(name, dt)
+                    snapshot.dirs.append(as_path(result_dir))
+        except OSError as e:
+            if log is not None:
+                log(f"读取目录 {path} 时出错: {e}")
+    return sorted(snapshots.values(), key=lambda snapshot: (snapshot.time, snapshot.name), reverse=True)
+
+def find_cmd_info_files(dirname, workers=1, log=None, stopped=None, stats=None, snapshot=None):
+    """遍历采集目录，产出cmd_info_*.xml文件
+
+    使用os.scandir，目录项类型来自缓存的d_type，无需逐个stat；workers>1 时用线程池
+    并行遍历子目录（适合NFS等高延迟存储）。dirname 也可以是压缩包，此时只读取包内的
+    成员列表，不解压到磁盘。stopped 为返回是否中止的可调用对象；stats 为RunStats（scan_dir 阶段）。
+    snapshot 为result_子目录名，只读取该次采集；默认读取最新的一次。
+    """
+    root = collection_root(dirname)
+    if isinstance(root, ArchivePath):
+        workers = 1   # 包内目录在内存中，无需并行
+    else:
+        root = str(root)
+    if workers <= 1:
+        stack = [root]
+        while stack:
+            if stopped is not None and stopped():
+                return
+            path = stack.pop()
+            try:
+                subdirs, files = _scan_dir_stats(path, stats, snapshot)
+            except OSError as e:
+                if log is not None:
+                    log(f"读取目录 {path} 时出错: {e}")
+                continue
+            yield from map(as_path, files)
+            stack.extend(reversed(subdirs))
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir_stats, root, stats, snapshot)}
+        try:
+            while pending:
+                if stopped is not None and stopped():
+                    return
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        subdirs, files = future.result()
+                    except OSError as e:
+                        if log is not None:
+                            log(f"读取目录时出错: {e}")
+                        continue
+                    yield from map(as_path, files)
+                    for d in subdirs:
+                        pending.add(pool.submit(_scan_dir_stats, d, stats, snapshot))
+        finally:
+            for future in pending:
+                future.cancel()
+
+def iter_devices(dirname, index=None, log=None, workers=1, stopped=None, registry=None, stats=None, snapshot=None):
+    """边遍历采集目录边登记设备，产出 (设备记录, 登记结果)，不产出重复的设备
+
+    登记结果为 DeviceRegistry.ADDED 或 UPDATED（已登记的设备被更优的记录原地更新）。
+    index为CollectionIndex时复用索引。stats 为RunStats（scan_dir、parse_cmd_info 阶段）。
+    snapshot 为result_子目录名，默认为最新的一次采集。
+    """
+    if registry is None:
+        registry = DeviceRegistry()
+    for p in find_cmd_info_files(dirname, workers, log, stopped, stats, snapshot):
+        start = time.perf_counter()
+        try:
+            devices = index.devices(p) if index is not None else read_cmd_info(p)
+        except Exception as e:
+            if log is not None:
+                log(f"解析文件 {p} 时出错: {e}")
+            continue
+        if stats is not None:
+            stats.add("parse_cmd_info", time.perf_counter() - start, bytes_read=fs_stat(p).st_size,
+                      devices=len(devices))
+        for device_info in devices:
+            device, status = registry.add(device_info)
+            if status == DeviceRegistry.DUPLICATE:
+                if log is not None:
+                    log(f"设备已存在，跳过: {device.name} - {device.ip}")
+                continue
+            if log is not None:
+                if status == DeviceRegistry.ADDED:
+                    log(f"发现设备: {device.name} - {device.ip} - {device.sn} - {device.state}")
+                else:
+                    log(f"更新设备: {device.name} - {device.ip} - {device.state}（{p.name}）")
+            yield device, status
+
+def discover_devices(dirname, index=None, log=None, workers=1, stopped=None, stats=None, snapshot=None):
+    """解析采集目录（默认为最新的一次采集），返回DeviceRegistry"""
+    registry = DeviceRegistry()
+    for device, status in iter_devices(dirname, index, log, workers, stopped, registry, stats, snapshot):
+        pass
+    return registry
+
+class _EchoOffsetScanner:
+    """用expat扫描结果文件，记录每个命令及其后紧邻echo内容的字节偏移和长度"""
+
+    def __init__(self):
+        self.encoding = "utf-8"
+        self.entries = []       # (命令, echo偏移, echo长度)，没有echo时偏移为None
+        self._depth = 0
+        self._pending = None    # (命令文本, 所在层级)
+        self._cmd_depth = None
+        self._cmd_parts = []
+        self._echo_depth = None
+        self._echo_start = None
+        self.parser = expat.ParserCreate()
+        self.parser.XmlDeclHandler = self._xml_decl
+        self.parser.StartElementHandler = self._start
+        self.parser.EndElementHandler = self._end
+
+    def scan(self, path):
+        with fs_open(path) as f:
+            self.parser.ParseFile(f)
+        if self._pending is not None:
+            self.entries.append((self._pending[0], None, 0))
+            self._pending = None
+        return self.entries
+
+    def _xml_decl(self, version, encoding, standalone):
+        if encoding:
+            self.encoding = encoding
+
+    def _start(self, name, attrs):
+        depth = self._depth
+        if self._pending is not None and self._pending[1] == depth:
+            if name == "echo":
+                self._echo_depth = depth
+                self._echo_start = None
+                # 只需要echo内容的起始位置，拿到后即取消字符回调
+                self.parser.CharacterDataHandler = self._echo_begin
+                self.parser.StartCdataSectionHandler = self._echo_begin
+            else:
+                self.entries.append((self._pending[0], None, 0))
+                self._pending = None
+        if name == "command":
+            self._cmd_depth = depth
+            self._cmd_parts = []
+            self.parser.CharacterDataHandler = self._cmd_parts.append
+        self._depth += 1
+
+    def _end(self, name):
+        self._depth -= 1
+        depth = self._depth
+        if self._pending is not None and depth < self._pending[1]:
+            # 父节点结束，命令后面没有echo
+            self.entries.append((self._pending[0], None, 0))
+            self._pending = None
+        if name == "command" and depth == self._cmd_depth:
+            self.parser.CharacterDataHandler = None
+            self._cmd_depth = None
+            if self._pending is not None:
+                self.entries.append((self._pending[0], None, 0))
+            text = "".join(self._cmd_parts)
+            self._pending = (text, depth) if text else None
+        elif name == "echo" and depth == self._echo_depth:
+            self.parser.CharacterDataHandler = None
+            self.parser.StartCdataSectionHandler = None
+            end = self.parser.CurrentByteIndex
+            start = end if self._echo_start is None else self._echo_start
+            self.entries.append((self._pending[0], start, end - start))
+            self._pending = None
+            self._echo_depth = None
+
+    def _echo_begin(self, *args):
+        if self._echo_start is None:
+            self._echo_start = self.parser.CurrentByteIndex
+        self.parser.CharacterDataHandler = None
+        self.parser.StartCdataSectionHandler = None
+
+# echo内容摘要的字节数（blake2b）
+ECHO_DIGEST_SIZE = 16
+
+_ASCII_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+def _echo_body_range(data, start, end):
+    """echo原始字节中正文的范围：去掉首尾空白后首行与末行之间（含首行末尾的换行符）
+
+    不足三行时为空范围，与只有空行正文的echo（仅一个换行符）区分。
+    """
+    while start < end and data[start] in _ASCII_WHITESPACE:
+        start += 1
+    while end > start and data[end - 1] in _ASCII_WHITESPACE:
+        end -= 1
+    first = data.find(b"\n", start, end)
+    if first < 0:
+        return start, start
+    return first, data.rfind(b"\n", start, end)
+
+def echo_digests(path, entries):
+    """按 (命令, 偏移, 长度) 计算每段echo正文原始字节的摘要，没有echo的命令为None
+
+    首尾两行的提示符中带有设备名，不参与计算，因此不同设备上相同的输出摘要相同。
+    """
+    def digest_all(data, view):
+        digests = []
+        for command, offset, length in entries:
+            if offset is None:
+                digests.append(None)
+                continue
+            start, end = _echo_body_range(data, offset, offset + length)
+            digests.append(hashlib.blake2b(view[start:end], digest_size=ECHO_DIGEST_SIZE).hexdigest())
+        return digests
+
+    if isinstance(path, ArchivePath):
+        # 压缩包成员不能映射到内存，整体读出（单个结果文件）
+        with path.open() as f:
+            data = f.read()
+        return digest_all(data, memoryview(data))
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [None] * len(entries)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return digest_all(mm, view)
+            finally:
+                view.release()
+
+def read_echo_at(path, offset, length, encoding="utf-8"):
+    """按字节偏移直接读取一段echo内容并还原转义字符"""
+    with fs_open(path) as f:
+        f.seek(offset)
+        raw = f.read(length)
+    text = raw.decode(encoding)
+    if "&" in text or "<" in text:
+        text = et.fromstring(f"<echo>{text}</echo>").text or ""
+    return text
+
+def stream_echo_at(path, offset, length, encoding="utf-8", write=None, strip=False, chunk_size=1024 * 1024):
+    """按字节偏移分块读取一段echo内容，还原转义字符后逐段交给write，内存占用与echo大小无关
+
+    strip=True 时去掉首尾空白（与 str.strip() 结果相同）。
+    """
+    parser = expat.ParserCreate(encoding)
+    pending = []         # strip时暂存的空白，后面有非空白内容才写出
+    started = [not strip]
+
+    def on_data(text):
+        if not strip:
+            write(text)
+            return
+        if not started[0]:
+            text = text.lstrip()
+            if not text:
+                return
+            started[0] = True
+        body = text.rstrip()
+        if body:
+            if pending:
+                write("".join(pending))
+                pending.clear()
+            write(body)
+        tail = text[len(body):]
+        if tail:
+            pending.append(tail)
+
+    parser.CharacterDataHandler = on_data
+    parser.Parse(b"<echo>", False)
+    with fs_open(path) as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            parser.Parse(data, False)
+    parser.Parse(b"</echo>", True)
+
+class OutputStore:
+    """命令输出的只读存储（UTF-8）
+
+    内容较小时保存在内存中，超过 SPOOL_BYTES 后转存到临时文件，完成后用mmap读取，
+    按需取出以行为边界的分块，并支持在整个输出中查找。
+    """
+    SPOOL_BYTES = 4 * 1024 * 1024
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._data = None
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer.write(data)
+            if self._buffer.tell() > self.SPOOL_BYTES:
+                self._file = tempfile.TemporaryFile()
+                self._file.write(self._buffer.getvalue())
+                self._buffer = None
+        self.size += len(data)
+
+    def finish(self):
+        """写入完成，之后只能读取"""
+        if self._data is not None:
+            return
+        if self._file is not None and self.size:
+            self._file.flush()
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = self._buffer.getvalue() if self._buffer is not None else b""
+            self._buffer = None
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read_chunk(self, offset, max_bytes=256 * 1024):
+        """从offset开始读取不超过max_bytes的内容，尽量在行尾截断，返回 (文本, 下一块偏移)"""
+        self.finish()
+        data = self._data
+        end = min(self.size, offset + max_bytes)
+        if end < self.size:
+            newline = data.rfind(b"\n", offset, end)
+            if newline >= 0:
+                end = newline + 1
+            else:
+                # 单行过长时避免截断在多字节字符中间
+                while end > offset and (data[end] & 0xC0) == 0x80:
+                    end -= 1
+        return data[offset:end].decode("utf-8", errors="replace"), end
+
+    def decoded_length(self, start, end):
+        """start到end之间的字节解码后的UTF-16长度（Qt文档中的位置单位）"""
+        self.finish()
+        text = self._data[start:end].decode("utf-8", errors="replace")
+        return len(text.encode("utf-16-le")) // 2
+
+    def find(self, needle, start=0, case_sensitive=False):
+        """从字节偏移start开始查找，返回匹配的 (起始字节, 结束字节)，找不到返回None"""
+        self.finish()
+        if not needle:
+            return None
+        pattern = re.compile(re.escape(needle.encode("utf-8")), 0 if case_sensitive else re.IGNORECASE)
+        m = pattern.search(self._data, start)
+        return (m.start(), m.end()) if m else None
+
+# 采集目录下的索引文件名
+INDEX_FILE_NAME = ".convnetlog_index.sqlite"
+
+class CollectionIndex:
+    """采集目录的持久化索引（SQLite）
+
+    记录cmd_info文件中的设备、结果文件中的命令列表及每个echo内容的字节偏移/长度和正文摘要，
+    以文件的 mtime/size 逐个判断是否需要重新解析。结果文件在首次用到时才建立索引。
+    传入RunStats时统计结果文件的扫描（index_scan 阶段）。
+    """
+    SCHEMA_VERSION = "2"
+
+    def __init__(self, root, stats=None):
+        self.stats = stats
+        root = collection_root(root)
+        self.root = root if isinstance(root, ArchivePath) else root.resolve()
+        # 压缩包的索引保存在压缩包旁边
+        self.db_path = sidecar_path(self.root, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != self.SCHEMA_VERSION:
+                for table in ("files", "devices", "commands"):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (self.SCHEMA_VERSION,))
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                               "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, encoding TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS devices ("
+                               "file TEXT, seq INTEGER, name TEXT, ip TEXT, sn TEXT, state TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS commands ("
+                               "file TEXT, seq INTEGER, command TEXT, offset INTEGER, length INTEGER, digest TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS devices_file ON devices (file, seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS commands_file ON commands (file, seq)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, path):
+        return relative_key(self.root, path)
+
+    def _lookup(self, key, st):
+        """文件未变化时返回记录的编码，否则返回None"""
+        row = self._conn.execute("SELECT mtime, size, encoding FROM files WHERE path = ?", (key,)).fetchone()
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            return row[2]
+        return None
+
+    def _replace_file(self, key, st, encoding):
+        self._conn.execute("DELETE FROM devices WHERE file = ?", (key,))
+        self._conn.execute("DELETE FROM commands WHERE file = ?", (key,))
+        self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                           (key, st.st_mtime_ns, st.st_size, encoding))
+
+    def devices(self, path):
+        """返回cmd_info文件的设备列表，文件有变化时重新解析并更新索引"""
+        key = self._key(path)
+        st = fs_stat(path)
+        with self._lock:
+            if self._lookup(key, st) is not None:
+                resolved = record_path(path)
+                collected = _collected_time(path)
+                rows = self._conn.execute("SELECT name, ip, sn, state FROM devices WHERE file = ? ORDER BY seq",
+                                          (key,)).fetchall()
+                return [DeviceRecord(name, ip, sn, state, resolved, collected) for name, ip, sn, state in rows]
+        devices = read_cmd_info(path)
+        with self._lock, self._conn:
+            self._replace_file(key, st, "")
+            self._conn.executemany("INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(key, seq, d.name, d.ip, d.sn, d.state)
+                                    for seq, d in enumerate(devices)])
+        return devices
+
+    def commands(self, path):
+        """返回结果文件的 (编码, [(命令, echo偏移, echo长度)])，文件有变化时重新扫描"""
+        encoding, entries = self.entries(path)
+        return encoding, [entry[:3] for entry in entries]
+
+    def entries(self, path):
+        """返回结果文件的 (编码, [(命令, echo偏移, echo长度, echo摘要)])，文件有变化时重新扫描"""
+        key = self._key(path)
+        st = fs_stat(path)
+        with self._lock:
+            encoding = self._lookup(key, st)
+            if encoding is not None:
+                rows = self._conn.execute("SELECT command, offset, length, digest FROM commands "
+                                          "WHERE file = ? ORDER BY seq", (key,)).fetchall()
+                return encoding, rows
+        start = time.perf_counter()
+        scanner = _EchoOffsetScanner()
+        entries = scanner.scan(path)
+        entries = [entry + (digest,) for entry, digest in zip(entries, echo_digests(path, entries))]
+        if self.stats is not None:
+            self.stats.add("index_scan", time.perf_counter() - start, bytes_read=st.st_size, commands=len(entries))
+        with self._lock, self._conn:
+            self._replace_file(key, st, scanner.encoding)
+            self._conn.executemany("INSERT INTO commands VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(key, seq) + entry for seq, entry in enumerate(entries)])
+        return scanner.encoding, entries
+
+    def read_echoes(self, path, command):
+        """读取结果文件中某条命令的全部echo，没有echo的命令返回None"""
+        encoding, entries = self.commands(path)
+        return [read_echo_at(path, offset, length, encoding) if offset is not None else None
+                for cmd, offset, length in entries if cmd == command]
+
+def group_devices_by_output(devices, resolver, command, index=None, cache=None, stopped=None):
+    """按某条命令的输出对设备分组，输出完全相同的设备为一组
+
+    只比较echo正文（不含带设备名的提示符行）：有索引时比较索引中的正文摘要，不读取echo内容；
+    否则比较缓存中共享的正文对象。
+    返回按设备数从多到少排列的分组（设备列表），没有执行该命令的设备不参与分组。
+    """
+    if index is None and cache is None:
+        cache = ResultCache()
+    groups = {}
+    for device in devices:
+        if stopped is not None and stopped():
+            break
+        key = []
+        for p in resolver.files_for(device):
+            if index is not None:
+                key.extend(digest for cmd, offset, length, digest in index.entries(p)[1] if cmd == command)
+            else:
+                key.extend(echo.body if echo is not None else False
+                           for echo in cache.get(p).by_command.get(command, ()))
+        if key:
+            groups.setdefault(tuple(key), []).append(device)
+    return sorted(groups.values(), key=len, reverse=True)
+
+class LoadCancelled(Exception):
+    """查看命令输出的加载被中止（已被新的请求取代）"""
+
+def device_commands(device, resolver, index=None, cache=None):
+    """设备全部结果文件中的命令列表（去重，保持首次出现的顺序）
+
+    有索引时从索引读取，否则从cache（ResultCache）读取解析结果。
+    """
+    commands = []
+    seen = set()
+    for p in resolver.files_for(device):
+        if index is not None:
+            file_commands = [cmd for cmd, offset, length in index.commands(p)[1]]
+        else:
+            file_commands = cache.get(p).by_command
+        for command in file_commands:
+            if command not in seen:
+                seen.add(command)
+                commands.append(command)
+    return commands
+
+def load_command_output(device, command, resolver, index=None, cache=None, stopped=None):
+    """把设备某条命令的全部输出写入新的OutputStore，返回写入完成的存储；设备没有执行该命令时返回None
+
+    有索引时按字节位置分块读取echo，不解析XML；否则使用cache中的解析结果。
+    stopped 为返回是否中止的可调用对象，每写入一块检查一次，中止时关闭存储并抛出LoadCancelled。
+    """
+    store = OutputStore()
+
+    def write(text):
+        if stopped is not None and stopped():
+            raise LoadCancelled()
+        store.write(text)
+
+    found = False
+    try:
+        for p in resolver.files_for(device):
+            if index is not None:
+                encoding, entries = index.commands(p)
+                for cmd, offset, length in entries:
+                    if cmd == command:
+                        found = True
+                        write(f"命令: {command}\n执行结果:\n")
+                        if offset is not None:
+                            stream_echo_at(p, offset, length, encoding, write, strip=True)
+                        write("\n" + "-" * 50 + "\n")
+            else:
+                for echo in cache.get(p).by_command.get(command, ()):
+                    found = True
+                    echo_text = echo.text() if echo is not None else ""
+                    write(f"命令: {command}\n执行结果:\n{echo_text}\n" + "-" * 50 + "\n")
+    except BaseException:
+        store.close()
+        raise
+    if not found:
+        store.close()
+        return None
+    store.finish()
+    return store
+
+def write_device_log(f, device_name, files, log=None, cache=None, stats=None, stopped=None, pivot=None):
+    """把设备的结果文件依次转换为H3C风格文本写入f，边解析边写出
+
+    传入cache时优先使用已缓存的解析结果，未命中则直接流式解析，不占用缓存。
+    stats 为RunStats：解析（parse_result，含缓存命中）与写入（write_log）的耗时分别统计。
+    stopped 为返回是否中止的可调用对象，每写完一条命令检查一次，中止时抛出ConversionCancelled。
+    pivot 为可调用对象 pivot(命令, 正文)，每条命令的输出同时交给它（按命令汇总）。
+    """
+    for p in files:
+        if log is not None:
+            log(f"转换文件: {p.name}")
+        cached = cache.peek(p) if cache is not None else None
+        pairs = cached.pairs if cached is not None else iter_command_echo(p)
+        # 每条命令两次计时，开销相对于解析和写入可以忽略
+        parse_seconds = write_seconds = 0.0
+        commands = 0
+        last = time.perf_counter()
+        for command, echo in pairs:
+            if echo is None:
+                continue
+            body = echo.log_body() if cached is not None else echo_log_body(echo)
+            parsed = time.perf_counter()
+            f.write(f"#\n<{device_name}>{command}\n{body}")
+            if pivot is not None:
+                pivot(command, body)
+            written = time.perf_counter()
+            parse_seconds += parsed - last
+            write_seconds += written - parsed
+            last = written
+            commands += 1
+            if stopped is not None and stopped():
+                raise ConversionCancelled()
+        if stats is not None:
+            stats.add("parse_result", parse_seconds, bytes_read=fs_stat(p).st_size, commands=commands,
+                      cached=int(cached is not None))
+            stats.add("write_log", write_seconds, calls=0)
+
+# 转换程序版本，输出格式变化时递增，清单中版本不同的输出全部重新生成
+CONVERTER_VERSION = "1"
+
+# 输出目录中的转换清单文件名
+MANIFEST_FILE_NAME = ".convnetlog_manifest.json"
+
+# 输出文件的写缓冲区大小，合并小块写入（网络共享上小块写入的开销很大）
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# 写入过程中输出文件的临时后缀
+PARTIAL_SUFFIX = ".part"
+
+# 单个设备日志的压缩方式 -> 文件名后缀
+COMPRESSIONS = {None: "", "gz": ".gz", "xz": ".xz"}
+
+def output_file_name(device, compression=None):
+    return f"{device.name}.log{COMPRESSIONS[compression]}"
+
+@contextlib.contextmanager
+def open_log_output(file_name, compression=None):
+    """打开日志输出文件（文本），使用大块写缓冲；compression 为 gz/xz 时流式压缩写出
+
+    压缩后的文件可直接用 zcat/xzcat 等工具读取，解压后的内容与未压缩的 .log 相同。
+    """
+    name = os.path.basename(str(file_name))
+    if name.endswith(PARTIAL_SUFFIX):
+        name = name[:-len(PARTIAL_SUFFIX)]
+    with open(file_name, "wb", buffering=WRITE_BUFFER_BYTES) as raw:
+        if compression == "gz":
+            # gzip头中记录的是解压后的文件名
+            stream = gzip.GzipFile(filename=name[:-3], mode="wb", fileobj=raw, compresslevel=6)
+        elif compression == "xz":
+            stream = lzma.LZMAFile(raw, "wb", preset=6)
+        else:
+            stream = raw
+        text = io.TextIOWrapper(stream, encoding="utf-8")
+        try:
+            yield text
+        finally:
+            # 关闭文本层时会一并关闭压缩层（写出压缩尾部），原始文件由外层with关闭
+            text.close()
+
+# 日志包文件名后缀 -> tarfile写入模式（zip单独处理）
+BUNDLE_FORMATS = {".zip": "zip", ".tar": "w", ".tar.gz": "w:gz", ".tgz": "w:gz", ".tar.xz": "w:xz", ".txz": "w:xz"}
+
+def bundle_format(path):
+    """日志包文件名对应的格式，不支持时返回None"""
+    name = str(path).lower()
+    for suffix, mode in BUNDLE_FORMATS.items():
+        if name.endswith(suffix):
+            return mode
+    return None
+
+class LogBundle:
+    """把所有设备的日志写入单个 zip/tar 包（一次写出，不生成单独的 .log 文件）
+
+    zip成员直接流式压缩写入；tar成员需要事先知道大小，先写入内存（过大时转存临时文件）再加入。
+    写入过程中使用临时文件名，close(True) 时才替换为目标文件。
+    """
+    SPOOL_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.mode = bundle_format(path)
+        if self.mode is None:
+            raise ValueError(f"不支持的日志包格式: {self.path.name}")
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._raw = open(self._tmp, "wb", buffering=WRITE_BUFFER_BYTES)
+        if self.mode == "zip":
+            self._archive = zipfile.ZipFile(self._raw, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(fileobj=self._raw, mode=self.mode)
+
+    def add(self, name, write_log):
+        """添加一个成员，write_log(f) 向文本流f写入日志内容"""
+        if self.mode == "zip":
+            with self._archive.open(name, "w", force_zip64=True) as member:
+                text = io.TextIOWrapper(member, encoding="utf-8")
+                write_log(text)
+                text.flush()
+                text.detach()
+            return
+        with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_BYTES) as spool:
+            text = io.TextIOWrapper(spool, encoding="utf-8")
+            write_log(text)
+            text.flush()
+            text.detach()
+            info = tarfile.TarInfo(name)
+            info.size = spool.tell()
+            info.mtime = int(time.time())
+            spool.seek(0)
+            self._archive.addfile(info, spool)
+
+    def close(self, keep=True):
+        self._archive.close()
+        self._raw.close()
+        if keep:
+            os.replace(self._tmp, self.path)
+        else:
+            os.remove(self._tmp)
+
+# 按命令汇总输出的默认目录（输出目录下）
+PIVOT_DIR_NAME = "by_command"
+
+# 按命令汇总时同时打开的文件数：按打开文件数限制确定，最多 PIVOT_MAX_OPEN_LIMIT，无法取得限制时为 PIVOT_MAX_OPEN
+PIVOT_MAX_OPEN = 64
+PIVOT_MAX_OPEN_LIMIT = 1024
+# 每个文件的写缓冲区大小，打开的文件较多时按总量 PIVOT_BUFFER_TOTAL 平分
+PIVOT_BUFFER_BYTES = 256 * 1024
+PIVOT_BUFFER_TOTAL = 64 * 1024 * 1024
+
+PIVOT_CSV_HEADER = ("device", "ip", "sn", "bytes")
+
+_UNSAFE_FILE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+# 汇总文件写入过程中的临时文件名：<命令>.log.<分片>.part
+_PIVOT_SHARD = re.compile(r"(.+\.(?:log|csv))\.([^.]+)" + re.escape(PARTIAL_SUFFIX))
+
+def pivot_file_name(command):
+    """命令对应的汇总文件名（不含后缀）
+
+    替换文件名中不能使用的字符，有替换或截断时加上命令的摘要，避免不同命令得到相同的文件名。
+    """
+    name = _UNSAFE_FILE_CHARS.sub("_", command).strip().rstrip(".")
+    if name != command or len(name) > 120 or not name:
+        digest = hashlib.blake2b(command.encode("utf-8"), digest_size=4).hexdigest()
+        name = f"{name[:120]}_{digest}"
+    return name
+
+def pivot_max_open():
+    """按命令汇总时同时打开的文件数：取打开文件数软限制的一半（其余留给结果文件、日志等）"""
+    if resource is None:
+        return PIVOT_MAX_OPEN
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (OSError, ValueError):
+        return PIVOT_MAX_OPEN
+    if soft == resource.RLIM_INFINITY:
+        return PIVOT_MAX_OPEN_LIMIT
+    return max(1, min(PIVOT_MAX_OPEN_LIMIT, soft // 2))
+
+class PivotWriter:
+    """按命令汇总设备输出：每条命令一个 <命令>.log，依次追加执行了该命令的各设备的输出（格式与设备日志相同）
+
+    与设备日志在同一次解析中写出。同时打开的文件数不超过 max_open（默认按打开文件数限制确定），
+    最久未写入的文件先关闭，再次写入时以追加方式打开；命令数超过 max_open 时每台设备的每条命令
+    都要重新打开文件，汇总明显变慢。with_csv=True 时同时写 <命令>.csv（设备名、IP、SN、输出字节数）。
+    写入的是带分片名的临时文件，由 finish_pivot() 合并为最终文件：单进程转换时只有一个分片；
+    并行转换时每个子进程一个分片，take_spans() 返回每台设备写入的位置，按设备顺序合并。
+    """
+
+    def __init__(self, path, with_csv=False, shard="main", max_open=None):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.with_csv = with_csv
+        self.shard = shard
+        self.suffix = f".{shard}{PARTIAL_SUFFIX}"
+        self.max_open = max_open if max_open is not None else pivot_max_open()
+        self.buffering = max(io.DEFAULT_BUFFER_SIZE, min(PIVOT_BUFFER_BYTES, PIVOT_BUFFER_TOTAL // self.max_open))
+        self._names = {}                # 命令 -> 文件名（不含后缀）
+        self._handles = OrderedDict()   # 文件名 -> 打开的文件
+        self._sizes = {}                # 文件名 -> 已写入的字节数
+        self._spans = {}                # 文件名 -> [起始位置, 结束位置]，上次 take_spans() 之后写入的范围
+
+    def _write(self, name, data):
+        f = self._handles.get(name)
+        if f is not None:
+            self._handles.move_to_end(name)
+        else:
+            while len(self._handles) >= self.max_open:
+                _, oldest = self._handles.popitem(last=False)
+                oldest.close()
+            f = self._handles[name] = open(self.path.joinpath(name + self.suffix), "ab", buffering=self.buffering)
+        f.write(data)
+        start = self._sizes.get(name, 0)
+        end = self._sizes[name] = start + len(data)
+        span = self._spans.get(name)
+        if span is None:
+            self._spans[name] = [start, end]
+        else:
+            span[1] = end
+
+    def write(self, device, command, body):
+        name = self._names.get(command)
+        if name is None:
+            name = self._names[command] = pivot_file_name(command)
+        # 与设备日志一样按平台换行符写出
+        data = f"#\n<{device.name}>{command}\n{body}".encode("utf-8")
+        if os.linesep != "\n":
+            data = data.replace(b"\n", os.linesep.encode("ascii"))
+        self._write(name + ".log", data)
+        if self.with_csv:
+            row = io.StringIO()
+            csv.writer(row).writerow((device.name, device.ip, device.sn, len(body.encode("utf-8"))))
+            self._write(name + ".csv", row.getvalue().encode("utf-8"))
+
+    def take_spans(self):
+        """返回上次调用以来写入的 (分片名, [(文件名, 位置, 字节数), ...])，并重新开始记录"""
+        spans = [(name, start, end - start) for name, (start, end) in self._spans.items()]
+        self._spans = {}
+        return self.shard, spans
+
+    def flush(self):
+        for f in self._handles.values():
+            f.flush()
+
+    def close(self):
+        handles = list(self._handles.values())
+        self._handles.clear()
+        for f in handles:
+            f.close()
+
+def add_pivot_spans(spans, taken):
+    """把 PivotWriter.take_spans() 的结果按设备顺序加入 spans（文件名 -> [(分片名, 位置, 字节数), ...]）
+
+    同一分片中首尾相接的范围合并为一项。
+    """
+    shard, written = taken
+    for name, offset, length in written:
+        entries = spans.setdefault(name, [])
+        if entries and entries[-1][0] == shard and entries[-1][1] + entries[-1][2] == offset:
+            entries[-1] = (shard, entries[-1][1], entries[-1][2] + length)
+        else:
+            entries.append((shard, offset, length))
+
+def _copy_range(src, out, offset, length):
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(length, WRITE_BUFFER_BYTES))
+        if not chunk:
+            raise OSError(f"汇总分片不完整: {src.name}")
+        out.write(chunk)
+        length -= len(chunk)
+
+def finish_pivot(path, keep=True, stats=None, spans=None):
+    """合并按命令汇总的临时分片，返回生成的命令数
+
+    keep=True 时合并后替换最终文件，CSV加上表头：spans 为 add_pivot_spans() 收集的写入范围时
+    按其中的顺序从各分片复制，否则各分片按分片名顺序整体合并（只有一个分片的 .log 直接改名）；
+    keep=False 时只删除分片，已有的最终文件不变。
+    """
+    path = pathlib.Path(path)
+    if not path.is_dir():
+        return 0
+    start = time.perf_counter()
+    groups = {}
+    for entry in os.scandir(path):
+        m = _PIVOT_SHARD.fullmatch(entry.name)
+        if m is not None and entry.is_file():
+            groups.setdefault(m.group(1), []).append(entry.path)
+    written = 0
+    for target, parts in groups.items():
+        parts.sort()
+        try:
+            if not keep:
+                continue
+            final = path.joinpath(target)
+            target_spans = spans.get(target) if spans is not None else None
+            if target_spans is None and len(parts) == 1 and target.endswith(".log"):
+                os.replace(parts[0], final)
+                continue
+            tmp = final.with_name(target + PARTIAL_SUFFIX)
+            with open(tmp, "wb", buffering=WRITE_BUFFER_BYTES) as out:
+                if target.endswith(".csv"):
+                    header = io.StringIO()
+                    csv.writer(header).writerow(PIVOT_CSV_HEADER)
+                    out.write(header.getvalue().encode("utf-8"))
+                if target_spans is None:
+                    for part in parts:
+                        with open(part, "rb") as f:
+                            shutil.copyfileobj(f, out, WRITE_BUFFER_BYTES)
+                else:
+                    with contextlib.ExitStack() as stack:
+                        sources = {}
+                        for shard, offset, length in target_spans:
+                            src = sources.get(shard)
+                            if src is None:
+                                src = sources[shard] = stack.enter_context(
+                                    open(path.joinpath(f"{target}.{shard}{PARTIAL_SUFFIX}"), "rb"))
+                            _copy_range(src, out, offset, length)
+                written += out.tell()
+            os.replace(tmp, final)
+        finally:
+            for part in parts:
+                _remove_partial(part)
+    if stats is not None and keep:
+        stats.add("merge_pivot", time.perf_counter() - start, bytes_written=written, files=len(groups))
+    return sum(1 for target in groups if target.endswith(".log")) if keep else 0
+
+class ConversionCancelled(Exception):
+    """转换被取消（在当前命令输出写完后中止）"""
+
+class ConversionManifest:
+    """输出目录中的转换清单
+
+    记录每个输出文件对应的设备、源结果文件的路径/mtime/size、输出文件的mtime/size以及转换程序版本，
+    再次转换到同一目录时只重新生成输入有变化（或输出被改动、删除）的设备。
+    转换过程中定期写入（检查点），job 记录尚未完成的转换任务，中断或取消后可以继续。
+    """
+
+    def __init__(self, save_path):
+        self.save_path = pathlib.Path(save_path)
+        self.path = self.save_path.joinpath(MANIFEST_FILE_NAME)
+        self.outputs = {}   # 输出文件名 -> {"device", "sources", "mtime", "size", "job"}
+        self.job = None     # 未完成的任务: {"id", "started", "force", "compression", "devices"}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("converter") == CONVERTER_VERSION:
+                self.outputs = data.get("outputs", {})
+                self.job = data.get("job")
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def sources(files):
+        """结果文件的 [路径, mtime, size] 列表"""
+        sources = []
+        for p in files:
+            st = fs_stat(p)
+            sources.append([str(record_path(p)), st.st_mtime_ns, st.st_size])
+        return sources
+
+    def is_current(self, name, device, sources, job=None):
+        """输出文件是否由相同的输入生成且之后未被改动；给出job时还要求由该任务生成"""
+        entry = self.outputs.get(name)
+        if entry is None or entry["device"] != [device.name, device.ip, device.sn] or entry["sources"] != sources:
+            return False
+        if job is not None and entry.get("job") != job:
+            return False
+        try:
+            st = os.stat(self.save_path.joinpath(name))
+        except OSError:
+            return False
+        return st.st_mtime_ns == entry["mtime"] and st.st_size == entry["size"]
+
+    def record(self, name, device, sources, job=None):
+        st = os.stat(self.save_path.joinpath(name))
+        self.outputs[name] = {"device": [device.name, device.ip, device.sn], "sources": sources,
+                              "mtime": st.st_mtime_ns, "size": st.st_size, "job": job}
+
+    def discard(self, name):
+        self.outputs.pop(name, None)
+
+    def unfinished_job(self, compression=None):
+        """输出格式相同的未完成任务，返回 (任务, 已完成设备数)，没有时返回None"""
+        job = self.job
+        if not job or job.get("compression") != compression:
+            return None
+        return job, sum(1 for entry in self.outputs.values() if entry.get("job") == job["id"])
+
+    def start_job(self, force, compression, devices, resume=False):
+        """开始（或继续同一输出格式的未完成）任务，返回任务编号"""
+        if resume and self.unfinished_job(compression) is not None:
+            self.job["devices"] = devices
+            return self.job["id"]
+        started = datetime.now()
+        self.job = {"id": started.strftime("%Y%m%d%H%M%S%f"), "started": started.isoformat(timespec="seconds"),
+                    "force": force, "compression": compression, "devices": devices}
+        return self.job["id"]
+
+    def finish_job(self):
+        self.job = None
+
+    def prune(self, keep):
+        """删除清单中不在keep里的输出文件（只删除由清单记录的文件），返回删除的文件名"""
+        removed = []
+        for name in [name for name in self.outputs if name not in keep]:
+            try:
+                os.remove(self.save_path.joinpath(name))
+            except FileNotFoundError:
+                pass
+            del self.outputs[name]
+            removed.append(name)
+        return removed
+
+    def save(self):
+        """写入清单（先写临时文件再替换，中断时不会留下损坏的清单）"""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"converter": CONVERTER_VERSION, "outputs": self.outputs, "job": self.job}, f,
+                      ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+# 转换过程中写入清单检查点的间隔（秒）
+CHECKPOINT_SECONDS = 5.0
+
+# 等待子进程结果时检查取消请求的间隔（秒）
+CANCEL_POLL_SECONDS = 0.2
+
+def estimate_remaining(elapsed, done_bytes, total_bytes):
+    """按已处理字节数的平均速度估算剩余秒数，无法估算时返回None"""
+    if done_bytes <= 0 or elapsed <= 0:
+        return None
+    return max(total_bytes - done_bytes, 0) * elapsed / done_bytes
+
+def _source_bytes(sources):
+    return sum(size for path, mtime, size in sources) if sources else 0
+
+def convert_device(device, files, save_path, log=None, cache=None, compression=None, stats=None, stopped=None,
+                   pivot=None):
+    """转换单台设备的结果文件为 <设备名>.log（或压缩的 .log.gz/.log.xz），可在子进程中执行
+
+    先写入 .part 临时文件，完成后才替换目标文件，失败或取消时不会留下不完整的输出。
+    stopped 为返回是否中止的可调用对象，每写完一条命令检查一次，中止时抛出ConversionCancelled。
+    pivot 为PivotWriter时同时按命令汇总（失败的设备在汇总中保留出错前已写出的命令）。
+    返回 (设备, 文件数, 错误信息, 耗时秒数)，成功时错误信息为None。
+    stats 为RunStats，关闭文件（写出缓冲与压缩尾部）的耗时和输出大小计入 write_log 阶段。
+    """
+    start = time.perf_counter()
+    file_name = pathlib.Path(save_path).joinpath(output_file_name(device, compression))
+    part_name = file_name.with_name(file_name.name + PARTIAL_SUFFIX)
+    try:
+        with open_log_output(part_name, compression) as f:
+            write_device_log(f, device.name, files, log, cache, stats, stopped,
+                             (lambda command, body: pivot.write(device, command, body)) if pivot is not None else None)
+            closing = time.perf_counter()
+        os.replace(part_name, file_name)
+        if stats is not None:
+            stats.add("write_log", time.perf_counter() - closing, bytes_written=os.path.getsize(file_name),
+                      files=1)
+        error = None
+    except (ConversionCancelled, KeyboardInterrupt):
+        _remove_partial(part_name)
+        raise
+    except Exception as e:
+        _remove_partial(part_name)
+        error = str(e)
+    elapsed = time.perf_counter() - start
+    if stats is not None:
+        stats.add("convert_device", elapsed, devices=1, failed=int(error is not None))
+    return device, len(files), error, elapsed
+
+def _remove_partial(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+_worker_cancel = None   # 进程池子进程中的取消事件
+_worker_pivot = None    # 进程池子进程中的PivotWriter
+
+def _init_convert_worker(cancel, pivot=None):
+    """进程池子进程的初始化；pivot 为 (汇总目录, 是否写CSV) 时创建本进程的汇总分片（以进程号命名），进程退出时关闭"""
+    global _worker_cancel, _worker_pivot
+    _worker_cancel = cancel
+    # Ctrl+C 由主进程处理，通过取消事件通知子进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # fork时继承的压缩包文件与主进程共享读取位置，子进程中关闭后各自重新打开
+    close_archives()
+    if pivot is not None:
+        _worker_pivot = PivotWriter(pivot[0], pivot[1], shard=str(os.getpid()))
+        Finalize(None, _worker_pivot.close, exitpriority=10)
+
+def _convert_device_worker(device, files, save_path, compression, with_stats):
+    """在子进程中转换，返回 (结果, 统计或None, 汇总写入范围或None)；主进程设置取消事件后在当前命令写完时中止
+
+    汇总写入范围为本设备在本进程汇总分片中写入的位置（见 PivotWriter.take_spans()）。
+    """
+    stats = RunStats() if with_stats else None
+    stopped = _worker_cancel.is_set if _worker_cancel is not None else None
+    writer = _worker_pivot
+    if writer is not None:
+        writer.take_spans()     # 丢弃上一台中止的设备写入的范围
+    result = convert_device(device, files, save_path, None, None, compression, stats, stopped, writer)
+    return result, stats.totals() if stats is not None else None, writer.take_spans() if writer is not None else None
+
+def _convert_to_bundle(plan, bundle_path, cache=None, log=None, report=None, stopped=None, stats=None, pivot=None):
+    """把设备日志依次写入单个日志包（单进程顺序写出）；中止时不替换原有的日志包，返回是否全部完成"""
+    bundle = LogBundle(bundle_path)
+    completed = False
+    try:
+        for device, files, sources in plan:
+            if stopped is not None and stopped():
+                return False
+            if not files:
+                report((device, 0, None, 0.0), sources)
+                continue
+            start = time.perf_counter()
+            pivot_write = (lambda command, body: pivot.write(device, command, body)) if pivot is not None else None
+            try:
+                bundle.add(output_file_name(device),
+                           lambda f: write_device_log(f, device.name, files, log, cache, stats, stopped, pivot_write))
+                error = None
+            except ConversionCancelled:
+                return False
+            except Exception as e:
+                error = str(e)
+            elapsed = time.perf_counter() - start
+            if stats is not None:
+                stats.add("convert_device", elapsed, devices=1, failed=int(error is not None))
+            report((device, len(files), error, elapsed), sources)
+        completed = True
+        return True
+    finally:
+        # 日志包是一个整体，只有全部设备写完才替换目标文件
+        closing = time.perf_counter()
+        bundle.close(keep=completed)
+        if stats is not None and completed:
+            stats.add("write_log", time.perf_counter() - closing, bytes_written=os.path.getsize(bundle_path),
+                      files=1)
+
+def convert_devices(devices, save_path, jobs=1, cache=None, log=None, on_result=None, stopped=None,
+                    force=False, prune=False, on_skipped=None, compression=None, bundle=None, stats=None,
+                    on_progress=None, resume=False, pivot=None, pivot_csv=False):
+    """批量转换设备日志
+
+    jobs>1 时把设备分发到进程池并行转换，子进程直接写出日志文件；结果按设备顺序
+    通过 on_result 回调返回，同时在途的任务数有上限，内存占用不随设备数增长。
+    没有结果文件的设备也会回调，文件数为0。stopped 为返回是否中止的可调用对象，
+    正在转换的设备（包括子进程中的）在当前命令写完后中止，不留下不完整的输出。
+
+    输出目录中的转换清单记录了每个输出的输入，输入未变化的设备跳过（通过 on_skipped 回调），
+    force=True 时全部重新生成；prune=True 时删除清单中已不在设备列表里的输出文件。
+    清单每隔 CHECKPOINT_SECONDS 秒写入一次，未完成的任务记录在清单中：再次转换时未变化的设备
+    总会跳过，resume=True 时 force 的任务也只重新生成上次任务中尚未完成的设备。
+    compression 为 gz/xz 时输出压缩的 .log.gz/.log.xz；bundle 为日志包文件名（.zip/.tar/.tar.gz/.tar.xz）时
+    所有设备写入该包，此时忽略 jobs 与转换清单，中止后不能继续。
+    stats 为RunStats，子进程中的统计随结果返回后合并。
+    on_progress(已完成设备数, 待转换设备数, 已处理字节数, 待处理字节数) 在每台设备完成后回调，
+    字节数按源结果文件大小计算。
+    pivot 为目录（相对于输出目录）时，在同一次解析中按命令汇总所有设备的输出（见PivotWriter），
+    pivot_csv=True 时同时写每条命令的设备索引CSV；汇总包含所有设备，因此不跳过未变化的设备，
+    并行转换时每个子进程写入自己的分片并返回每台设备的写入位置，全部完成后按设备顺序合并；
+    中止时保留原有的汇总文件。
+    返回 (成功数, 失败数, 无结果数, 未变化数)。
+    """
+    devices = list(devices)
+    pivot_path = None
+    if pivot is not None:
+        pivot_path = pathlib.Path(save_path).joinpath(pivot)
+        force, resume = True, False
+        finish_pivot(pivot_path, keep=False)   # 清除上次中断留下的分片
+    resolver = ResultResolver(stats)
+    manifest = ConversionManifest(save_path) if bundle is None else None
+    counts = {"ok": 0, "failed": 0, "no_result": 0, "unchanged": 0}
+    job = None
+    if manifest is not None:
+        job = manifest.start_job(force, compression, len(devices), resume)
+    # 强制重新生成并继续上次任务时，只跳过本任务中已完成的设备
+    skip_job = job if force and resume else None
+
+    # 先确定待转换的设备及其源文件大小，用于计算进度
+    plan = []
+    for device in devices:
+        if stopped is not None and stopped():
+            break
+        files = resolver.files_for(device)
+        start = time.perf_counter()
+        sources = ConversionManifest.sources(files) if files else None
+        current = (manifest is not None and files and (not force or skip_job is not None) and
+                   manifest.is_current(output_file_name(device, compression), device, sources, skip_job))
+        if stats is not None:
+            stats.add("check_manifest", time.perf_counter() - start, unchanged=int(bool(current)))
+        if current:
+            counts["unchanged"] += 1
+            if on_skipped is not None:
+                on_skipped(device)
+            continue
+        plan.append((device, files, sources))
+    total_bytes = sum(_source_bytes(sources) for device, files, sources in plan)
+    progress = {"devices": 0, "bytes": 0, "checkpoint": time.monotonic()}
+
+    def report(result, sources):
+        device, file_count, error, elapsed = result
+        if error is not None:
+            counts["failed"] += 1
+            if manifest is not None:
+                manifest.discard(output_file_name(device, compression))
+        elif file_count == 0:
+            counts["no_result"] += 1
+        else:
+            counts["ok"] += 1
+            if manifest is not None:
+                manifest.record(output_file_name(device, compression), device, sources, job)
+        progress["devices"] += 1
+        progress["bytes"] += _source_bytes(sources)
+        if manifest is not None and time.monotonic() - progress["checkpoint"] >= CHECKPOINT_SECONDS:
+            manifest.save()
+            progress["checkpoint"] = time.monotonic()
+        if on_result is not None:
+            on_result(result)
+        if on_progress is not None:
+            on_progress(progress["devices"], len(plan), progress["bytes"], total_bytes)
+
+    def is_stopped():
+        return stopped is not None and stopped()
+
+    if bundle is not None:
+        writer = PivotWriter(pivot_path, pivot_csv) if pivot_path is not None else None
+        completed = False
+        try:
+            completed = _convert_to_bundle(plan, pathlib.Path(save_path).joinpath(bundle), cache, log, report,
+                                           stopped, stats, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+                finish_pivot(pivot_path, completed, stats)
+        return counts["ok"], counts["failed"], counts["no_result"], 0
+
+    def finish():
+        if is_stopped():
+            return counts["ok"], counts["failed"], counts["no_result"], counts["unchanged"]
+        if prune:
+            for name in manifest.prune({output_file_name(device, compression) for device in devices}):
+                if log is not None:
+                    log(f"删除已不在设备列表中的输出文件: {name}")
+        manifest.finish_job()
+        return counts["ok"], counts["failed"], counts["no_result"], counts["unchanged"]
+
+    writer = None
+    pivot_spans = None      # 并行转换时各汇总文件按设备顺序的写入范围
+    completed = False
+    try:
+        if jobs <= 1:
+            writer = PivotWriter(pivot_path, pivot_csv) if pivot_path is not None else None
+            try:
+                for device, files, sources in plan:
+                    if is_stopped():
+                        break
+                    if files:
+                        report(convert_device(device, files, save_path, log, cache, compression, stats, stopped,
+                                              writer), sources)
+                    else:
+                        report((device, 0, None, 0.0), sources)
+            except ConversionCancelled:
+                pass
+            completed = not is_stopped()
+            return finish()
+
+        cancel = multiprocessing.Event()
+        pivot_spans = {}
+
+        def collect(item):
+            """窗口中的项为已知结果或进程池任务；等待期间也响应取消请求"""
+            if isinstance(item, tuple):
+                return item
+            while not item.done():
+                if is_stopped():
+                    cancel.set()
+                wait([item], timeout=CANCEL_POLL_SECONDS)
+            result, totals, taken = item.result()
+            if totals is not None:
+                stats.merge(totals)
+            if taken is not None:
+                add_pivot_spans(pivot_spans, taken)
+            return result
+
+        window = deque()
+        pivot_args = (str(pivot_path), pivot_csv) if pivot_path is not None else None
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_convert_worker,
+                                 initargs=(cancel, pivot_args)) as pool:
+            try:
+                for device, files, sources in plan:
+                    if is_stopped():
+                        break
+                    if files:
+                        item = pool.submit(_convert_device_worker, device, files, save_path, compression,
+                                           stats is not None)
+                    else:
+                        item = (device, 0, None, 0.0)
+                    window.append((item, sources))
+                    if len(window) >= jobs * 4:
+                        item, sources = window.popleft()
+                        report(collect(item), sources)
+                while window and not is_stopped():
+                    item, sources = window.popleft()
+                    report(collect(item), sources)
+            except ConversionCancelled:
+                pass
+            finally:
+                if window or is_stopped():
+                    cancel.set()
+                for item, sources in window:
+                    if not isinstance(item, tuple):
+                        item.cancel()
+        completed = not is_stopped()
+        return finish()
+    finally:
+        if writer is not None:
+            writer.close()
+        if pivot_path is not None:
+            # 进程池已退出，各子进程的分片都已写完并关闭
+            finish_pivot(pivot_path, completed, stats, pivot_spans)
+        manifest.save()
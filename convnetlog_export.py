@@ -0,0 +1,232 @@
+"""结构化导出：把设备与命令输出逐条导出为JSONL或SQLite，供下游分析使用（不依赖PyQt5）
+
+每条记录为 (采集, 设备名, IP, SN, 采集状态, 序号, 命令, echo)，结果文件边解析边写出，
+内存占用与采集目录大小无关。SQLite按批插入、整个导出只提交一次，索引在数据写完后再建立；
+两种输出都先写入 .part 文件，完成后再改名，取消或出错时不留下不完整的文件。
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from convnetlog_core import (
+    PARTIAL_SUFFIX, RESULT_DIR_PATTERN, ConversionCancelled, ResultResolver, iter_command_echo, open_log_output
+)
+from convnetlog_fs import as_path, fs_stat
+
+# 导出数据库的格式版本，表结构变化时递增
+EXPORT_FORMAT = "1"
+
+ExportRecord = namedtuple("ExportRecord", "snapshot device ip sn state seq command echo")
+ExportRecord.__doc__ = """一条导出记录：seq为命令在设备全部结果文件中的序号（从0开始），没有echo的命令echo为None
+
+没有结果文件的设备产出一条seq、command、echo均为None的记录，以保留设备及其采集状态。
+"""
+
+EXPORT_FORMATS = ("jsonl", "sqlite")
+
+
+def export_format(path):
+    """按文件名判断导出格式：.db/.sqlite/.sqlite3 为SQLite，其余为JSONL"""
+    name = str(path).lower()
+    return "sqlite" if name.endswith((".db", ".sqlite", ".sqlite3")) else "jsonl"
+
+
+def snapshot_name(device):
+    """设备所属的一次采集（cmd_info所在的result_子目录名），不在BrainCollect下时为空串"""
+    name = as_path(device.path).parent.name
+    return name if RESULT_DIR_PATTERN.fullmatch(name) else ""
+
+
+def iter_records(devices, resolver=None, stopped=None, stats=None, on_device=None):
+    """依次产出设备的ExportRecord，结果文件流式解析，不经过缓存
+
+    stopped 为返回是否中止的可调用对象，每处理完一个结果文件检查一次，中止时抛出ConversionCancelled。
+    stats 为RunStats（parse_result 阶段）；on_device(设备, 记录数) 在每台设备处理完后调用。
+    """
+    if resolver is None:
+        resolver = ResultResolver(stats)
+    for device in devices:
+        if stopped is not None and stopped():
+            raise ConversionCancelled()
+        snapshot = snapshot_name(device)
+        seq = 0
+        for p in resolver.files_for(device):
+            # 只统计解析的耗时，不含产出后写出记录的时间
+            parse_seconds = 0.0
+            commands = seq
+            last = time.perf_counter()
+            for command, echo in iter_command_echo(p):
+                record = ExportRecord(snapshot, device.name, device.ip, device.sn, device.state, seq, command,
+                                      echo.strip() if echo is not None else None)
+                parse_seconds += time.perf_counter() - last
+                yield record
+                last = time.perf_counter()
+                seq += 1
+            if stats is not None:
+                stats.add("parse_result", parse_seconds + time.perf_counter() - last, bytes_read=fs_stat(p).st_size,
+                          commands=seq - commands)
+            if stopped is not None and stopped():
+                raise ConversionCancelled()
+        if seq == 0:
+            yield ExportRecord(snapshot, device.name, device.ip, device.sn, device.state, None, None, None)
+        if on_device is not None:
+            on_device(device, seq)
+
+
+class JsonlExporter:
+    """每条记录一行JSON（UTF-8，不转义中文）；文件名以 .gz/.xz 结尾时流式压缩"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._part = self.path + PARTIAL_SUFFIX
+        compression = next((c for c in ("gz", "xz") if self.path.endswith("." + c)), None)
+        self._stack = contextlib.ExitStack()
+        self._f = self._stack.enter_context(open_log_output(self._part, compression))
+        self.records = 0
+
+    def add(self, record):
+        self._f.write(json.dumps(record._asdict(), ensure_ascii=False))
+        self._f.write("\n")
+        self.records += 1
+
+    def close(self, keep=True):
+        """keep为True时把 .part 文件改名为最终文件名，否则删除"""
+        self._stack.close()
+        if keep:
+            os.replace(self._part, self.path)
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(self._part)
+
+
+class SqliteExporter:
+    """写入SQLite数据库：devices 表保存设备，outputs 表保存命令输出，records 视图为展开的记录
+
+    同一次采集中名称、IP、SN都相同的记录属于同一台设备。导出期间关闭日志和同步写入，
+    按批（executemany，限制条数和字节数）插入并在最后一次提交；输出写入 .part 文件，完成后替换已有的数据库。
+    """
+    BATCH_RECORDS = 2000
+    BATCH_BYTES = 16 * 1024 * 1024   # echo较大时按字节数提前插入，限制内存占用
+
+    SCHEMA = """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE devices (id INTEGER PRIMARY KEY, snapshot TEXT, name TEXT, ip TEXT, sn TEXT, state TEXT);
+        CREATE TABLE outputs (device INTEGER NOT NULL REFERENCES devices(id), seq INTEGER, command TEXT, echo TEXT);
+        CREATE VIEW records AS
+            SELECT d.snapshot, d.name AS device, d.ip, d.sn, d.state, o.seq, o.command, o.echo
+            FROM devices d LEFT JOIN outputs o ON o.device = d.id;
+    """
+
+    # 数据写完后再建立的索引
+    INDEXES = """
+        CREATE INDEX devices_name ON devices(name);
+        CREATE INDEX devices_ip ON devices(ip);
+        CREATE INDEX devices_snapshot ON devices(snapshot);
+        CREATE INDEX outputs_device ON outputs(device, seq);
+        CREATE INDEX outputs_command ON outputs(command);
+    """
+
+    def __init__(self, path, batch=BATCH_RECORDS):
+        self.path = str(path)
+        self._part = self.path + PARTIAL_SUFFIX
+        with contextlib.suppress(OSError):
+            os.remove(self._part)
+        self.batch = batch
+        self.records = 0
+        self._conn = sqlite3.connect(self._part, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                               [("format", EXPORT_FORMAT), ("exported", time.strftime("%Y-%m-%dT%H:%M:%S"))])
+        self._conn.execute("BEGIN")
+        self._devices = {}   # (采集, 名称, IP, SN) -> devices.id，只随设备数增长
+        self._pending = []
+        self._pending_bytes = 0
+
+    def add(self, record):
+        key = (record.snapshot, record.device, record.ip, record.sn)
+        device_id = self._devices.get(key)
+        if device_id is None:
+            device_id = self._devices[key] = self._conn.execute(
+                "INSERT INTO devices (snapshot, name, ip, sn, state) VALUES (?, ?, ?, ?, ?)",
+                key + (record.state,)).lastrowid
+        if record.command is None:
+            return
+        self._pending.append((device_id, record.seq, record.command, record.echo))
+        self._pending_bytes += len(record.echo) if record.echo is not None else 0
+        self.records += 1
+        if len(self._pending) >= self.batch or self._pending_bytes >= self.BATCH_BYTES:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._conn.executemany("INSERT INTO outputs VALUES (?, ?, ?, ?)", self._pending)
+            self._pending.clear()
+            self._pending_bytes = 0
+
+    def close(self, keep=True):
+        """keep为True时建立索引、提交并替换为最终文件，否则删除 .part 文件"""
+        try:
+            if keep:
+                self._flush()
+                self._conn.executescript(self.INDEXES)   # executescript会先提交当前事务
+                self._conn.execute("ANALYZE")
+        finally:
+            self._conn.close()
+        if keep:
+            os.replace(self._part, self.path)
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(self._part)
+
+
+def open_exporter(path, fmt=None):
+    """按格式（默认按文件名判断）创建导出器"""
+    fmt = fmt or export_format(path)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    return SqliteExporter(path) if fmt == "sqlite" else JsonlExporter(path)
+
+
+def export_records(records, exporters, stats=None):
+    """把记录依次写入各导出器并关闭，返回记录数；中途出错或取消时删除未完成的输出"""
+    count = 0
+    write_seconds = 0.0
+    completed = False
+    try:
+        for record in records:
+            start = time.perf_counter()
+            for exporter in exporters:
+                exporter.add(record)
+            write_seconds += time.perf_counter() - start
+            count += 1
+        completed = True
+    finally:
+        start = time.perf_counter()
+        for exporter in exporters:
+            exporter.close(completed)
+        if stats is not None:
+            stats.add("export_write", write_seconds + time.perf_counter() - start, records=count)
+    return count
+
+
+def export_devices(devices, paths, resolver=None, stopped=None, stats=None, on_device=None, fmt=None):
+    """把设备的全部命令输出导出到一个或多个文件（一次解析同时写入各文件），返回记录数
+
+    paths 中每个文件按文件名选择JSONL或SQLite格式（fmt 指定时统一使用该格式）。
+    取消时抛出ConversionCancelled，已有的同名输出文件保持不变。
+    """
+    exporters = []
+    try:
+        for path in paths:
+            exporters.append(open_exporter(path, fmt))
+    except Exception:
+        for exporter in exporters:
+            exporter.close(False)
+        raise
+    return export_records(iter_records(devices, resolver, stopped, stats, on_device), exporters, stats)
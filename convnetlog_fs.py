@@ -0,0 +1,325 @@
+"""采集目录的文件访问：普通目录，或直接读取 .zip / .tar / .tar.gz / .tar.xz 压缩包（不解压到磁盘）
+
+压缩包内的文件用ArchivePath表示，其余路径仍是普通的文件系统路径；fs_scandir、fs_open、
+fs_stat、fs_exists 对两者统一处理。
+"""
+import os
+import pathlib
+import tarfile
+import threading
+import weakref
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz")
+
+# 与os.stat_result中用到的字段同名
+ArchiveStat = namedtuple("ArchiveStat", "st_mtime_ns st_size")
+
+ArchiveEntry = namedtuple("ArchiveEntry", "name path dir")
+
+
+def is_archive(path):
+    """是否为支持的压缩包文件"""
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+class ArchivePath:
+    """压缩包内的路径，member为以/分隔的相对路径（压缩包根目录为空串）
+
+    tar成员额外携带数据在包内的位置，子进程据此直接打开成员，无需重新列出整个压缩包。
+    """
+    __slots__ = ("archive", "member", "location")
+
+    def __init__(self, archive, member="", location=None):
+        self.archive = os.path.abspath(str(archive))
+        self.member = member.strip("/")
+        self.location = location   # tar成员: (数据偏移, 大小, mtime)
+
+    @property
+    def name(self):
+        return self.member.rsplit("/", 1)[-1] if self.member else os.path.basename(self.archive)
+
+    @property
+    def parent(self):
+        return ArchivePath(self.archive, self.member.rsplit("/", 1)[0] if "/" in self.member else "")
+
+    def joinpath(self, *parts):
+        names = [self.member] if self.member else []
+        names.extend(str(part).strip("/") for part in parts)
+        return ArchivePath(self.archive, "/".join(names))
+
+    def open(self):
+        return _open_archive(self.archive).open(self.member, self.location)
+
+    def stat(self):
+        if self.location is not None:
+            offset, size, mtime = self.location
+            return ArchiveStat(mtime * 1000000000, size)
+        return _open_archive(self.archive).stat(self.member)
+
+    def __eq__(self, other):
+        return isinstance(other, ArchivePath) and (self.archive, self.member) == (other.archive, other.member)
+
+    def __lt__(self, other):
+        return (self.archive, self.member) < (other.archive, other.member)
+
+    def __hash__(self):
+        return hash((self.archive, self.member))
+
+    def __str__(self):
+        return f"{self.archive}!/{self.member}"
+
+    def __repr__(self):
+        return f"ArchivePath({self.archive!r}, {self.member!r})"
+
+
+class _ArchiveTree:
+    """按目录组织的成员列表"""
+
+    def __init__(self):
+        self.children = {"": {}}   # 目录 -> {名称: 是否为目录}
+
+    def add(self, member, is_dir):
+        parts = member.strip("/").split("/")
+        for i in range(len(parts)):
+            parent = "/".join(parts[:i])
+            last = i == len(parts) - 1
+            entry_is_dir = is_dir if last else True
+            self.children.setdefault(parent, {})
+            self.children[parent][parts[i]] = self.children[parent].get(parts[i], False) or entry_is_dir
+            if entry_is_dir:
+                self.children.setdefault("/".join(parts[:i + 1]), {})
+
+    def listdir(self, member):
+        entries = self.children.get(member)
+        if entries is None:
+            raise FileNotFoundError(member)
+        return entries
+
+
+class _ZipArchive:
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)   # ZipFile.open可在多个线程中同时使用
+        self._infos = {}
+        self.tree = _ArchiveTree()
+        for info in self._zip.infolist():
+            name = info.filename.strip("/")
+            if not name:
+                continue
+            self.tree.add(name, info.is_dir())
+            if not info.is_dir():
+                self._infos[name] = info
+
+    def open(self, member, location=None):
+        return self._zip.open(self._infos[member])
+
+    def stat(self, member):
+        info = self._infos.get(member)
+        if info is None:
+            raise FileNotFoundError(member)
+        mtime = datetime(*info.date_time).timestamp()
+        return ArchiveStat(int(mtime) * 1000000000, info.file_size)
+
+    def location(self, member):
+        return None
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarArchive:
+    """tar压缩包；成员列表只在需要时读取一次，每个线程使用各自的TarFile读取成员数据（close() 时全部关闭）
+
+    tar.gz/tar.xz 只能顺序解压，读取成员时从当前位置向后解压到该成员（向前则从头开始），
+    按包内顺序访问成员时总的解压量约为一遍。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._members = None
+        self._tree = None
+        # 各线程打开的TarFile；线程结束后其TarFile随线程局部数据释放，不再由这里保留
+        self._handles = weakref.WeakSet()
+
+    def _tarfile(self):
+        tar = getattr(self._local, "tar", None)
+        if tar is None:
+            tar = self._local.tar = tarfile.open(self.path, "r:*")
+            with self._lock:
+                self._handles.add(tar)
+        return tar
+
+    def _load(self):
+        with self._lock:
+            if self._members is None:
+                members = {}
+                tree = _ArchiveTree()
+                with tarfile.open(self.path, "r:*") as tar:
+                    for info in tar:
+                        name = info.name.strip("/")
+                        if name.startswith("./"):
+                            name = name[2:]
+                        if not name or not (info.isdir() or info.isreg()):
+                            continue
+                        tree.add(name, info.isdir())
+                        if info.isreg():
+                            members[name] = (info.offset_data, info.size, int(info.mtime))
+                self._members = members
+                self._tree = tree
+        return self._members
+
+    @property
+    def tree(self):
+        self._load()
+        return self._tree
+
+    def location(self, member):
+        return self._load().get(member)
+
+    def open(self, member, location=None):
+        if location is None:
+            location = self._load().get(member)
+            if location is None:
+                raise FileNotFoundError(member)
+        info = tarfile.TarInfo(member)
+        info.offset_data, info.size, info.mtime = location
+        info.type = tarfile.REGTYPE
+        return self._tarfile().extractfile(info)
+
+    def stat(self, member):
+        location = self._load().get(member)
+        if location is None:
+            raise FileNotFoundError(member)
+        return ArchiveStat(location[2] * 1000000000, location[1])
+
+    def close(self):
+        """关闭各线程打开的TarFile"""
+        with self._lock:
+            handles = list(self._handles)
+            self._handles.clear()
+        for tar in handles:
+            tar.close()
+
+
+_archives = {}   # (路径, mtime, size) -> 压缩包读取对象，每个进程各自缓存
+_archives_lock = threading.Lock()
+
+
+def _open_archive(path):
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            for old in [k for k in _archives if k[0] == path]:
+                _archives.pop(old).close()
+            archive = _archives[key] = _ZipArchive(path) if zipfile.is_zipfile(path) else _TarArchive(path)
+        return archive
+
+
+def close_archives():
+    """关闭已打开的全部压缩包（切换采集或退出时调用），之后访问压缩包时重新打开"""
+    with _archives_lock:
+        archives = list(_archives.values())
+        _archives.clear()
+    for archive in archives:
+        archive.close()
+
+
+def collection_root(path):
+    """采集目录或压缩包的根路径"""
+    if isinstance(path, ArchivePath):
+        return path
+    if is_archive(path):
+        return ArchivePath(path)
+    return pathlib.Path(path)
+
+
+def as_path(path):
+    """DeviceRecord.path 等字符串路径转换为路径对象"""
+    return path if isinstance(path, ArchivePath) else pathlib.Path(path)
+
+
+def record_path(path):
+    """保存在设备记录中的路径：普通文件为绝对路径字符串，压缩包成员为ArchivePath"""
+    return path if isinstance(path, ArchivePath) else str(pathlib.Path(path).resolve())
+
+
+def sidecar_path(root, file_name):
+    """索引等附属文件的位置：普通目录下为 <目录>/<文件名>，压缩包为同目录下的 <压缩包名><文件名>"""
+    if isinstance(root, ArchivePath):
+        return pathlib.Path(root.archive + file_name)
+    return pathlib.Path(root).joinpath(file_name)
+
+
+def relative_key(root, path):
+    """路径相对于采集根目录的键（以/分隔）"""
+    if isinstance(root, ArchivePath):
+        if isinstance(path, ArchivePath) and path.archive == root.archive:
+            return path.member
+        return str(path)
+    path = pathlib.Path(path).resolve()
+    try:
+        return path.relative_to(root).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def join_key(root, key):
+    if isinstance(root, ArchivePath):
+        archive = _open_archive(root.archive)
+        return ArchivePath(root.archive, key, archive.location(key))
+    return pathlib.Path(root).joinpath(key)
+
+
+def fs_scandir(path):
+    """列出目录，返回具有 name、path、is_dir() 的目录项"""
+    if not isinstance(path, ArchivePath):
+        with os.scandir(path) as it:
+            return list(it)
+    archive = _open_archive(path.archive)
+    entries = []
+    for name, is_dir in archive.tree.listdir(path.member).items():
+        member = f"{path.member}/{name}" if path.member else name
+        child = ArchivePath(path.archive, member, None if is_dir else archive.location(member))
+        entries.append(_ArchiveDirEntry(name, child, is_dir))
+    return entries
+
+
+class _ArchiveDirEntry(ArchiveEntry):
+    __slots__ = ()
+
+    def is_dir(self):
+        return self.dir
+
+
+def fs_exists(path):
+    if not isinstance(path, ArchivePath):
+        return os.path.exists(path)
+    archive = _open_archive(path.archive)
+    if path.member in archive.tree.children:
+        return True
+    try:
+        archive.stat(path.member)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def fs_open(path):
+    """以二进制方式打开文件（压缩包成员为可seek的流）"""
+    if isinstance(path, ArchivePath):
+        return path.open()
+    return open(path, "rb")
+
+
+def fs_stat(path):
+    """返回具有 st_mtime_ns、st_size 的状态信息"""
+    if isinstance(path, ArchivePath):
+        return path.stat()
+    return os.stat(path)
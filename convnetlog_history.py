@@ -0,0 +1,153 @@
+"""多次采集的历史对比（不依赖PyQt5）
+
+采集目录的 BrainCollect 下每次采集为一个 result_<18位> 子目录。SnapshotHistory 列出全部采集，
+每次采集的设备列表在首次用到时才解析；比较同一设备某条命令在两次采集间的输出时，
+先比较CollectionIndex中保存的echo正文摘要，相同则不读取内容，不同时才读取两次的输出逐行比较。
+"""
+import difflib
+import threading
+from collections import namedtuple
+
+from convnetlog_core import Echo, ResultCache, ResultResolver, discover_devices, find_snapshots
+
+# 某次采集中设备执行某条命令的情况
+STATUS_MISSING = "missing"       # 该次采集中没有这台设备
+STATUS_NO_COMMAND = "no_command" # 设备没有执行该命令
+STATUS_SAME = "same"             # 与上一次（更早的）采集相同
+STATUS_CHANGED = "changed"       # 与上一次采集不同
+STATUS_FIRST = "first"           # 最早一次执行该命令
+
+HistoryEntry = namedtuple("HistoryEntry", "snapshot device status")
+CommandDiff = namedtuple("CommandDiff", "old new changed lines added removed")
+
+
+class SnapshotHistory:
+    """采集目录中全部采集的设备与命令输出
+
+    index为CollectionIndex时用其中的正文摘要判断输出是否变化；否则用cache（ResultCache）
+    解析结果文件，比较共享的正文对象。每次采集的设备列表按需解析并缓存。
+    """
+
+    def __init__(self, root, index=None, cache=None, log=None, workers=1, stats=None):
+        self.root = root
+        self.index = index
+        self.cache = cache if cache is not None or index is not None else ResultCache()
+        self.log = log
+        self.workers = workers
+        self.stats = stats
+        self.resolver = ResultResolver(stats)
+        self._snapshots = None
+        self._registries = {}
+        self._lock = threading.Lock()
+
+    def snapshots(self, refresh=False):
+        """全部采集，按时间从新到旧排列"""
+        with self._lock:
+            if self._snapshots is None or refresh:
+                self._snapshots = find_snapshots(self.root, self.log)
+                self._registries.clear()
+                self.resolver.clear()
+            return list(self._snapshots)
+
+    def snapshot(self, name):
+        for snapshot in self.snapshots():
+            if snapshot.name == name:
+                return snapshot
+        raise KeyError(name)
+
+    def devices(self, name):
+        """某次采集的设备登记表（DeviceRegistry），首次调用时解析"""
+        with self._lock:
+            registry = self._registries.get(name)
+        if registry is None:
+            registry = discover_devices(self.root, self.index, self.log, self.workers, stats=self.stats,
+                                        snapshot=name)
+            with self._lock:
+                registry = self._registries.setdefault(name, registry)
+        return registry
+
+    def find_device(self, name, device):
+        """某次采集中与device对应的设备记录：名称、IP、SN都相同，其次SN相同，其次名称和IP相同"""
+        registry = self.devices(name)
+        found = registry.get(device.name, device.ip, device.sn)
+        if found is not None:
+            return found
+        for candidate in registry.by_sn(device.sn):
+            return candidate
+        for candidate in registry.by_ip(device.ip):
+            if candidate.name == device.name:
+                return candidate
+        return None
+
+    def output_key(self, device, command):
+        """设备某条命令全部输出的比较键，没有执行该命令时为None
+
+        有索引时为正文摘要的元组（不读取echo内容），否则为共享的正文对象的元组。
+        """
+        key = []
+        for p in self.resolver.files_for(device):
+            if self.index is not None:
+                key.extend(digest for cmd, offset, length, digest in self.index.entries(p)[1] if cmd == command)
+            else:
+                key.extend(echo.body if echo is not None else False
+                           for echo in self.cache.get(p).by_command.get(command, ()))
+        return tuple(key) if key else None
+
+    def output_lines(self, device, command):
+        """设备某条命令全部输出的正文行（不含带设备名的首尾提示符行）"""
+        lines = []
+        for p in self.resolver.files_for(device):
+            if self.index is not None:
+                echoes = [Echo(text) if text is not None else None for text in self.index.read_echoes(p, command)]
+            else:
+                echoes = self.cache.get(p).by_command.get(command, ())
+            for echo in echoes:
+                if echo is not None and echo.body is not None:
+                    lines.extend(line.rstrip("\r") for line in echo.body.split("\n"))
+        return lines
+
+    def timeline(self, device, command, stopped=None):
+        """设备某条命令在各次采集中的情况，返回HistoryEntry列表（从新到旧）
+
+        每次采集与它之前最近一次执行了该命令的采集比较，只比较摘要。
+        """
+        rows = []
+        for snapshot in self.snapshots():
+            if stopped is not None and stopped():
+                break
+            found = self.find_device(snapshot.name, device)
+            rows.append((snapshot, found, self.output_key(found, command) if found is not None else None))
+        entries = []
+        previous = None   # 更早一次执行了该命令的比较键
+        for snapshot, found, key in reversed(rows):
+            if found is None:
+                status = STATUS_MISSING
+            elif key is None:
+                status = STATUS_NO_COMMAND
+            elif previous is None:
+                status = STATUS_FIRST
+            else:
+                status = STATUS_SAME if key == previous else STATUS_CHANGED
+            if key is not None:
+                previous = key
+            entries.append(HistoryEntry(snapshot, found, status))
+        entries.reverse()
+        return entries
+
+    def diff(self, device, command, old, new, context=3):
+        """比较设备某条命令在两次采集（result_子目录名）间的输出，返回CommandDiff
+
+        摘要相同时直接返回未变化的结果，不读取输出内容；lines为unified diff格式的行。
+        """
+        old_device = self.find_device(old, device)
+        new_device = self.find_device(new, device)
+        old_key = self.output_key(old_device, command) if old_device is not None else None
+        new_key = self.output_key(new_device, command) if new_device is not None else None
+        if old_key == new_key:
+            return CommandDiff(old, new, False, [], 0, 0)
+        old_lines = self.output_lines(old_device, command) if old_key is not None else []
+        new_lines = self.output_lines(new_device, command) if new_key is not None else []
+        lines = list(difflib.unified_diff(old_lines, new_lines, old, new, n=context, lineterm=""))
+        added = sum(1 for line in lines if line.startswith("+") and not line.startswith("+++"))
+        removed = sum(1 for line in lines if line.startswith("-") and not line.startswith("---"))
+        return CommandDiff(old, new, True, lines, added, removed)
@@ -0,0 +1,224 @@
+"""设备命令列表与命令输出的后台加载：界面线程只提交请求和接收结果，不解析XML
+
+每类请求（命令列表、命令输出）只有最新的一个有效，新请求会取消尚未开始的旧请求，
+正在执行的旧请求在写入下一块输出前中止。选中设备相邻的设备和选中设备的前几条命令
+在单独的低优先级线程中预取，选择变化时尚未完成的预取全部放弃。
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from convnetlog_core import LoadCancelled, device_commands, load_command_output
+
+KIND_COMMANDS = "commands"
+KIND_RESULT = "result"
+
+
+class _Request:
+    __slots__ = ("id", "cancelled", "future")
+
+    def __init__(self, request_id):
+        self.id = request_id
+        self.cancelled = False
+        self.future = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class ViewLoader(QObject):
+    """查看设备和命令时的后台加载器，结果通过信号送回界面线程
+
+    信号携带请求编号，界面收到后用 is_current() 判断是否已被新的请求取代；
+    已被取代的命令输出（OutputStore）由接收方关闭。
+    """
+    commands_loaded = pyqtSignal(int, object, list)             # 请求编号, 设备, 命令列表
+    result_loaded = pyqtSignal(int, object, str, object, float)  # 请求编号, 设备, 命令, OutputStore或None, 耗时
+    failed = pyqtSignal(str, int, str)                           # 请求类型, 请求编号, 错误信息
+
+    WORKERS = 2                # 响应当前选择的线程数
+    PREFETCH_STORES = 16       # 预取的命令输出最多保留的条数
+    PREFETCH_BYTES = 64 * 1024 * 1024  # 预取的命令输出最多保留的字节数
+
+    def __init__(self, resolver=None, index=None, cache=None, stats=None, parent=None):
+        super().__init__(parent)
+        self._pool = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="view-loader")
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="view-prefetch")
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._current = {KIND_COMMANDS: None, KIND_RESULT: None}
+        self._prefetch_generation = 0
+        self._prefetch_futures = []
+        self._stores = OrderedDict()   # (设备键, 命令) -> 预取的OutputStore
+        self._store_bytes = 0
+        self.reset(resolver, index, cache, stats)
+
+    def reset(self, resolver, index=None, cache=None, stats=None):
+        """切换采集目录：取消全部请求并丢弃预取的内容"""
+        self.cancel()
+        self.resolver = resolver
+        self.index = index
+        self.cache = cache
+        self.stats = stats
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=True)
+        self._prefetch_pool.shutdown(wait=True)
+
+    def is_current(self, kind, request_id):
+        with self._lock:
+            request = self._current[kind]
+            return request is not None and request.id == request_id
+
+    def cancel(self):
+        """取消全部请求和预取"""
+        with self._lock:
+            for kind, request in self._current.items():
+                if request is not None:
+                    request.cancel()
+                self._current[kind] = None
+        self.cancel_prefetch()
+        self._clear_stores()
+
+    def _new_request(self, kind):
+        with self._lock:
+            previous = self._current[kind]
+            if previous is not None:
+                previous.cancel()
+            self._next_id += 1
+            request = self._current[kind] = _Request(self._next_id)
+            return request
+
+    def load_commands(self, device):
+        """请求设备的命令列表，返回请求编号"""
+        request = self._new_request(KIND_COMMANDS)
+        request.future = self._pool.submit(self._load_commands, request, device)
+        return request.id
+
+    def _load_commands(self, request, device):
+        if request.cancelled:
+            return
+        start = time.perf_counter()
+        try:
+            commands = device_commands(device, self.resolver, self.index, self.cache)
+        except Exception as e:
+            self.failed.emit(KIND_COMMANDS, request.id, str(e))
+            return
+        if self.stats is not None:
+            self.stats.add("get_device_commands", time.perf_counter() - start, commands=len(commands))
+        if not request.cancelled:
+            self.commands_loaded.emit(request.id, device, commands)
+
+    def load_result(self, device, command):
+        """请求设备某条命令的输出，返回请求编号；已预取时立即送出结果"""
+        request = self._new_request(KIND_RESULT)
+        with self._lock:
+            store = self._stores.pop((device.key, command), None)
+            if store is not None:
+                self._store_bytes -= store.size
+        if store is not None:
+            if self.stats is not None:
+                self.stats.add("display_prefetched", 0.0, bytes_read=store.size)
+            self.result_loaded.emit(request.id, device, command, store, 0.0)
+            return request.id
+        request.future = self._pool.submit(self._load_result, request, device, command)
+        return request.id
+
+    def _load_result(self, request, device, command):
+        if request.cancelled:
+            return
+        start = time.perf_counter()
+        try:
+            store = load_command_output(device, command, self.resolver, self.index, self.cache,
+                                        lambda: request.cancelled)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(KIND_RESULT, request.id, str(e))
+            return
+        seconds = time.perf_counter() - start
+        if request.cancelled:
+            if store is not None:
+                store.close()
+            return
+        if self.stats is not None and store is not None:
+            self.stats.add("display_command_result", seconds, bytes_read=store.size)
+        self.result_loaded.emit(request.id, device, command, store, seconds)
+
+    def cancel_prefetch(self):
+        """放弃尚未完成的预取（已预取的内容保留）"""
+        with self._lock:
+            self._prefetch_generation += 1
+            futures, self._prefetch_futures = self._prefetch_futures, []
+        for future in futures:
+            future.cancel()
+
+    def _submit_prefetch(self, fn, *args):
+        with self._lock:
+            generation = self._prefetch_generation
+            self._prefetch_futures = [f for f in self._prefetch_futures if not f.done()]
+            self._prefetch_futures.append(self._prefetch_pool.submit(fn, generation, *args))
+
+    def _prefetch_stale(self, generation):
+        return generation != self._prefetch_generation
+
+    def prefetch_devices(self, devices):
+        """预取设备的命令列表（建立索引或解析结果文件），之后选中这些设备时无需等待"""
+        for device in devices:
+            self._submit_prefetch(self._prefetch_device, device)
+
+    def _prefetch_device(self, generation, device):
+        if self._prefetch_stale(generation):
+            return
+        start = time.perf_counter()
+        try:
+            commands = device_commands(device, self.resolver, self.index, self.cache)
+        except Exception:
+            return   # 预取失败不提示，选中该设备时会重新加载并报告错误
+        if self.stats is not None:
+            self.stats.add("prefetch_commands", time.perf_counter() - start, commands=len(commands))
+
+    def prefetch_results(self, device, commands):
+        """预取设备若干条命令的输出"""
+        for command in commands:
+            self._submit_prefetch(self._prefetch_result, device, command)
+
+    def _prefetch_result(self, generation, device, command):
+        key = (device.key, command)
+        with self._lock:
+            if self._prefetch_stale(generation) or key in self._stores:
+                return
+        start = time.perf_counter()
+        try:
+            store = load_command_output(device, command, self.resolver, self.index, self.cache,
+                                        lambda: self._prefetch_stale(generation))
+        except Exception:
+            return
+        if store is None:
+            return
+        if self.stats is not None:
+            self.stats.add("prefetch_result", time.perf_counter() - start, bytes_read=store.size)
+        with self._lock:
+            if self._prefetch_stale(generation) or key in self._stores or store.size > self.PREFETCH_BYTES:
+                store.close()
+                return
+            self._stores[key] = store
+            self._store_bytes += store.size
+            while len(self._stores) > self.PREFETCH_STORES or self._store_bytes > self.PREFETCH_BYTES:
+                _, evicted = self._stores.popitem(last=False)
+                self._store_bytes -= evicted.size
+                evicted.close()
+
+    def _clear_stores(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+            self._store_bytes = 0
+        for store in stores:
+            store.close()
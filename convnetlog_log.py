@@ -0,0 +1,84 @@
+"""运行信息窗口的日志汇集"""
+import logging
+import logging.handlers
+import os
+import traceback
+from collections import deque
+from datetime import datetime
+
+from PyQt5.QtCore import QObject, QTimer
+
+# 完整日志文件的默认位置
+LOG_FILE = os.path.join(os.path.expanduser("~"), ".convnetlog", "convnetlog.log")
+
+
+class LogSink(QObject):
+    """日志汇集
+
+    write 可在任意线程调用，只把消息放入队列；界面线程定时批量刷新到窗口，
+    窗口只保留最近 MAX_LINES 行，完整记录同时写入滚动日志文件。
+    """
+    FLUSH_INTERVAL_MS = 200
+    MAX_LINES = 5000
+    FILE_MAX_BYTES = 10 * 1024 * 1024
+    FILE_BACKUPS = 5
+
+    def __init__(self, widget, log_file=LOG_FILE, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.widget.setMaximumBlockCount(self.MAX_LINES)
+        self._queue = deque()
+        self._logger = None
+        self._handler = None
+        if log_file:
+            try:
+                os.makedirs(os.path.dirname(log_file), exist_ok=True)
+                self._handler = logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=self.FILE_MAX_BYTES, backupCount=self.FILE_BACKUPS, encoding="utf-8")
+                self._handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger = logging.getLogger("convnetlog")
+                self._logger.setLevel(logging.INFO)
+                self._logger.propagate = False
+                self._logger.addHandler(self._handler)
+            except OSError:
+                self._handler = None
+                self._logger = None
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start()
+
+    def write(self, message):
+        """添加日志消息（带时间戳和异常详细信息），线程安全"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 如果是异常对象，自动补充traceback
+        if isinstance(message, Exception):
+            details = traceback.format_exc()
+            entry = f"[{timestamp}] 错误: {str(message)}\n{details}"
+        else:
+            entry = f"[{timestamp}] {message}"
+        self._queue.append(entry)
+
+    def flush(self):
+        """把队列中的消息一次性写到窗口和日志文件（界面线程调用）"""
+        if not self._queue:
+            return
+        entries = []
+        while self._queue:
+            entries.append(self._queue.popleft())
+        if self._logger is not None:
+            self._logger.info("\n".join(entries))
+        # 窗口只需显示最后 MAX_LINES 条
+        self.widget.appendPlainText("\n".join(entries[-self.MAX_LINES:]))
+        # 自动滚动到底部
+        scrollbar = self.widget.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def close(self):
+        self._timer.stop()
+        self.flush()
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+            self._logger = None
@@ -0,0 +1,261 @@
+"""设备列表、命令列表、搜索结果、命令表格的Qt数据模型"""
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+from PyQt5.QtGui import QColor
+
+from convnetlog_parsers import COL_INT
+
+
+class _LazyRows:
+    """按批向视图暴露行（fetchMore），数据保存在 self._rows 中"""
+    FETCH_BATCH = 1000
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.FETCH_BATCH, len(self._rows) - self._loaded)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+            self._loaded += count
+            self.endInsertRows()
+
+    def fetch_all(self):
+        """一次性暴露全部行（筛选前调用）"""
+        if self._loaded < len(self._rows):
+            self.beginInsertRows(QModelIndex(), self._loaded, len(self._rows) - 1)
+            self._loaded = len(self._rows)
+            self.endInsertRows()
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._loaded = min(self.FETCH_BATCH, len(self._rows))
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        self._rows.extend(rows)
+        # 首屏未填满时直接显示，其余等视图滚动到底部时再取
+        if self._loaded < self.FETCH_BATCH:
+            count = min(self.FETCH_BATCH, len(self._rows)) - self._loaded
+            if count > 0:
+                self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+                self._loaded += count
+                self.endInsertRows()
+
+
+class DeviceTableModel(_LazyRows, QAbstractTableModel):
+    """设备表格模型，行数据为DeviceRecord"""
+    COLUMNS = (("name", "设备名称"), ("ip", "IP地址"), ("sn", "SN号"), ("state", "状态"))
+    FAILED_COLOR = QColor(255, 0, 0)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._loaded = 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section][1]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        device = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return getattr(device, self.COLUMNS[index.column()][0])
+        if role == Qt.ForegroundRole and device.state != "成功":
+            # 状态不是"成功"的设备整行红色字体
+            return self.FAILED_COLOR
+        if role == Qt.UserRole:
+            return device
+        return None
+
+    def device_at(self, row):
+        return self._rows[row]
+
+    def set_devices(self, devices):
+        self.set_rows(devices)
+
+    def append_devices(self, devices):
+        self.append_rows(devices)
+
+    def row_of(self, device):
+        """设备所在行，尚未暴露给视图时先全部取出；不存在时返回-1"""
+        for row, candidate in enumerate(self._rows):
+            if candidate is device:
+                if row >= self._loaded:
+                    self.fetch_all()
+                return row
+        return -1
+
+    def refresh(self):
+        """设备记录被原地更新后刷新显示"""
+        if self._loaded:
+            self.dataChanged.emit(self.index(0, 0), self.index(self._loaded - 1, len(self.COLUMNS) - 1))
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """对全部设备排序（包括尚未暴露给视图的行）"""
+        attr = self.COLUMNS[column][0]
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        tracked = [(index, self._rows[index.row()]) for index in persistent if index.row() < len(self._rows)]
+        self._rows.sort(key=lambda device: getattr(device, attr), reverse=(order == Qt.DescendingOrder))
+        rows = {id(device): row for row, device in enumerate(self._rows)}
+        for index, device in tracked:
+            row = rows[id(device)]
+            if row >= self._loaded:
+                self.changePersistentIndex(index, QModelIndex())
+            else:
+                self.changePersistentIndex(index, self.index(row, index.column()))
+        self.layoutChanged.emit()
+
+
+class DeviceFilterProxyModel(QSortFilterProxyModel):
+    """设备筛选：名称/IP/SN/状态中包含筛选文本的设备；排序交给源模型完成"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._needle = ""
+
+    def set_filter_text(self, text):
+        self._needle = text.strip().lower()
+        if self._needle:
+            self.sourceModel().fetch_all()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._needle:
+            return True
+        device = self.sourceModel().device_at(source_row)
+        needle = self._needle
+        return (needle in device.name.lower() or needle in device.ip or
+                needle in device.sn.lower() or needle in device.state)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= 0:
+            self.sourceModel().sort(column, order)
+
+
+class CommandListModel(_LazyRows, QAbstractListModel):
+    """命令列表模型"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._loaded = 0
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self._rows[index.row()]
+        return None
+
+    def set_commands(self, commands):
+        self.set_rows(commands)
+
+    def clear(self):
+        self.set_rows([])
+
+
+class SearchHitModel(_LazyRows, QAbstractTableModel):
+    """全文搜索结果模型，行数据为SearchHit"""
+    COLUMNS = (("device", "设备名称"), ("ip", "IP地址"), ("command", "命令"), ("line_no", "行号"), ("line", "内容"))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._loaded = 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section][1]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        hit = self._rows[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return getattr(hit, self.COLUMNS[index.column()][0])
+        if role == Qt.UserRole:
+            return hit
+        return None
+
+    def set_hits(self, hits):
+        self.set_rows(hits)
+
+
+class ColumnarTableModel(_LazyRows, QAbstractTableModel):
+    """显示ColumnarTable的模型：self._rows 为筛选、排序后的行号，单元格在显示时才从列中取值"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.table = None
+        self._rows = []
+        self._loaded = 0
+        self._numeric = ()
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.table is None else len(self.table.names)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and self.table is not None:
+            return self.table.names[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            value = self.table.columns[index.column()][row]
+            return "" if value is None else str(value)
+        if role == Qt.TextAlignmentRole and index.column() in self._numeric:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.UserRole:
+            return row
+        return None
+
+    def set_table(self, table, rows=None):
+        """rows 为要显示的行号（默认全部行）"""
+        self.table = table
+        self._numeric = {n for n, (name, kind) in enumerate(table.schema) if kind == COL_INT}
+        self.set_rows(range(len(table)) if rows is None else rows)
+
+    def row_values(self, row):
+        """视图第row行的全部取值"""
+        return self.table.row(self._rows[row])
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self.table is None or column < 0:
+            return
+        rows = self.table.sorted_rows(self.table.names[column], self._rows, order == Qt.DescendingOrder)
+        self.layoutAboutToBeChanged.emit()
+        self._rows = list(rows)
+        self.layoutChanged.emit()
+
+
+def resize_columns_from_sample(view, sample_rows=200, padding=24):
+    """按表头和前若干行内容估算列宽，避免对所有行调用resizeColumnsToContents"""
+    model = view.model()
+    metrics = view.fontMetrics()
+    header = view.horizontalHeader()
+    rows = min(model.rowCount(), sample_rows)
+    for column in range(model.columnCount()):
+        width = metrics.horizontalAdvance(str(model.headerData(column, Qt.Horizontal)))
+        for row in range(rows):
+            value = model.index(row, column).data()
+            if value:
+                width = max(width, metrics.horizontalAdvance(str(value)))
+        header.resizeSection(column, width + padding)
@@ -0,0 +1,514 @@
+"""常见H3C display命令输出的结构化解析与列式表格（不依赖PyQt5）
+
+解析器按命令注册（register_parser），命令可以缩写（如 dis int br），find_parser 按词数从多到少匹配。
+解析结果保存为列式表格 ColumnarTable：整数列为 array('q')，文本列为字典编码（array('I') 的编号 +
+去重后的取值），两千台设备的接口表也只占几十MB。同一段echo正文只解析一次：解析结果按正文摘要
+缓存在 TableCache 中（有CollectionIndex时直接使用索引里的摘要，无需读取输出）。
+command_table 把所有设备某条命令的输出合并为一张跨设备的表，供筛选和排序。
+"""
+import functools
+import hashlib
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from convnetlog_core import ECHO_DIGEST_SIZE, Echo, LoadCancelled, ResultCache, read_echo_at
+
+COL_STR = "str"
+COL_INT = "int"
+
+# 跨设备表格中每行前面的设备列
+DEVICE_COLUMNS = (("device", COL_STR), ("device_ip", COL_STR))
+
+
+class StrColumn:
+    """字典编码的文本列：每行一个编号，相同的取值只保存一份，编号0为None"""
+    __slots__ = ("codes", "values", "_lookup")
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values = [None]
+        self._lookup = {None: 0}
+
+    def _code(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self._code(value))
+
+    def append_repeated(self, value, count):
+        self.codes.extend(array("I", [self._code(value)]) * count)
+
+    def extend(self, other):
+        mapping = [self._code(value) for value in other.values]
+        self.codes.extend(array("I", [mapping[code] for code in other.codes]))
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def sort_key(self, row):
+        return self.values[self.codes[row]]
+
+    @property
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + sum(len(value) + 50 for value in self.values[1:])
+
+
+class IntColumn:
+    """整数列，缺失的值保存为MISSING"""
+    __slots__ = ("data",)
+    MISSING = -(1 << 63)
+
+    def __init__(self):
+        self.data = array("q")
+
+    def append(self, value):
+        self.data.append(self.MISSING if value is None else value)
+
+    def append_repeated(self, value, count):
+        self.data.extend(array("q", [self.MISSING if value is None else value]) * count)
+
+    def extend(self, other):
+        self.data.extend(other.data)
+
+    def __getitem__(self, row):
+        value = self.data[row]
+        return None if value == self.MISSING else value
+
+    def __len__(self):
+        return len(self.data)
+
+    def sort_key(self, row):
+        return self.data[row]
+
+    @property
+    def nbytes(self):
+        return self.data.itemsize * len(self.data)
+
+
+_COLUMN_TYPES = {COL_STR: StrColumn, COL_INT: IntColumn}
+
+
+class ColumnarTable:
+    """列式表格，columns 为 (列名, COL_STR/COL_INT) 序列"""
+
+    def __init__(self, columns):
+        self.schema = tuple(columns)
+        self.names = [name for name, kind in self.schema]
+        self.columns = [_COLUMN_TYPES[kind]() for name, kind in self.schema]
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def extend(self, other, prefix=()):
+        """追加另一张表的全部行，prefix 为本表前几列在这些行中的（相同的）取值"""
+        count = len(other)
+        if not count:
+            return
+        for column, value in zip(self.columns, prefix):
+            column.append_repeated(value, count)
+        for column, source in zip(self.columns[len(prefix):], other.columns):
+            column.extend(source)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def column(self, name):
+        return self.columns[self.index(name)]
+
+    def row(self, row):
+        return tuple(column[row] for column in self.columns)
+
+    def rows(self, indices=None):
+        for row in range(len(self)) if indices is None else indices:
+            yield self.row(row)
+
+    def select(self, conditions, indices=None):
+        """满足全部条件（Condition）的行号，indices 为候选行（默认全部行）"""
+        rows = array("I", range(len(self))) if indices is None else indices
+        for condition in conditions:
+            column = self.column(condition.name)
+            test = condition.test
+            rows = array("I", [row for row in rows if test(column[row])])
+        return rows
+
+    def sorted_rows(self, name, indices=None, reverse=False):
+        """按某一列排序后的行号，缺失的值无论升序还是降序都排在最后"""
+        column = self.column(name)
+        present = []
+        missing = array("I")
+        for row in range(len(self)) if indices is None else indices:
+            if column[row] is None:
+                missing.append(row)
+            else:
+                present.append(row)
+        present.sort(key=column.sort_key, reverse=reverse)
+        return array("I", present) + missing
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns) + 200
+
+
+class Condition:
+    """筛选条件：列名 运算符 值，运算符为 > >= < <= = != ~（包含，不区分大小写）"""
+    __slots__ = ("name", "op", "value", "test")
+
+    _PATTERN = re.compile(r"\s*([\w/.-]+)\s*(>=|<=|!=|>|<|=|~)\s*(.*?)\s*$")
+
+    def __init__(self, name, op, value, kind=COL_STR):
+        self.name = name
+        self.op = op
+        self.value = value
+        if op == "~":
+            needle = value.lower()
+            self.test = lambda v: v is not None and needle in str(v).lower()
+            return
+        if kind == COL_INT:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"列 {name} 为整数，无法与 {value!r} 比较") from None
+        compare = {
+            ">": lambda v: v > value, ">=": lambda v: v >= value, "<": lambda v: v < value,
+            "<=": lambda v: v <= value, "=": lambda v: v == value, "!=": lambda v: v != value,
+        }[op]
+        self.test = lambda v: v is not None and compare(v)
+
+    @classmethod
+    def parse(cls, text, table):
+        """解析 "input_errors>0" 形式的条件，列名必须是table中的列"""
+        m = cls._PATTERN.fullmatch(text)
+        if not m:
+            raise ValueError(f"无法识别的筛选条件: {text}")
+        name, op, value = m.groups()
+        if name not in table.names:
+            raise ValueError(f"没有这一列: {name}（可用的列: {', '.join(table.names)}）")
+        return cls(name, op, value, table.schema[table.index(name)][1])
+
+    def __repr__(self):
+        return f"Condition({self.name!r}, {self.op!r}, {self.value!r})"
+
+
+def _int(text):
+    """输出中的数字，'-'、'N/A' 等非数字为None"""
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+class CommandParser:
+    """一条命令的解析器：parse(正文) 产出与columns对应的行
+
+    args=True 时命令后面可以带参数（如 display arp vlan 10），输出格式相同。
+    """
+    __slots__ = ("name", "command", "words", "columns", "args", "parse")
+
+    def __init__(self, name, command, columns, parse, args=False):
+        self.name = name
+        self.command = command
+        self.words = command.lower().split()
+        self.columns = tuple(columns)
+        self.args = args
+        self.parse = parse
+
+    def matches(self, words):
+        """命令的各词是否为注册命令各词的前缀（H3C命令可以缩写）"""
+        if len(words) < len(self.words) or (len(words) > len(self.words) and not self.args):
+            return False
+        return all(spec.startswith(word) for spec, word in zip(self.words, words))
+
+    def table(self, body):
+        """解析一段echo正文，返回ColumnarTable"""
+        table = ColumnarTable(self.columns)
+        for row in self.parse(body):
+            table.append(row)
+        return table
+
+    def __repr__(self):
+        return f"CommandParser({self.name!r})"
+
+
+_PARSERS = []
+_registry_lock = threading.Lock()
+
+
+def register_parser(command, columns, args=False, name=None):
+    """注册解析器的装饰器：被装饰的函数接收echo正文（不含提示符行），产出行元组"""
+    def decorator(parse):
+        parser = CommandParser(name or command, command, columns, parse, args)
+        with _registry_lock:
+            _PARSERS[:] = [p for p in _PARSERS if p.name != parser.name]
+            _PARSERS.append(parser)
+            # 词数多的优先，例如 display interface brief 先于 display interface
+            _PARSERS.sort(key=lambda p: len(p.words), reverse=True)
+        return parse
+    return decorator
+
+
+def parsers():
+    with _registry_lock:
+        return list(_PARSERS)
+
+
+def find_parser(command):
+    """命令对应的解析器，没有时返回None；管道过滤（| include 等）不影响输出格式，忽略"""
+    words = command.split("|", 1)[0].lower().split()
+    if not words:
+        return None
+    for parser in parsers():
+        if parser.matches(words):
+            return parser
+    return None
+
+
+# ---- 内置解析器 ----
+
+@register_parser("display version", (("software", COL_STR), ("release", COL_STR), ("model", COL_STR),
+                                     ("uptime", COL_STR)))
+def _parse_version(body):
+    software = release = model = uptime = None
+    for line in body.splitlines():
+        m = re.search(r"Version ([^,\s]+), Release (\S+)", line)
+        if m and software is None:
+            software, release = m.groups()
+            continue
+        m = re.match(r"\s*H3C (.+?) uptime is (.+?)\s*$", line)
+        if m and model is None:
+            model, uptime = m.groups()
+    if software is not None or model is not None:
+        yield software, release, model, uptime
+
+
+@register_parser("display interface brief",
+                 (("interface", COL_STR), ("link", COL_STR), ("protocol", COL_STR), ("primary_ip", COL_STR),
+                  ("speed", COL_STR), ("duplex", COL_STR), ("type", COL_STR), ("pvid", COL_INT),
+                  ("description", COL_STR)), args=True)
+def _parse_interface_brief(body):
+    # 路由模式: Interface Link Protocol Primary IP Description
+    # 桥模式:   Interface Link Speed Duplex Type PVID Description
+    mode = None
+    for line in body.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith("Interface") and "Link" in stripped:
+            mode = "bridge" if "Speed" in stripped else "route"
+            continue
+        # 说明行（Link: ADM - administratively down 等）的首个词以冒号结尾
+        if mode is None or stripped.endswith(":") or stripped.split(None, 1)[0].endswith(":"):
+            continue
+        if mode == "route":
+            fields = stripped.split(None, 4)
+            if len(fields) < 4:
+                continue
+            yield (fields[0], fields[1], fields[2], fields[3], None, None, None, None,
+                   fields[4] if len(fields) > 4 else None)
+        else:
+            fields = stripped.split(None, 6)
+            if len(fields) < 6:
+                continue
+            yield (fields[0], fields[1], None, None, fields[2], fields[3], fields[4], _int(fields[5]),
+                   fields[6] if len(fields) > 6 else None)
+
+
+@register_parser("display arp", (("ip", COL_STR), ("mac", COL_STR), ("vlan", COL_STR), ("interface", COL_STR),
+                                 ("aging", COL_INT), ("type", COL_STR)), args=True)
+def _parse_arp(body):
+    header = False
+    for line in body.splitlines():
+        fields = line.split()
+        if not header:
+            header = line.lstrip().startswith("IP address")
+            continue
+        if len(fields) >= 6 and fields[0][:1].isdigit():
+            yield fields[0], fields[1], fields[2], fields[3], _int(fields[4]), fields[5]
+
+
+@register_parser("display mac-address", (("mac", COL_STR), ("vlan", COL_INT), ("state", COL_STR),
+                                         ("port", COL_STR), ("aging", COL_STR)), args=True)
+def _parse_mac_address(body):
+    header = False
+    for line in body.splitlines():
+        if not header:
+            header = line.lstrip().startswith("MAC Address")
+            continue
+        fields = line.split()
+        # 状态可能由两个词组成（如 Config static）
+        if len(fields) >= 5 and re.fullmatch(r"[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}", fields[0]):
+            yield fields[0], _int(fields[1]), " ".join(fields[2:-2]), fields[-2], fields[-1]
+
+
+_COUNTER_COLUMNS = (("interface", COL_STR), ("total", COL_INT), ("broadcast", COL_INT), ("multicast", COL_INT),
+                    ("errors", COL_INT))
+
+
+def _parse_counters(body):
+    header = False
+    for line in body.splitlines():
+        if not header:
+            header = line.lstrip().startswith("Interface") and "Total" in line
+            continue
+        fields = line.split()
+        if len(fields) == 5:
+            yield fields[0], _int(fields[1]), _int(fields[2]), _int(fields[3]), _int(fields[4])
+
+
+register_parser("display counters inbound interface", _COUNTER_COLUMNS, args=True)(_parse_counters)
+register_parser("display counters outbound interface", _COUNTER_COLUMNS, args=True)(_parse_counters)
+
+
+@register_parser("display interface", (("interface", COL_STR), ("state", COL_STR), ("protocol", COL_STR),
+                                       ("description", COL_STR), ("input_errors", COL_INT), ("crc", COL_INT),
+                                       ("output_errors", COL_INT)), args=True)
+def _parse_interface(body):
+    record = None
+    for line in body.splitlines():
+        stripped = line.strip()
+        if line and not line[0].isspace() and " " not in stripped and not stripped.endswith(":"):
+            # 每个接口的信息以单独一行的接口名开始
+            if record is not None:
+                yield tuple(record)
+            record = [stripped, None, None, None, None, None, None]
+            continue
+        if record is None:
+            continue
+        if stripped.startswith("Current state:"):
+            record[1] = stripped.split(":", 1)[1].strip()
+        elif stripped.startswith("Line protocol state:"):
+            record[2] = stripped.split(":", 1)[1].strip()
+        elif stripped.startswith("Description:"):
+            record[3] = stripped.split(":", 1)[1].strip()
+        else:
+            m = re.match(r"Input:\s+(\d+) input errors", stripped)
+            if m:
+                record[4] = int(m.group(1))
+            m = re.search(r"(\d+) CRC", stripped)
+            if m:
+                record[5] = int(m.group(1))
+            m = re.match(r"Output:\s+(\d+) output errors", stripped)
+            if m:
+                record[6] = int(m.group(1))
+    if record is not None:
+        yield tuple(record)
+
+
+# ---- 按正文摘要缓存的解析结果 ----
+
+# 解析结果缓存默认内存预算
+TABLE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class TableCache:
+    """解析结果的LRU缓存，键为 (解析器名称, 正文摘要)，多台设备相同的输出只解析一次；线程安全"""
+
+    def __init__(self, max_bytes=TABLE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            table = self._entries.get(key)
+            if table is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return table
+
+    def put(self, key, table):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = table
+            self._bytes += table.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+
+def _read_body(path, offset, length, encoding):
+    return Echo(read_echo_at(path, offset, length, encoding)).body
+
+
+def _echo_bodies(path, command, index, cache):
+    """结果文件中某条命令每段echo的 (摘要, 读取正文的函数)；有索引时摘要来自索引，不读取内容"""
+    if index is not None:
+        encoding, entries = index.entries(path)
+        for cmd, offset, length, digest in entries:
+            if cmd == command and offset is not None:
+                yield "index:" + digest, functools.partial(_read_body, path, offset, length, encoding)
+        return
+    for echo in cache.get(path).by_command.get(command, ()):
+        if echo is not None and echo.body is not None:
+            digest = hashlib.blake2b(echo.body.encode("utf-8"), digest_size=ECHO_DIGEST_SIZE).hexdigest()
+            yield "text:" + digest, functools.partial(str, echo.body)
+
+
+def device_tables(device, command, resolver, parser=None, index=None, cache=None, tables=None, stats=None):
+    """设备某条命令每段输出的解析结果（ColumnarTable列表），没有对应的解析器时返回空列表"""
+    parser = parser or find_parser(command)
+    if parser is None:
+        return []
+    if index is None and cache is None:
+        cache = ResultCache()
+    result = []
+    for p in resolver.files_for(device):
+        for digest, read_body in _echo_bodies(p, command, index, cache):
+            key = (parser.name, digest)
+            table = tables.get(key) if tables is not None else None
+            if table is None:
+                start = time.perf_counter()
+                body = read_body()
+                table = parser.table(body) if body is not None else ColumnarTable(parser.columns)
+                if stats is not None:
+                    stats.add("parse_table", time.perf_counter() - start, rows=len(table))
+                if tables is not None:
+                    tables.put(key, table)
+            elif stats is not None:
+                stats.add("parse_table_cached", 0.0, rows=len(table))
+            result.append(table)
+    return result
+
+
+def command_table(devices, command, resolver, index=None, cache=None, tables=None, stopped=None, stats=None):
+    """所有设备某条命令输出合并的表格，每行前面是设备名和IP；没有对应的解析器时返回None
+
+    stopped 为返回是否中止的可调用对象，每处理完一台设备检查一次，中止时抛出LoadCancelled。
+    """
+    parser = find_parser(command)
+    if parser is None:
+        return None
+    if index is None and cache is None:
+        cache = ResultCache()
+    merged = ColumnarTable(DEVICE_COLUMNS + parser.columns)
+    for device in devices:
+        if stopped is not None and stopped():
+            raise LoadCancelled()
+        for table in device_tables(device, command, resolver, parser, index, cache, tables, stats):
+            merged.extend(table, (device.name, device.ip))
+    return merged
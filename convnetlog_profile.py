@@ -0,0 +1,116 @@
+"""处理过程的性能统计：按阶段累计耗时、读写字节数与计数，可导出JSON报告（不依赖PyQt5）
+
+各处理函数通过可选的 stats 参数接收RunStats；多线程中的耗时直接累加（可能大于实际用时），
+子进程中的统计以 totals() 字典返回，在主进程中用 merge() 合并。
+"""
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+
+# 报告JSON的格式版本，字段变化时递增
+PROFILE_FORMAT = 1
+
+_FIELDS = ("seconds", "calls", "bytes_read", "bytes_written")
+
+
+class RunStats:
+    """一次运行（目录解析、查看、转换）的分阶段统计，线程安全"""
+
+    def __init__(self, name=""):
+        self.name = name
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self._stages = {}   # 阶段 -> {"seconds", "calls", "bytes_read", "bytes_written", 其他计数}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds=0.0, bytes_read=0, bytes_written=0, calls=1, **counts):
+        """累加一次阶段统计"""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = dict.fromkeys(_FIELDS, 0)
+            entry["seconds"] += seconds
+            entry["calls"] += calls
+            entry["bytes_read"] += bytes_read
+            entry["bytes_written"] += bytes_written
+            for key, value in counts.items():
+                entry[key] = entry.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def timed(self, stage, **counts):
+        """统计with块的耗时；块内可向产出的字典补充 bytes_read 等字段"""
+        extra = dict(counts)
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.add(stage, time.perf_counter() - start, **extra)
+
+    def totals(self):
+        """各阶段累计值的副本（可跨进程传递）"""
+        with self._lock:
+            return {stage: dict(entry) for stage, entry in self._stages.items()}
+
+    def merge(self, totals):
+        for stage, entry in totals.items():
+            entry = dict(entry)
+            self.add(stage, entry.pop("seconds"), entry.pop("bytes_read"), entry.pop("bytes_written"),
+                     entry.pop("calls"), **entry)
+
+    def bytes_total(self):
+        """所有阶段的 (读取字节数, 写出字节数)，用于计算实时吞吐量"""
+        with self._lock:
+            return (sum(entry["bytes_read"] for entry in self._stages.values()),
+                    sum(entry["bytes_written"] for entry in self._stages.values()))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def report(self, **meta):
+        """完整的性能报告（字典），meta 为附加说明（参数等）"""
+        stages = {}
+        for stage, entry in self.totals().items():
+            seconds = entry["seconds"]
+            moved = entry["bytes_read"] + entry["bytes_written"]
+            entry["seconds"] = round(seconds, 4)
+            entry["mb_per_s"] = round(moved / 1048576 / seconds, 2) if seconds > 0 and moved else None
+            stages[stage] = entry
+        return {
+            "format": PROFILE_FORMAT,
+            "name": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "elapsed": round(self.elapsed, 4),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "meta": meta,
+            "stages": stages,
+        }
+
+
+def save_report(path, reports):
+    """把一个或多个报告写入JSON文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """path 不为空时用cProfile统计with块（只统计当前线程），结束后写入path，可用pstats/snakeviz查看"""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(path))
@@ -0,0 +1,273 @@
+"""采集目录全部命令输出的全文检索（不依赖PyQt5）
+
+倒排索引使用SQLite FTS5的无内容表（content=''），只保存词项，不重复保存输出内容，
+只索引echo正文（不含首尾的提示符行），正文相同（摘要相同）的echo只索引一次；
+命中后按CollectionIndex记录的字节位置读取echo，逐行确认并返回 (设备, 命令, 行) 结果。
+"""
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from convnetlog_core import Echo, read_echo_at
+from convnetlog_fs import ArchivePath, collection_root, fs_stat, join_key, relative_key, sidecar_path
+
+# 采集目录下的全文索引文件名
+SEARCH_FILE_NAME = ".convnetlog_search.sqlite"
+
+# 查询方式
+MODE_TERM = "term"      # 所有词语出现在同一行
+MODE_PHRASE = "phrase"  # 词语按顺序相邻出现
+MODE_REGEX = "regex"    # 正则表达式（先用其中的字面词语在索引中预筛选）
+
+SearchHit = namedtuple("SearchHit", "device ip sn command line_no line")
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """与FTS5 unicode61分词一致：连续的字母数字为一个词，不区分大小写"""
+    return _TOKEN.findall(text.lower())
+
+
+def _fts_quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def regex_prefilter(pattern):
+    r"""从正则表达式中提取必须出现的词语，返回FTS5查询串；无法提取时返回None
+
+    只使用顶层连续字面字符中的词：中间的词完整匹配，结尾的词按前缀匹配，
+    开头的词只有在其前面是词边界或行首时才使用（re.search 可以从词的中间开始匹配）。
+
+    >>> regex_prefilter("rror") is None
+    True
+    >>> regex_prefilter(r"InErrors: \d+")
+    >>> regex_prefilter(r"\bInput errors: \d+")
+    '"input" AND "errors"'
+    """
+    try:
+        parsed = list(sre_parse.parse(pattern))
+    except (re.error, TypeError):
+        return None
+    terms = []
+    run = []
+    bounded = False   # 当前字面串前面是否为词边界（只有 ^、\b 之后才是）
+
+    def flush(end_bounded):
+        text = "".join(run)
+        for m in _TOKEN.finditer(text.lower()):
+            starts_at_edge = m.start() == 0
+            ends_at_edge = m.end() == len(text)
+            if starts_at_edge and not bounded:
+                continue
+            if ends_at_edge and not end_bounded:
+                terms.append(_fts_quote(m.group()) + "*")
+            else:
+                terms.append(_fts_quote(m.group()))
+        run.clear()
+
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        at_boundary = op is sre_parse.AT and arg in (sre_parse.AT_BOUNDARY, sre_parse.AT_BEGINNING,
+                                                     sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END,
+                                                     sre_parse.AT_END_STRING)
+        if run:
+            flush(at_boundary)
+        bounded = at_boundary
+    if run:
+        flush(False)
+    return " AND ".join(terms) if terms else None
+
+
+def build_query(query, mode):
+    """返回 (FTS5查询串或None, 逐行匹配函数)"""
+    if mode == MODE_REGEX:
+        regex = re.compile(query)
+        return regex_prefilter(query), lambda line: regex.search(line) is not None
+    tokens = tokenize(query)
+    if not tokens:
+        return None, None
+    if mode == MODE_PHRASE:
+        n = len(tokens)
+
+        def match(line):
+            words = tokenize(line)
+            return any(words[i:i + n] == tokens for i in range(len(words) - n + 1))
+        return _fts_quote(" ".join(tokens)), match
+
+    wanted = set(tokens)
+    return " AND ".join(_fts_quote(t) for t in tokens), lambda line: wanted.issubset(tokenize(line))
+
+
+def _echo_body(text):
+    body = Echo(text).body
+    return body if body is not None else ""
+
+
+class SearchIndex:
+    """采集目录的全文索引
+
+    每个echo为一篇文档，文档信息（设备、命令、echo字节位置、正文摘要）保存在docs表；
+    正文相同的echo共用bodies表中的一条记录，词项按body保存在FTS5无内容表中。
+    按结果文件的 mtime/size 增量更新；文件变化后旧文档从docs表删除，不再被引用的body
+    成为孤儿记录，查询时自动忽略，孤儿过多时整体重建。
+    """
+    SCHEMA_VERSION = "2"
+    REBUILD_ORPHAN_RATIO = 0.3
+    COMMIT_DOCS = 500
+
+    def __init__(self, root):
+        root = collection_root(root)
+        self.root = root if isinstance(root, ArchivePath) else root.resolve()
+        self.db_path = sidecar_path(self.root, SEARCH_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != self.SCHEMA_VERSION:
+                self._drop_tables()
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (self.SCHEMA_VERSION,))
+            self._create_tables()
+
+    def _drop_tables(self):
+        for table in ("files", "docs", "bodies", "fts"):
+            self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def _create_tables(self):
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bodies (id INTEGER PRIMARY KEY AUTOINCREMENT, digest TEXT UNIQUE)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, file TEXT, device TEXT, ip TEXT, sn TEXT, "
+                           "command TEXT, offset INTEGER, length INTEGER, encoding TEXT, body INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docs_file ON docs (file)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docs_body ON docs (body)")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5("
+                           "body, content='', tokenize='unicode61 remove_diacritics 0')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, path):
+        return relative_key(self.root, path)
+
+    def _path(self, key):
+        return join_key(self.root, key)
+
+    def doc_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def body_count(self):
+        """已索引的不同echo内容数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM bodies").fetchone()[0]
+
+    def _body_id(self, digest, read_body):
+        """摘要对应的body编号，首次出现时读取echo正文写入FTS"""
+        row = self._conn.execute("SELECT id FROM bodies WHERE digest = ?", (digest,)).fetchone()
+        if row is not None:
+            return row[0]
+        body_id = self._conn.execute("INSERT INTO bodies (digest) VALUES (?)", (digest,)).lastrowid
+        self._conn.execute("INSERT INTO fts (rowid, body) VALUES (?, ?)", (body_id, read_body()))
+        return body_id
+
+    def update(self, devices, resolver, collection_index, stopped=None, on_progress=None):
+        """为设备的结果文件建立/更新索引，返回本次新索引的文件数
+
+        collection_index 提供命令、echo的字节位置和摘要；on_progress(已处理设备数, 设备总数)。
+        """
+        devices = list(devices)
+        with self._lock, self._conn:
+            live = self._conn.execute("SELECT COUNT(DISTINCT body) FROM docs").fetchone()[0]
+            total = self._conn.execute("SELECT COUNT(*) FROM bodies").fetchone()[0]
+            if total - live > live * self.REBUILD_ORPHAN_RATIO:
+                self._drop_tables()
+                self._create_tables()
+        indexed = 0
+        pending_docs = 0
+        try:
+            for done, device in enumerate(devices, 1):
+                if stopped is not None and stopped():
+                    break
+                for p in resolver.files_for(device):
+                    key = self._key(p)
+                    st = fs_stat(p)
+                    with self._lock:
+                        row = self._conn.execute("SELECT mtime, size FROM files WHERE path = ?", (key,)).fetchone()
+                    if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+                        continue
+                    encoding, entries = collection_index.entries(p)
+                    with self._lock:
+                        self._conn.execute("DELETE FROM docs WHERE file = ?", (key,))
+                        for command, offset, length, digest in entries:
+                            if offset is None:
+                                continue
+                            body_id = self._body_id(
+                                digest, lambda: _echo_body(read_echo_at(p, offset, length, encoding)))
+                            self._conn.execute(
+                                "INSERT INTO docs (file, device, ip, sn, command, offset, length, encoding, body) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (key, device.name, device.ip, device.sn, command, offset, length, encoding, body_id))
+                            pending_docs += 1
+                        self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                                           (key, st.st_mtime_ns, st.st_size))
+                        if pending_docs >= self.COMMIT_DOCS:
+                            self._conn.commit()
+                            pending_docs = 0
+                    indexed += 1
+                if on_progress is not None:
+                    on_progress(done, len(devices))
+        finally:
+            with self._lock:
+                self._conn.commit()
+        return indexed
+
+    def search(self, query, mode=MODE_TERM, max_hits=1000, stopped=None):
+        """查询，返回SearchHit列表（最多max_hits条）
+
+        正文相同的echo只读取并逐行匹配一次，命中行用于引用它的所有文档；行号从echo首行算起。
+        stopped 为返回是否中止的可调用对象，每读取一段正文前检查一次，中止时返回已找到的结果。
+        """
+        fts_query, match_line = build_query(query, mode)
+        if match_line is None:
+            return []
+        columns = ("docs.body, docs.file, docs.device, docs.ip, docs.sn, docs.command, docs.offset, docs.length, "
+                   "docs.encoding")
+        with self._lock:
+            if fts_query is not None:
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM fts JOIN docs ON docs.body = fts.rowid WHERE fts MATCH ? "
+                    "ORDER BY docs.id", (fts_query,)).fetchall()
+            else:
+                # 正则中没有可用于预筛选的词语，只能逐篇检查
+                rows = self._conn.execute(f"SELECT {columns} FROM docs ORDER BY id").fetchall()
+        matched = {}   # body -> [(行号, 行)]
+        hits = []
+        for body_id, key, device, ip, sn, command, offset, length, encoding in rows:
+            lines = matched.get(body_id)
+            if lines is None:
+                if stopped is not None and stopped():
+                    return hits
+                try:
+                    body = _echo_body(read_echo_at(self._path(key), offset, length, encoding))
+                except OSError:
+                    continue
+                # 正文从echo的第二行开始
+                lines = matched[body_id] = [(line_no, line.rstrip("\r"))
+                                            for line_no, line in enumerate(body.split("\n"), 2)
+                                            if match_line(line)]
+            for line_no, line in lines:
+                hits.append(SearchHit(device, ip, sn, command, line_no, line))
+                if len(hits) >= max_hits:
+                    return hits
+        return hits
@@ -0,0 +1,173 @@
+"""大体积命令输出的只读查看器：按滚动位置分块加载，支持在整个输出中查找"""
+import bisect
+
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QTextEdit, QLineEdit, QPushButton, QCheckBox, QLabel
+)
+from PyQt5.QtGui import QFont, QTextCursor, QTextCharFormat, QColor
+
+
+class LargeOutputView(QWidget):
+    """只读输出查看器
+
+    内容来自OutputStore：首次只加载第一块，滚动接近底部时再加载下一块，
+    因此无论输出多大都能立即显示首屏。查找在整个存储中进行，命中位置尚未加载时
+    自动加载到该位置。
+    """
+    CHUNK_BYTES = 256 * 1024
+    INITIAL_CHUNKS = 4   # 首屏最多加载的块数
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._store = None
+        self._loaded_bytes = 0
+        self._chunks = []        # 已加载分块的 (起始字节, 起始文档位置)
+        self._doc_length = 0
+        self._search_from = 0
+        self._loading = False
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.text.setFont(QFont("Consolas", 10))
+        self.text.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        layout.addWidget(self.text, 1)
+
+        find_layout = QHBoxLayout()
+        self.find_edit = QLineEdit()
+        self.find_edit.setPlaceholderText("在输出中查找")
+        self.find_edit.setClearButtonEnabled(True)
+        self.find_edit.textChanged.connect(self._on_find_text_changed)
+        self.find_edit.returnPressed.connect(self.find_next)
+        self.find_next_btn = QPushButton("查找下一个")
+        self.find_next_btn.clicked.connect(self.find_next)
+        self.case_checkbox = QCheckBox("区分大小写")
+        self.status_label = QLabel()
+        find_layout.addWidget(self.find_edit, 1)
+        find_layout.addWidget(self.find_next_btn)
+        find_layout.addWidget(self.case_checkbox)
+        find_layout.addWidget(self.status_label)
+        layout.addLayout(find_layout)
+
+    def clear(self):
+        self._reset()
+        self.text.clear()
+        self.status_label.clear()
+
+    def set_text(self, text):
+        """显示一段简短的提示文字"""
+        self.clear()
+        self.text.setPlainText(text)
+
+    def set_store(self, store):
+        """显示OutputStore中的内容，查看器负责关闭之前的存储"""
+        self.clear()
+        self._store = store
+        store.finish()
+        self._load_until_filled()
+
+    def _reset(self):
+        if self._store is not None:
+            self._store.close()
+        self._store = None
+        self._loaded_bytes = 0
+        self._chunks = []
+        self._doc_length = 0
+        self._search_from = 0
+
+    def _load_next_chunk(self):
+        """加载下一块，已全部加载时返回False"""
+        store = self._store
+        if store is None or self._loaded_bytes >= store.size:
+            return False
+        text, end = store.read_chunk(self._loaded_bytes, self.CHUNK_BYTES)
+        self._chunks.append((self._loaded_bytes, self._doc_length))
+        self._loading = True
+        try:
+            cursor = QTextCursor(self.text.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        finally:
+            self._loading = False
+        self._doc_length += len(text.encode("utf-16-le")) // 2
+        self._loaded_bytes = end
+        self._update_status()
+        return True
+
+    def _load_until_filled(self):
+        """加载到内容超过一屏为止"""
+        scrollbar = self.text.verticalScrollBar()
+        for _ in range(self.INITIAL_CHUNKS):
+            if not self._load_next_chunk() or scrollbar.maximum() > 0:
+                break
+
+    def _on_scroll(self, value):
+        if self._loading:
+            return
+        scrollbar = self.text.verticalScrollBar()
+        if value >= scrollbar.maximum() - scrollbar.pageStep():
+            self._load_next_chunk()
+
+    def _update_status(self):
+        store = self._store
+        if store is None or store.size == 0:
+            self.status_label.clear()
+        elif self._loaded_bytes >= store.size:
+            self.status_label.setText(f"{store.size / 1048576:.1f} MB")
+        else:
+            self.status_label.setText(f"已加载 {self._loaded_bytes / 1048576:.1f} / {store.size / 1048576:.1f} MB")
+
+    def _doc_position(self, byte_offset):
+        """字节偏移（必须已加载）对应的文档位置"""
+        i = bisect.bisect_right(self._chunks, (byte_offset, float("inf"))) - 1
+        chunk_start, doc_start = self._chunks[i]
+        return doc_start + self._store.decoded_length(chunk_start, byte_offset)
+
+    def _on_find_text_changed(self, text):
+        # 增量查找：从当前命中位置开始重新匹配
+        self._find(text, self._search_from)
+
+    def find_text(self, needle):
+        """从头查找指定文字并定位到第一个命中位置"""
+        self.find_edit.blockSignals(True)
+        self.find_edit.setText(needle)
+        self.find_edit.blockSignals(False)
+        self._find(needle, 0)
+
+    def find_next(self):
+        self._find(self.find_edit.text(), self._search_from + 1)
+
+    def _find(self, needle, start):
+        store = self._store
+        if store is None or not needle:
+            self.text.setExtraSelections([])
+            self._update_status()
+            return
+        case_sensitive = self.case_checkbox.isChecked()
+        match = store.find(needle, start, case_sensitive)
+        if match is None and start > 0:
+            match = store.find(needle, 0, case_sensitive)  # 到末尾后从头查找
+        if match is None:
+            self.text.setExtraSelections([])
+            self.status_label.setText("未找到")
+            return
+        match_start, match_end = match
+        while self._loaded_bytes < match_end and self._load_next_chunk():
+            pass
+        self._search_from = match_start
+        begin = self._doc_position(match_start)
+        end = self._doc_position(match_end)
+        cursor = QTextCursor(self.text.document())
+        cursor.setPosition(begin)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.text.setTextCursor(cursor)
+        self.text.centerCursor()
+        selection = QTextEdit.ExtraSelection()
+        highlight = QTextCharFormat()
+        highlight.setBackground(QColor(255, 230, 0))
+        selection.format = highlight
+        selection.cursor = cursor
+        self.text.setExtraSelections([selection])
@@ -0,0 +1,376 @@
+"""监视模式：采集仍在进行时持续发现新完成或有变化的文件，只处理增量（不依赖PyQt5）
+
+CollectionWatcher 记录已扫描目录的mtime，每次轮询只重新扫描mtime有变化（或刚变化不久）的目录，
+不再遍历整个采集目录；新出现或有变化的 cmd_info_*.xml、ssh_*.xml 文件先进入待定状态，
+大小和mtime保持 settle_seconds 秒不变后才视为写完并交出，避免读取写了一半的文件。
+Linux上可用inotify时，目录中有文件写完、新建、改名或删除会立即唤醒等待，无需等到下一次轮询；
+网络共享目录收不到inotify事件，仍按轮询发现变化。
+
+LiveCollection 把交出的变化登记到设备登记表，得出新增、更新的设备和结果文件有变化的设备，
+调用方只需转换或刷新这些设备。
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from convnetlog_core import (
+    CANCEL_POLL_SECONDS, CMD_INFO_PATTERN, SSH_RESULT_PATTERN, DeviceRegistry, ResultResolver, choose_result_dir,
+    read_cmd_info
+)
+from convnetlog_fs import as_path, collection_root, is_archive
+
+# 默认轮询间隔、文件保持不变多久后视为写完（秒）
+POLL_SECONDS = 5.0
+SETTLE_SECONDS = 10.0
+
+# 一次轮询交出的变化：写完的cmd_info文件、结果文件（路径对象），以及跟踪的采集（result_目录）是否变了
+WatchChanges = namedtuple("WatchChanges", "cmd_info results snapshot_changed")
+
+
+class _Inotify:
+    """通过ctypes调用libc的inotify接口，只监视目录本身（不递归）"""
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_IGNORED = 0x8000
+    # 写入过程中的IN_MODIFY不订阅，避免大文件写入时频繁唤醒
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ATTRIB
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._paths = {}   # 监视描述符 -> 目录
+        self._wds = {}     # 目录 -> 监视描述符
+
+    def add(self, path):
+        """监视目录，失败（如超出系统的监视数上限）时返回False，该目录仍由轮询发现变化"""
+        if path in self._wds:
+            return True
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            return False
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    def remove(self, path):
+        wd = self._wds.pop(path, None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout):
+        """等待事件，返回有事件的目录集合（超时为空集合）"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        dirs = set()
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, cookie, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size + length
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & self.IN_IGNORED:
+                # 目录已删除，内核已移除监视
+                del self._paths[wd]
+                self._wds.pop(path, None)
+            dirs.add(path)
+        return dirs
+
+    def close(self):
+        os.close(self.fd)
+
+
+def inotify_available():
+    return sys.platform.startswith("linux") and hasattr(ctypes.CDLL(ctypes.util.find_library("c")), "inotify_init1")
+
+
+class CollectionWatcher:
+    """监视采集目录中的 cmd_info_*.xml 与 ssh_*.xml 文件
+
+    snapshot 为要跟踪的采集（result_目录名），None时跟踪最新的一次：出现更新的result_目录时
+    改为跟踪新的一次，交出的变化中 snapshot_changed 为True，之后交出新一次采集的全部文件。
+    首次轮询交出已有的全部（已写完的）文件。只支持普通目录，不支持压缩包。
+    """
+
+    def __init__(self, root, snapshot=None, poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS,
+                 use_inotify=True, log=None, stats=None):
+        if is_archive(root):
+            raise ValueError(f"压缩包中的采集结果不会变化，无法监视: {root}")
+        self.root = str(collection_root(root))
+        self.snapshot = snapshot
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.log = log
+        self.stats = stats
+        self._dirs = {}       # 已扫描的目录 -> 扫描时的mtime（ns）
+        self._brain = {}      # BrainCollect目录 -> 正在跟踪的result_目录
+        self._files = {}      # 目录 -> 其中跟踪的文件
+        self._known = {}      # 已交出的文件 -> (size, mtime_ns)
+        self._pending = {}    # 待定的文件 -> (size, mtime_ns, 最近一次变化时的monotonic时间)
+        self._dirty = set()   # inotify报告有事件的目录
+        self._snapshot_changed = False
+        self._inotify = None
+        if use_inotify and inotify_available():
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                if log is not None:
+                    log(f"无法使用inotify，改为轮询: {e}")
+        self._add_dir(self.root)
+
+    @property
+    def uses_inotify(self):
+        return self._inotify is not None
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _add_dir(self, path):
+        self._dirs[path] = None
+        if self._inotify is not None:
+            self._inotify.add(path)
+
+    def _forget_tree(self, path):
+        """不再跟踪path及其下的目录和文件"""
+        prefix = path + os.sep
+        for table in (self._dirs, self._brain, self._files, self._known, self._pending):
+            for key in [key for key in table if key == path or key.startswith(prefix)]:
+                del table[key]
+                if table is self._dirs and self._inotify is not None:
+                    self._inotify.remove(key)
+
+    def _scan(self, path, mtime, now):
+        """重新扫描一个目录：登记新的子目录，把新出现或有变化的文件加入待定"""
+        self._dirs[path] = mtime
+        brain_collect = os.path.basename(path) == "BrainCollect"
+        present = set()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if brain_collect:
+                        continue
+                    if entry.name == "BrainCollect":
+                        self._follow(entry.path)
+                    if entry.path not in self._dirs:
+                        self._add_dir(entry.path)
+                elif CMD_INFO_PATTERN.fullmatch(entry.name) or SSH_RESULT_PATTERN.fullmatch(entry.name):
+                    present.add(entry.path)
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    state = (st.st_size, st.st_mtime_ns)
+                    pending = self._pending.get(entry.path)
+                    if self._known.get(entry.path) != state and (pending is None or pending[:2] != state):
+                        self._pending[entry.path] = state + (now,)
+        if brain_collect:
+            self._follow(path)
+        # 已删除的文件不再跟踪
+        for removed in self._files.get(path, set()) - present:
+            self._known.pop(removed, None)
+            self._pending.pop(removed, None)
+        self._files[path] = present
+
+    def _follow(self, brain_collect):
+        """确定BrainCollect下跟踪的result_目录，变化时丢弃原来的"""
+        chosen = choose_result_dir(brain_collect, self.snapshot)
+        chosen = str(chosen) if chosen else None
+        if brain_collect not in self._brain:
+            self._brain[brain_collect] = None
+            if brain_collect not in self._dirs:
+                self._add_dir(brain_collect)
+        previous = self._brain[brain_collect]
+        if chosen == previous:
+            return
+        if previous is not None:
+            self._forget_tree(previous)
+            self._snapshot_changed = True
+            if self.log is not None:
+                self.log(f"发现新的采集: {os.path.basename(chosen)}")
+        self._brain[brain_collect] = chosen
+        if chosen is not None:
+            self._add_dir(chosen)
+
+    def poll(self):
+        """检查一次变化，返回WatchChanges；没有写完的新文件且采集未变时返回None"""
+        start = time.perf_counter()
+        now = time.monotonic()
+        wall = time.time()
+        dirty, self._dirty = self._dirty, set()
+        scanned = 0
+        checked = set()
+        # 扫描时登记的新目录在同一次轮询中接着检查，每个目录最多扫描一次
+        while True:
+            batch = [path for path in self._dirs if path not in checked]
+            if not batch:
+                break
+            for path in batch:
+                checked.add(path)
+                mtime = self._dirs.get(path, False)
+                if mtime is False:
+                    continue   # 所在的result_目录已不再跟踪
+                try:
+                    st = os.stat(path)
+                    # mtime精度较低的文件系统上，刚变化不久的目录每次都重新扫描
+                    if mtime != st.st_mtime_ns or path in dirty or wall - st.st_mtime < self.settle_seconds:
+                        self._scan(path, st.st_mtime_ns, now)
+                        scanned += 1
+                except FileNotFoundError:
+                    self._forget_tree(path)
+                except OSError as e:
+                    if self.log is not None:
+                        self.log(f"读取目录 {path} 时出错: {e}")
+        cmd_info = []
+        results = []
+        for path, (size, mtime, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            # 文件服务器与本机时钟不一致时，以本机观察到的保持不变的时长为准
+            if wall - st.st_mtime >= self.settle_seconds or now - since >= self.settle_seconds:
+                del self._pending[path]
+                self._known[path] = (size, mtime)
+                target = cmd_info if CMD_INFO_PATTERN.fullmatch(os.path.basename(path)) else results
+                target.append(as_path(path))
+        snapshot_changed, self._snapshot_changed = self._snapshot_changed, False
+        if self.stats is not None:
+            self.stats.add("watch_poll", time.perf_counter() - start, dirs=scanned, pending=len(self._pending),
+                           ready=len(cmd_info) + len(results))
+        if not cmd_info and not results and not snapshot_changed:
+            return None
+        return WatchChanges(sorted(cmd_info, key=str), sorted(results, key=str), snapshot_changed)
+
+    def next_timeout(self):
+        """距下一次需要检查的秒数：轮询间隔，或最早的待定文件可能写完的时间"""
+        timeout = self.poll_seconds
+        now = time.monotonic()
+        for size, mtime, since in self._pending.values():
+            timeout = min(timeout, max(since + self.settle_seconds - now, 0.0))
+        return timeout
+
+    def wait(self, timeout=None, stopped=None):
+        """等待到下一次检查；使用inotify时目录中有事件即提前返回"""
+        deadline = time.monotonic() + (self.next_timeout() if timeout is None else timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stopped is not None and stopped()):
+                return
+            step = min(remaining, CANCEL_POLL_SECONDS)
+            if self._inotify is None:
+                time.sleep(step)
+                continue
+            dirs = self._inotify.wait(step)
+            if dirs:
+                self._dirty |= dirs
+                return
+
+    def run(self, on_changes, stopped=None):
+        """持续监视，每次有变化时调用 on_changes(WatchChanges)，直到stopped()为True"""
+        while stopped is None or not stopped():
+            changes = self.poll()
+            if changes is not None:
+                on_changes(changes)
+            self.wait(stopped=stopped)
+
+
+class LiveUpdate(namedtuple("LiveUpdate", "added updated results reset")):
+    """一次变化的处理结果：新登记、被更新的设备，结果文件有变化的设备，以及是否换成了新的一次采集"""
+    __slots__ = ()
+
+    @property
+    def devices(self):
+        """需要重新转换或刷新的设备（去重，保持顺序）"""
+        seen = set()
+        devices = []
+        for device in self.added + self.updated + self.results:
+            if id(device) not in seen:
+                seen.add(id(device))
+                devices.append(device)
+        return devices
+
+
+class LiveCollection:
+    """监视模式下的设备登记表：按WatchChanges增量登记设备，找出需要处理的设备
+
+    registry 可传入已解析的登记表（例如界面中已显示设备的副本），已登记的设备不会重复产出。
+    index为CollectionIndex时复用索引（按mtime/size判断cmd_info文件是否需要重新解析）。
+    """
+
+    def __init__(self, registry=None, index=None, log=None, stats=None):
+        self.registry = registry if registry is not None else DeviceRegistry()
+        self.index = index
+        self.log = log
+        self.stats = stats
+        self.resolver = ResultResolver(stats)
+
+    def apply(self, changes):
+        """登记一次变化，返回LiveUpdate；跟踪的采集换成新的一次时先清空登记表"""
+        if changes.snapshot_changed:
+            self.registry.clear()
+            self.resolver.clear()
+        added = []
+        updated = []
+        for p in changes.cmd_info:
+            start = time.perf_counter()
+            try:
+                records = self.index.devices(p) if self.index is not None else read_cmd_info(p)
+            except Exception as e:
+                if self.log is not None:
+                    self.log(f"解析文件 {p.name} 时出错，文件再次变化后重试: {e}")
+                continue
+            if self.stats is not None:
+                self.stats.add("parse_cmd_info", time.perf_counter() - start, devices=len(records))
+            for record in records:
+                existing = self.registry.get(*record.key)
+                device, status = self.registry.add(record)
+                if status == DeviceRegistry.DUPLICATE and existing.path == record.path and \
+                        existing.state != record.state:
+                    # 同一个cmd_info文件重写后设备的采集状态变了
+                    existing.state = record.state
+                    status = DeviceRegistry.UPDATED
+                if status == DeviceRegistry.ADDED:
+                    added.append(device)
+                elif status == DeviceRegistry.UPDATED:
+                    updated.append(device)
+        results = []
+        seen = set()
+        for p in changes.results:
+            network = p.parent
+            self.resolver.forget(network)
+            ip = SSH_RESULT_PATTERN.fullmatch(p.name).group(1)
+            result_dir = str(network.parent.parent)
+            for device in self.registry.by_ip(ip):
+                if str(as_path(device.path).parent) == result_dir and id(device) not in seen:
+                    seen.add(id(device))
+                    results.append(device)
+        return LiveUpdate(added, updated, results, changes.snapshot_changed)